@@ -0,0 +1,243 @@
+"""
+Benchmark das transformações: padrão antigo (astype(str) + máscaras, to_datetime
+sem formato, atribuição em fatias, to_dict('records') no load) vs.
+handlers.transforms + to_rows.
+
+Com --workers, mede também a transformação de movimentacao_estoque em um dia de
+parallel_transform_min_rows linhas: serial vs. pool reaproveitado (como no
+run_etl, já aquecido) vs. pool criado só para a chamada.
+
+Uso:
+    python -m benchmarks.transforms_benchmark [--rows 1000000] [--repeat 3] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers import transforms  # noqa: E402
+from handlers.parallel import parallel_transform, transform_pool  # noqa: E402
+from handlers.query_loader import get_etl_config  # noqa: E402
+from services.movimentacao_estoque import UNIQUE_KEY_COLUMNS, transform_movimentacao  # noqa: E402
+
+
+def build_vendas_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    base = datetime(2024, 1, 1, 8)
+    horas = [base + timedelta(seconds=int(s)) for s in rng.integers(0, 86400 * 30, rows)]
+    return pd.DataFrame({
+        'id': np.arange(rows),
+        'data': [h.date() for h in horas],
+        'filial': rng.integers(1, 4, rows),
+        'pdv': rng.integers(1, 10, rows),
+        'usuario': rng.choice(['ANA', 'JOAO', None], rows),
+        'valorbruto': rng.random(rows) * 500,
+        'valorliquido': rng.random(rows) * 500,
+        'cancelado': rng.integers(0, 2, rows),
+        'serienfce': rng.integers(1, 5, rows),
+        'numeronfce': rng.integers(1, 999999, rows),
+        'finalizador': rng.choice(['DIN', 'CRE', 'DEB', 'PIX'], rows),
+        'troco': rng.random(rows) * 10,
+        'valortotal': rng.random(rows) * 500,
+        'descontoitem': rng.random(rows),
+        'acrescimoitem': rng.random(rows),
+        'horainicial': horas,
+        'horafinal': horas,
+    })
+
+
+def build_estoque_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    base = datetime(2024, 1, 1, 8)
+    codigos = np.array([f"{c:06d}" for c in range(5000)], dtype=object)
+    return pd.DataFrame({
+        'local_estoque': 'Geral',
+        'filial': 1,
+        'documento': rng.choice(np.array(['1/123', '2/456', None], dtype=object), rows),
+        'codigo': rng.choice(codigos, rows),
+        'nome': rng.choice(np.array(['ARROZ 5KG', 'FEIJAO 1KG', None], dtype=object), rows),
+        'datahora': [base + timedelta(seconds=int(s)) for s in rng.integers(0, 86400, rows)],
+        'currenttimemillis': rng.integers(1_700_000_000_000, 1_800_000_000_000, rows),
+        'tipodocumento': rng.integers(1, 4, rows),
+        'qtd': rng.random(rows) * 10,
+        'tipo_movimentacao': rng.choice(np.array(['E', 'S'], dtype=object), rows),
+        'valortotal': rng.random(rows) * 100,
+        'precoultimacompra': rng.random(rows) * 100,
+        'custoaquisicao': rng.random(rows) * 100,
+        'customedio': rng.random(rows) * 100,
+        'icms': rng.random(rows),
+        'icms_st': rng.random(rows),
+        'ippt': rng.choice(np.array(['T', 'F', None], dtype=object), rows),
+        'pis_cofins': rng.random(rows),
+        'ipi': rng.random(rows),
+        'outros_impostos': rng.random(rows),
+        'comissao': rng.random(rows),
+        'cfop': rng.choice(np.array(['5102', '1102', None], dtype=object), rows),
+        'un': rng.choice(np.array(['UN', 'KG', None], dtype=object), rows),
+    })
+
+
+VENDAS_COLUMNS = [
+    'pdv', 'filial', 'usuario', 'vendedor', 'emissao', 'hora', 'documento', 'ccf',
+    'v_bruto', 'desconto', 'acrescimo', 'v_venda', 'devolucao_troca', 'v_liquido', 'canc', 'cliente',
+    'cnpj_cpf', 'finalizador', 'valor_finalizador', 'hora_final', 'troco'
+]
+
+VENDAS_MAPPING = {
+    'valorbruto': 'v_bruto', 'valorliquido': 'v_liquido', 'cancelado': 'canc',
+    'valortotal': 'valor_finalizador', 'descontoitem': 'desconto', 'acrescimoitem': 'acrescimo',
+    'data': 'emissao', 'horainicial': 'hora', 'horafinal': 'hora_final',
+}
+
+VENDAS_NUMERIC = ['v_bruto', 'desconto', 'acrescimo', 'v_venda', 'v_liquido', 'valor_finalizador', 'troco']
+
+ESTOQUE_NUMERIC = [
+    'qtd', 'valortotal', 'precoultimacompra', 'custoaquisicao', 'customedio', 'icms',
+    'icms_st', 'ippt', 'pis_cofins', 'ipi', 'outros_impostos', 'comissao', 'currenttimemillis',
+]
+
+ESTOQUE_TEXT = ['local_estoque', 'documento', 'codigo', 'un', 'tipo_movimentacao', 'nome', 'cfop']
+
+ESTOQUE_COLUMNS = [
+    'local_estoque', 'filial', 'documento', 'codigo', 'nome', 'datahora', 'currenttimemillis',
+    'tipodocumento', 'qtd', 'tipo_movimentacao', 'valortotal', 'precoultimacompra', 'custoaquisicao',
+    'customedio', 'icms', 'icms_st', 'ippt', 'pis_cofins', 'ipi', 'outros_impostos', 'comissao', 'cfop', 'un',
+]
+
+
+def legacy_vendas(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.rename(columns=VENDAS_MAPPING)
+    df['canc'] = df['canc'].map({0: 'Não', 1: 'Sim'})
+    df['documento'] = df['serienfce'].astype(str) + '/' + df['numeronfce'].astype(str)
+    for col in ['vendedor', 'ccf', 'cliente', 'cnpj_cpf', 'devolucao_troca']:
+        df[col] = None
+    df['v_venda'] = df['v_bruto']
+    for col in VENDAS_NUMERIC:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['emissao'] = pd.to_datetime(df['emissao'], errors='coerce').dt.date
+    for col in ['hora', 'hora_final']:
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df[VENDAS_COLUMNS]
+
+
+def vectorized_vendas(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.rename(columns=VENDAS_MAPPING)
+    transforms.map_values(df, 'canc', {0: 'Não', 1: 'Sim'})
+    transforms.concat_columns(df, 'documento', ['serienfce', 'numeronfce'], sep='/', na_rep='None')
+    for col in ['vendedor', 'ccf', 'cliente', 'cnpj_cpf', 'devolucao_troca']:
+        df[col] = None
+    df['v_venda'] = df['v_bruto']
+    transforms.to_numeric(df, VENDAS_NUMERIC)
+    transforms.parse_datetimes(df, ['emissao'], as_date=True)
+    transforms.parse_datetimes(df, ['hora', 'hora_final'])
+    return transforms.project_columns(df, VENDAS_COLUMNS)
+
+
+def legacy_estoque(df: pd.DataFrame) -> pd.DataFrame:
+    for col in ['filial', 'tipodocumento']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+    for col in ESTOQUE_NUMERIC:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['datahora'] = pd.to_datetime(df['datahora'], errors='coerce')
+    for col in ESTOQUE_TEXT:
+        df[col] = df[col].astype(str)
+        df.loc[df[col] == 'None', col] = None
+        df.loc[df[col] == 'nan', col] = None
+    result = df[ESTOQUE_COLUMNS]
+    for col in result.columns:
+        if str(result[col].dtype).startswith('datetime64'):
+            result[col] = result[col].replace({pd.NaT: None})
+    return result
+
+
+def vectorized_estoque(df: pd.DataFrame) -> pd.DataFrame:
+    transforms.to_numeric(df, ['filial', 'tipodocumento'], dtype='Int64')
+    transforms.to_numeric(df, ESTOQUE_NUMERIC)
+    transforms.parse_datetimes(df, ['datahora'])
+    transforms.normalize_text(df, ESTOQUE_TEXT)
+    return transforms.project_columns(df, ESTOQUE_COLUMNS)
+
+
+def legacy_rows(df: pd.DataFrame) -> list:
+    records = df.to_dict('records')
+    columns = list(records[0].keys())
+    return [tuple(record[col] for col in columns) for record in records]
+
+
+def vectorized_rows(df: pd.DataFrame) -> list:
+    return transforms.to_rows(df)[1]
+
+
+def measure(func, frame: pd.DataFrame, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        df = frame.copy()
+        start = time.perf_counter()
+        func(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, rows: int, legacy_time: float, vectorized_time: float) -> None:
+    print(
+        f"{name:<28}{rows / legacy_time:>16,.0f}{rows / vectorized_time:>20,.0f}"
+        f"{legacy_time / vectorized_time:>9.1f}x"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Também mede a transformação paralela de movimentacao_estoque com N processos')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    cases = [
+        ('vendas_daily', build_vendas_frame, legacy_vendas, vectorized_vendas),
+        ('movimentacao_estoque', build_estoque_frame, legacy_estoque, vectorized_estoque),
+    ]
+
+    print(f"{'transform':<28}{'legacy rows/s':>16}{'vectorized rows/s':>20}{'speedup':>10}")
+    for name, build, legacy, vectorized in cases:
+        frame = build(args.rows)
+        legacy_time = measure(legacy, frame, args.repeat)
+        vectorized_time = measure(vectorized, frame, args.repeat)
+        report(name, args.rows, legacy_time, vectorized_time)
+
+        # Transform + conversão para tuplas do psycopg2 (o que o load realmente recebe)
+        legacy_time = measure(lambda df: legacy_rows(legacy(df)), frame, args.repeat)
+        vectorized_time = measure(lambda df: vectorized_rows(vectorized(df)), frame, args.repeat)
+        report(f"{name} +rows", args.rows, legacy_time, vectorized_time)
+
+    if args.workers > 1:
+        # Tamanho a partir do qual o ETL usa o caminho paralelo
+        rows = get_etl_config('movimentacao_estoque').get('parallel_transform_min_rows', 200000)
+        frame = build_estoque_frame(rows)
+        serial_time = measure(transform_movimentacao, frame, args.repeat)
+        print(f"\n{'estoque, dia de ' + format(rows, ',') + ' linhas':<28}{'serial rows/s':>16}{'parallel rows/s':>20}{'speedup':>10}")
+        with transform_pool(args.workers) as executor:
+            # Aquece o pool: os processos sobem uma vez por execução do ETL
+            parallel_transform(frame.copy(), transform_movimentacao, UNIQUE_KEY_COLUMNS, args.workers, executor)
+            pooled_time = measure(
+                lambda df: parallel_transform(df, transform_movimentacao, UNIQUE_KEY_COLUMNS, args.workers, executor),
+                frame, args.repeat
+            )
+        report(f"pool reaproveitado x{args.workers}", rows, serial_time, pooled_time)
+        cold_time = measure(
+            lambda df: parallel_transform(df, transform_movimentacao, UNIQUE_KEY_COLUMNS, args.workers),
+            frame, args.repeat
+        )
+        report(f"pool por chamada x{args.workers}", rows, serial_time, cold_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import json
+import math
+from decimal import Decimal
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from .log_handler import setup_logger
+
+
+def json_value(value: Any) -> Any:
+    """
+    JSON-safe scalar (NaN/NA -> None, numpy scalars and Decimal -> Python numbers).
+    """
+    if value is None:
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    try:
+        if value != value:  # pd.NA/NaT
+            return None
+    except TypeError:
+        return None
+    return value
+
+
+class RedisChangeFeed:
+    """
+    Publishes change events to a Redis stream (XADD), in pipelined batches,
+    trimming the stream to roughly 'maxlen' entries.
+
+    Each event is flat: 'op' (insert/update/delete), the key fields given by the
+    producer and 'changed', 'old' and 'new' as JSON strings.
+    """
+
+    def __init__(self, redis_config: Dict, stream: str, maxlen: Optional[int] = 100000,
+                 batch_size: int = 500):
+        # Import tardio: o redis só é necessário quando o feed está habilitado
+        import redis
+
+        self.client = redis.Redis(**redis_config)
+        self.stream = stream
+        self.maxlen = maxlen
+        self.batch_size = batch_size
+        self.logger = setup_logger("change_feed", log_file="logs/change_feed.log")
+
+    @staticmethod
+    def encode(event: Dict) -> Dict[str, str]:
+        fields = {}
+        for key, value in event.items():
+            if isinstance(value, (dict, list)):
+                fields[key] = json.dumps(value, default=str, ensure_ascii=False)
+            else:
+                value = json_value(value)
+                fields[key] = '' if value is None else str(value)
+        return fields
+
+    def publish(self, events: List[Dict]) -> int:
+        """
+        Append events to the stream.
+
+        Returns:
+            Number of events published
+        """
+        published = 0
+        emitted_at = datetime.now().isoformat(timespec='seconds')
+        for start in range(0, len(events), self.batch_size):
+            pipe = self.client.pipeline(transaction=False)
+            for event in events[start:start + self.batch_size]:
+                pipe.xadd(
+                    self.stream,
+                    self.encode({**event, 'ts': emitted_at}),
+                    maxlen=self.maxlen,
+                    approximate=True
+                )
+            published += len(pipe.execute())
+        self.logger.info(f"{published} eventos publicados em {self.stream}")
+        return published
@@ -0,0 +1,31 @@
+from typing import Set
+
+
+def parse_cron_field(field: str, low: int, high: int) -> Set[int]:
+    """
+    Values of one cron field: '*', 'n', 'a-b', '*/n', 'a-b/n' and comma lists
+    """
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-', 1))
+        else:
+            start = end = int(part)
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field '{field}' (allowed {low}-{high})")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def cron_weekdays(field: str) -> Set[int]:
+    """
+    Days of a cron weekday field as datetime.weekday() values (Monday = 0)
+    """
+    # cron: domingo = 0 ou 7; datetime.weekday(): segunda = 0
+    return {(day - 1) % 7 for day in parse_cron_field(field, 0, 7)}
@@ -0,0 +1,183 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from .cron import cron_weekdays, parse_cron_field
+from .scheduler import Job
+from .log_handler import setup_logger
+
+
+class CronSchedule:
+    """
+    Standard 5-field cron expression (minute hour day month weekday), local time.
+    Weekday 0 or 7 is Sunday. As in cron, when both day and weekday are
+    restricted, a match on either one is enough.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: '{expression}'")
+        self.expression = expression
+        self.minutes = parse_cron_field(fields[0], 0, 59)
+        self.hours = parse_cron_field(fields[1], 0, 23)
+        self.days = parse_cron_field(fields[2], 1, 31)
+        self.months = parse_cron_field(fields[3], 1, 12)
+        self.weekdays = cron_weekdays(fields[4])
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_run(self, after: datetime) -> datetime:
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 4)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: '{self.expression}'")
+
+    def __repr__(self):
+        return f"cron '{self.expression}'"
+
+
+class IntervalSchedule:
+    """
+    Fixed interval between runs, counted from the previous start
+    """
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        self.interval = timedelta(seconds=seconds)
+
+    def next_run(self, after: datetime) -> datetime:
+        return after + self.interval
+
+    def __repr__(self):
+        return f"every {self.interval}"
+
+
+def schedule_from_config(settings: Dict):
+    """
+    Schedule of a daemon job: {"cron": "0 * * * *"}, {"interval_minutes": 10}
+    or {"interval_seconds": 30}
+    """
+    if settings.get('cron'):
+        return CronSchedule(settings['cron'])
+    if settings.get('interval_minutes'):
+        return IntervalSchedule(settings['interval_minutes'] * 60)
+    if settings.get('interval_seconds'):
+        return IntervalSchedule(settings['interval_seconds'])
+    raise ValueError(f"Daemon job needs 'cron', 'interval_minutes' or 'interval_seconds': {settings}")
+
+
+class JobDaemon:
+    """
+    Resident process that runs each job on its own schedule.
+
+    A job never overlaps itself: when it is due while the previous run is
+    still going, that occurrence is skipped. Concurrent jobs share the
+    per-resource limits of the JobScheduler (source db, target db, disk).
+    Interval jobs run once at start-up; cron jobs wait for their first match.
+    An occurrence that defer(job_name) holds back (heavy jobs in business
+    hours) is moved to when the wait ends.
+    """
+
+    def __init__(self, jobs: List[Job], schedules: Dict[str, object], max_workers: int = 4,
+                 resource_limits: Optional[Dict[str, int]] = None,
+                 defer: Optional[Callable[[str], float]] = None):
+        self.jobs = {job.name: job for job in jobs}
+        self.schedules = schedules
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.resource_slots = {
+            resource: threading.BoundedSemaphore(limit)
+            for resource, limit in (resource_limits or {}).items()
+        }
+        self.defer = defer
+        self.running: Dict[str, Future] = {}
+        self.stats = {name: {'runs': 0, 'failures': 0, 'skipped': 0, 'last_duration': None}
+                      for name in self.jobs}
+        self.stop_event = threading.Event()
+        self.logger = setup_logger("daemon", log_file="logs/daemon.log")
+
+    def _run_job(self, job: Job) -> None:
+        # Ordem fixa de aquisição: evita deadlock entre jobs de classes diferentes
+        slots = [self.resource_slots[r] for r in sorted(job.resources) if r in self.resource_slots]
+        for slot in slots:
+            slot.acquire()
+        started = time.perf_counter()
+        try:
+            self.logger.info(f"Job {job.name} iniciado")
+            job.func()
+            self.stats[job.name]['runs'] += 1
+        except Exception as e:
+            self.stats[job.name]['failures'] += 1
+            self.logger.error(f"Job {job.name} falhou: {str(e)}")
+        finally:
+            for slot in reversed(slots):
+                slot.release()
+            duration = round(time.perf_counter() - started, 2)
+            self.stats[job.name]['last_duration'] = duration
+            self.logger.info(f"Job {job.name} concluído em {duration}s")
+
+    def _submit(self, name: str) -> None:
+        previous = self.running.get(name)
+        if previous is not None and not previous.done():
+            self.stats[name]['skipped'] += 1
+            self.logger.warning(f"Job {name} ainda em execução - execução agendada ignorada")
+            return
+        self.running[name] = self.executor.submit(self._run_job, self.jobs[name])
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def run(self) -> Dict[str, Dict]:
+        """
+        Run until stop() is called (or Ctrl+C), then wait for running jobs.
+
+        Returns:
+            Per-job counters: runs, failures, skipped occurrences, last duration
+        """
+        now = datetime.now()
+        next_runs = {
+            name: now if isinstance(self.schedules[name], IntervalSchedule) else self.schedules[name].next_run(now)
+            for name in self.jobs
+        }
+        for name, when in next_runs.items():
+            self.logger.info(f"Job {name}: {self.schedules[name]!r}, próxima execução {when:%Y-%m-%d %H:%M:%S}")
+
+        try:
+            while not self.stop_event.is_set():
+                now = datetime.now()
+                for name, when in next_runs.items():
+                    if when <= now:
+                        delay = self.defer(name) if self.defer else 0
+                        if delay > 0:
+                            next_runs[name] = now + timedelta(seconds=delay)
+                            self.logger.info(f"Job {name} adiado para {next_runs[name]:%Y-%m-%d %H:%M} (horário comercial)")
+                            continue
+                        self._submit(name)
+                        next_runs[name] = self.schedules[name].next_run(max(when, now))
+                wait_seconds = (min(next_runs.values()) - datetime.now()).total_seconds()
+                self.stop_event.wait(max(0.0, min(wait_seconds, 60.0)))
+        except KeyboardInterrupt:
+            self.logger.info("Interrupção recebida, aguardando jobs em execução")
+        finally:
+            self.executor.shutdown(wait=True)
+            self.logger.info(f"Daemon finalizado: {self.stats}")
+        return self.stats
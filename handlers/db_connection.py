@@ -1,14 +1,74 @@
 import os
 import json
+import uuid
+import time
+import threading
 import psycopg2
 from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 import pandas as pd
-from typing import Dict, List, Union, Optional
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple, Union, Optional
 from tqdm import tqdm
 from .log_handler import setup_logger
+from .transforms import to_rows
+from .governor import get_governor
 
 class DatabaseConnection:
-    def __init__(self, connection_config: Union[str, Dict]):
+    # Pools compartilhados por string de conexão (modo daemon); None = conexão nova por operação
+    _pool_size: Optional[int] = None
+    _pools: Dict[str, ThreadedConnectionPool] = {}
+    # Um slot por conexão do pool: getconn() com o pool cheio falha em vez de esperar
+    _pool_slots: Dict[str, threading.BoundedSemaphore] = {}
+    _pool_timeout = 300
+    _pools_lock = threading.Lock()
+
+    @classmethod
+    def enable_pooling(cls, max_connections: int = 4, timeout: int = 300) -> None:
+        """
+        Keep connections open between operations, in one pool per database.
+        For long-running processes (daemon); every instance created afterwards
+        borrows from the pool in connect() and returns in disconnect().
+        With every connection borrowed, connect() waits up to timeout seconds
+        for one to be returned.
+        """
+        cls._pool_size = max_connections
+        cls._pool_timeout = timeout
+
+    @classmethod
+    def close_pools(cls) -> None:
+        with cls._pools_lock:
+            for pool in cls._pools.values():
+                pool.closeall()
+            cls._pools.clear()
+            cls._pool_slots.clear()
+        cls._pool_size = None
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        key = self._get_connection_string()
+        with self._pools_lock:
+            if key not in self._pools:
+                self._pools[key] = ThreadedConnectionPool(0, self._pool_size, key)
+                self._pool_slots[key] = threading.BoundedSemaphore(self._pool_size)
+            return self._pools[key]
+
+    def _acquire_slot(self) -> None:
+        self._get_pool()
+        slots = self._pool_slots[self._get_connection_string()]
+        if not slots.acquire(timeout=self._pool_timeout):
+            raise PoolError(
+                f"Nenhuma conexão livre no pool de {self.config['host']}/{self.config['dbname']} "
+                f"após {self._pool_timeout}s (pool_size={self._pool_size})"
+            )
+        self._slot = slots
+
+    def __init__(self, connection_config: Union[str, Dict], query_class: Optional[str] = None):
+        """
+        Args:
+            connection_config: Connection fields (dict or JSON string)
+            query_class: For source (Uniplus) connections: 'light' or 'heavy'.
+                get_data then goes through the extraction governor, when enabled
+        """
         self.logger = setup_logger("database", log_file="logs/database.log")
         
         if isinstance(connection_config, str):
@@ -21,7 +81,10 @@ class DatabaseConnection:
             self.config = connection_config
             
         self.connection = None
+        self._slot: Optional[threading.BoundedSemaphore] = None
         self._validate_config()
+        self.query_class = query_class
+        self.governor = get_governor() if query_class else None
         
     def _validate_config(self):
         required_fields = ['host', 'port', 'dbname', 'user', 'password']
@@ -44,13 +107,40 @@ class DatabaseConnection:
     def connect(self) -> None:
         try:
             if not self.connection or self.connection.closed:
+                if self._pool_size:
+                    # Espera uma conexão ser devolvida quando todas estão em uso
+                    self._acquire_slot()
+                    try:
+                        self.connection = self._get_pool().getconn()
+                        if self.connection.closed:
+                            # Conexão derrubada pelo servidor enquanto estava no pool
+                            self._get_pool().putconn(self.connection, close=True)
+                            self.connection = self._get_pool().getconn()
+                    except Exception:
+                        self.connection = None
+                        self._release_slot()
+                        raise
+                    return
                 self.connection = psycopg2.connect(self._get_connection_string())
                 self.logger.info("Database connection established successfully")
         except Exception as e:
             self.logger.error(f"Failed to connect to database: {e}")
             raise
             
+    def _release_slot(self) -> None:
+        if self._slot is not None:
+            self._slot.release()
+            self._slot = None
+
     def disconnect(self) -> None:
+        if self._pool_size and self.connection is not None:
+            # Devolve ao pool (que faz rollback de transação aberta); conexão quebrada é descartada
+            try:
+                self._get_pool().putconn(self.connection, close=bool(self.connection.closed))
+            finally:
+                self.connection = None
+                self._release_slot()
+            return
         if self.connection and not self.connection.closed:
             self.connection.close()
             self.logger.info("Database connection closed")
@@ -73,6 +163,8 @@ class DatabaseConnection:
         Returns:
             DataFrame containing query results
         """
+        if self.governor is not None:
+            return self._get_data_governed(query, params)
         try:
             self.connect()
             with self.connection.cursor() as cursor:
@@ -86,6 +178,160 @@ class DatabaseConnection:
         finally:
             self.disconnect()
             
+    def _get_data_governed(self, query: str, params: Optional[tuple] = None) -> pd.DataFrame:
+        """
+        get_data paced by the extraction governor: waits for a query slot on
+        this source, sets statement_timeout/work_mem of the query class for the
+        transaction and fetches from a server-side cursor in chunks, sleeping
+        between them to respect the rows-per-second limit
+        """
+        source = f"{self.config['host']}:{self.config['port']}/{self.config['dbname']}"
+        with self.governor.slot(source):
+            try:
+                self.connect()
+                settings = self.governor.session_settings(self.query_class)
+                with self.connection.cursor() as cursor:
+                    # SET local à transação; o tempo de ida e volta mede a carga da origem
+                    started = time.perf_counter()
+                    if settings:
+                        cursor.execute(
+                            "SELECT " + ", ".join(f"set_config('{key}', %s, true)" for key in settings),
+                            list(settings.values())
+                        )
+                    else:
+                        cursor.execute("SELECT 1")
+                    cursor.fetchall()
+                    self.governor.observe_latency(source, time.perf_counter() - started)
+                
+                data = []
+                with self.connection.cursor(name=f"governed_{uuid.uuid4().hex}") as cursor:
+                    # DECLARE CURSOR não aceita o ';' final dos arquivos .sql
+                    cursor.execute(query.rstrip().rstrip(';'), params)
+                    while True:
+                        chunk = cursor.fetchmany(self.governor.fetch_rows())
+                        if not chunk:
+                            break
+                        data.extend(chunk)
+                        self.governor.throttle(source, len(chunk))
+                    columns = [desc[0] for desc in cursor.description]
+                # Só leitura: encerra a transação (e os SET locais)
+                self.connection.rollback()
+                return pd.DataFrame(data, columns=columns)
+            except Exception as e:
+                self.logger.error(f"Error executing query: {e}")
+                raise
+            finally:
+                self.disconnect()
+            
+    def stream(self, query: str, params: Optional[Union[tuple, Dict]] = None,
+               itersize: int = 100) -> Iterator[tuple]:
+        """
+        Execute a query on a server-side (named) cursor and yield rows as they
+        arrive, fetching itersize rows per round trip. Keeps memory bounded for
+        large results such as XML blobs.
+        
+        Args:
+            query: SQL query to execute
+            params: Optional parameters for the query
+            itersize: Rows fetched from the server per round trip
+            
+        Yields:
+            Row tuples, in the query's column order
+        """
+        try:
+            self.connect()
+            with self.connection.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield row
+            # Só leitura: encerra a transação aberta pelo cursor nomeado
+            self.connection.rollback()
+        except Exception as e:
+            self.logger.error(f"Error streaming query: {e}")
+            raise
+        finally:
+            self.disconnect()
+            
+    def estimate_rows(self, query: str, params: Optional[Union[tuple, Dict]] = None) -> int:
+        """
+        Planner estimate of the rows a query returns (EXPLAIN, without running it).
+        
+        Args:
+            query: SQL query to estimate
+            params: Optional parameters for the query
+            
+        Returns:
+            Estimated number of rows
+        """
+        try:
+            self.connect()
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {query.rstrip().rstrip(';')}", params)
+                plan = cursor.fetchone()[0]
+            self.connection.rollback()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        except Exception as e:
+            self.logger.error(f"Error estimating query rows: {e}")
+            raise
+        finally:
+            self.disconnect()
+            
+    def execute(self, query: str, params: Optional[Union[tuple, Dict]] = None) -> int:
+        """
+        Execute a single statement (DDL/DML) and commit.
+        
+        Args:
+            query: SQL statement to execute
+            params: Optional parameters for the statement
+            
+        Returns:
+            Number of rows affected (cursor.rowcount)
+        """
+        with self.transaction() as cursor:
+            cursor.execute(query, params)
+            return cursor.rowcount
+            
+    @contextmanager
+    def transaction(self):
+        """
+        Open a connection and yield a cursor inside a single transaction.
+        Commits when the block succeeds, rolls back on error and always disconnects.
+        
+        Example:
+            with connection.transaction() as cursor:
+                cursor.execute("DELETE ...")
+                cursor.execute("INSERT ...")
+        """
+        try:
+            self.connect()
+            with self.connection.cursor() as cursor:
+                yield cursor
+            self.connection.commit()
+        except Exception as e:
+            self.logger.error(f"Error in transaction: {e}")
+            if self.connection:
+                self.connection.rollback()
+            raise
+        finally:
+            self.disconnect()
+            
+    @staticmethod
+    def _prepare_rows(data: Union[pd.DataFrame, List[Dict]]) -> Tuple[List[str], List[tuple]]:
+        """
+        Normalize the input of insert/upsert into column names and row tuples.
+        DataFrames are converted column-wise (nulls -> None) by to_rows.
+        """
+        if isinstance(data, pd.DataFrame):
+            return to_rows(data)
+        if not data:
+            return [], []
+        # Get column names from first record
+        columns = list(data[0].keys())
+        return columns, [tuple(record[col] for col in columns) for record in data]
+
     def insert_batch(self, table_name: str, data: Union[pd.DataFrame, List[Dict]], 
                     schema: str = 'public', batch_size: int = 1000) -> None:
         """
@@ -97,20 +343,15 @@ class DatabaseConnection:
             schema: Database schema name
             batch_size: Number of records per batch
         """
-        if isinstance(data, pd.DataFrame):
-            data = data.to_dict('records')
+        columns, values = self._prepare_rows(data)
             
-        if not data:
+        if not values:
             self.logger.warning("No data provided for batch insert")
             return
             
         try:
             self.connect()
             with self.connection.cursor() as cursor:
-                # Get column names from first record
-                columns = list(data[0].keys())
-                values = [tuple(record[col] for col in columns) for record in data]
-                
                 # Prepare the query
                 query = f"""
                     INSERT INTO {schema}.{table_name} 
@@ -127,7 +368,7 @@ class DatabaseConnection:
                         pbar.update(1)
                     
                 self.connection.commit()
-                self.logger.info(f"Successfully inserted {len(data)} records into {schema}.{table_name}")
+                self.logger.info(f"Successfully inserted {len(values)} records into {schema}.{table_name}")
                 
         except Exception as e:
             self.logger.error(f"Error in batch insert: {e}")
@@ -137,6 +378,42 @@ class DatabaseConnection:
         finally:
             self.disconnect()
             
+    def insert_rows(self, cursor, table_name: str, data: Union[pd.DataFrame, List[Dict], List[tuple]], 
+                    schema: str = 'public', batch_size: int = 1000,
+                    columns: Optional[List[str]] = None) -> int:
+        """
+        Insert rows using an existing cursor, without committing.
+        Use inside transaction() to replace rows atomically (DELETE + insert).
+        
+        Args:
+            cursor: Cursor of an open transaction
+            table_name: Name of the target table
+            data: DataFrame, list of dictionaries, or row tuples when columns is given
+            schema: Database schema name
+            batch_size: Number of records per batch
+            columns: Column names of tuple rows (sent as they are)
+            
+        Returns:
+            Number of rows sent
+        """
+        if columns is not None:
+            values = list(data)
+        else:
+            columns, values = self._prepare_rows(data)
+        if not values:
+            return 0
+            
+        query = f"""
+            INSERT INTO {schema}.{table_name} 
+            ({','.join(columns)}) 
+            VALUES %s
+        """
+        for i in range(0, len(values), batch_size):
+            execute_values(cursor, query, values[i:i + batch_size], page_size=batch_size)
+            
+        self.logger.info(f"Successfully inserted {len(values)} records into {schema}.{table_name}")
+        return len(values)
+            
     def upsert(self, table_name: str, data: Union[pd.DataFrame, Dict], 
                unique_columns: List[str], schema: str = 'public', batch_size: int = 1000) -> None:
         """
@@ -149,51 +426,62 @@ class DatabaseConnection:
             schema: Database schema name
             batch_size: Number of records per batch
         """
-        if isinstance(data, pd.DataFrame):
-            data = data.to_dict('records')
-        elif isinstance(data, dict):
-            data = [data]
-            
-        if not data:
-            self.logger.warning("No data provided for upsert")
-            return
-            
         try:
-            self.connect()
-            with self.connection.cursor() as cursor:
-                # Get column names from first record
-                columns = list(data[0].keys())
-                values = [tuple(record[col] for col in columns) for record in data]
-                
-                # Build the ON CONFLICT clause
-                conflict_columns = ','.join(unique_columns)
-                update_columns = [col for col in columns if col not in unique_columns]
-                update_set = ','.join([f"{col} = EXCLUDED.{col}" for col in update_columns])
-                
-                # Prepare the query
-                query = f"""
-                    INSERT INTO {schema}.{table_name} 
-                    ({','.join(columns)}) 
-                    VALUES %s
-                    ON CONFLICT ({conflict_columns})
-                    DO UPDATE SET {update_set}
-                """
-                
-                # Execute in batches with progress bar
-                total_batches = (len(values) + batch_size - 1) // batch_size
-                with tqdm(total=total_batches, desc="Upserting batches") as pbar:
-                    for i in range(0, len(values), batch_size):
-                        batch = values[i:i + batch_size]
-                        execute_values(cursor, query, batch)
-                        pbar.update(1)
-                    
-                self.connection.commit()
-                self.logger.info(f"Successfully upserted {len(data)} records into {schema}.{table_name}")
-                
+            with self.transaction() as cursor:
+                self.upsert_rows(cursor, table_name, data, unique_columns, schema, batch_size)
         except Exception as e:
             self.logger.error(f"Error in upsert operation: {e}")
-            if self.connection:
-                self.connection.rollback()
             raise
-        finally:
-            self.disconnect()
+            
+    def upsert_rows(self, cursor, table_name: str, data: Union[pd.DataFrame, Dict], 
+                    unique_columns: List[str], schema: str = 'public', batch_size: int = 1000,
+                    preserve_columns: Optional[List[str]] = None) -> int:
+        """
+        Upsert rows using an existing cursor, without committing.
+        Use inside transaction() to write the rows atomically with other statements.
+        
+        Args:
+            cursor: Cursor of an open transaction
+            table_name: Name of the target table
+            data: DataFrame or dictionary containing data
+            unique_columns: List of columns that form the unique constraint
+            schema: Database schema name
+            batch_size: Number of records per batch
+            preserve_columns: Columns only written on INSERT (kept as they are on conflict)
+            
+        Returns:
+            Number of rows sent
+        """
+        if isinstance(data, dict):
+            data = [data]
+        columns, values = self._prepare_rows(data)
+            
+        if not values:
+            self.logger.warning("No data provided for upsert")
+            return 0
+            
+        # Build the ON CONFLICT clause
+        conflict_columns = ','.join(unique_columns)
+        keep = set(unique_columns) | set(preserve_columns or [])
+        update_columns = [col for col in columns if col not in keep]
+        update_set = ','.join([f"{col} = EXCLUDED.{col}" for col in update_columns])
+        
+        # Prepare the query
+        query = f"""
+            INSERT INTO {schema}.{table_name} 
+            ({','.join(columns)}) 
+            VALUES %s
+            ON CONFLICT ({conflict_columns})
+            DO UPDATE SET {update_set}
+        """
+        
+        # Execute in batches with progress bar
+        total_batches = (len(values) + batch_size - 1) // batch_size
+        with tqdm(total=total_batches, desc="Upserting batches") as pbar:
+            for i in range(0, len(values), batch_size):
+                batch = values[i:i + batch_size]
+                execute_values(cursor, query, batch)
+                pbar.update(1)
+            
+        self.logger.info(f"Successfully upserted {len(values)} records into {schema}.{table_name}")
+        return len(values)
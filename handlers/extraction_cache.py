@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+from typing import Callable, Dict, Optional
+from .query_loader import get_etl_config
+from .log_handler import setup_logger
+
+try:
+    import pyarrow  # noqa: F401 (engine do to_parquet/read_parquet)
+except ImportError:  # sem pyarrow: cache desativado, extração sempre na origem
+    pyarrow = None
+
+
+class ExtractionCache:
+    """
+    Local copy of what each extraction returned, as zstd-compressed Parquet
+    files (one per job, source database, query and params), so a date whose
+    load failed is retried from disk instead of the store server.
+
+    A file is "pending" until mark_loaded() is called after its load commits;
+    pending files are always read back (within ttl_hours). Loaded files are
+    only read in replay mode ("replay": true, or --from-cache), used to
+    rebuild target tables without querying the ERP; a date missing from the
+    cache is then an error. Expired files and, above max_size_mb, the oldest
+    ones are deleted after each write.
+
+    Needs pyarrow (optional dependency, not installed by requirements.txt);
+    without it the cache is disabled, and replay mode fails instead of
+    querying the source.
+    """
+
+    def __init__(self, job: str, source_config: Dict):
+        self.config = get_etl_config('extraction_cache')
+        self.job = job
+        self.source = f"{source_config['host']}:{source_config['port']}/{source_config['dbname']}"
+        self.folder = os.path.join(self.config.get('folder', 'cache/extraction'), job)
+        self.replay = self.config.get('replay', False)
+        self.enabled = self.config.get('enabled', False) and pyarrow is not None
+        self.logger = setup_logger("extraction_cache", log_file="logs/extraction_cache.log")
+        if self.config.get('enabled', False) and pyarrow is None:
+            self.logger.warning("pyarrow não instalado - cache de extração desativado")
+
+    def _path(self, query: str, params: Optional[Dict]) -> str:
+        key = json.dumps({
+            'job': self.job,
+            'source': self.source,
+            'query': hashlib.sha256(query.encode('utf-8')).hexdigest(),
+            'params': params,
+        }, sort_keys=True, default=str)
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:24]
+        # Data no nome do arquivo para facilitar a consulta manual do cache
+        prefix = f"{params['data']}_" if params and params.get('data') else ''
+        return os.path.join(self.folder, f"{prefix}{digest}.parquet")
+
+    def _expired(self, path: str) -> bool:
+        ttl_hours = self.config.get('ttl_hours', 168)
+        return bool(ttl_hours) and time.time() - os.path.getmtime(path) > ttl_hours * 3600
+
+    def get(self, query: str, params: Optional[Dict] = None) -> Optional[pd.DataFrame]:
+        """
+        Cached result of an extraction: pending files, or any file in replay mode
+        """
+        if not self.enabled:
+            return None
+        path = self._path(query, params)
+        if not os.path.exists(path) or self._expired(path):
+            return None
+        if os.path.exists(f"{path}.loaded") and not self.replay:
+            return None
+        try:
+            return pd.read_parquet(path, engine='pyarrow')
+        except Exception as e:
+            self.logger.warning(f"Arquivo de cache ilegível, ignorado: {path} - {str(e)}")
+            return None
+
+    def put(self, query: str, params: Optional[Dict], df: pd.DataFrame) -> Optional[str]:
+        """
+        Store an extraction result (pending until mark_loaded). Failures are
+        logged and never break the ETL.
+
+        Returns:
+            Path of the file, or None when not written
+        """
+        if not self.enabled:
+            return None
+        path = self._path(query, params)
+        temp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            df.to_parquet(temp_path, engine='pyarrow', compression=self.config.get('compression', 'zstd'),
+                          index=False)
+            # Troca atômica: leitores nunca veem um arquivo pela metade
+            os.replace(temp_path, path)
+            if os.path.exists(f"{path}.loaded"):
+                os.remove(f"{path}.loaded")
+        except Exception as e:
+            self.logger.warning(f"Falha ao gravar cache de extração ({self.job}, {params}): {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+        try:
+            self.evict()
+        except OSError as e:
+            # Outra loja do mesmo job pode estar limpando a pasta ao mesmo tempo
+            self.logger.warning(f"Falha na limpeza do cache {self.job}: {str(e)}")
+        return path
+
+    def fetch(self, query: str, params: Optional[Dict], extract: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Read-through: the cached result when there is one, otherwise extract()
+        and store it. In replay mode a miss raises instead of querying the source.
+        """
+        cached = self.get(query, params)
+        if cached is not None:
+            self.logger.info(f"{self.job} {params}: {len(cached)} linhas lidas do cache")
+            return cached
+        if self.replay:
+            if not self.enabled:
+                raise LookupError(f"{self.job}: modo replay com o cache desativado (sem pyarrow?)")
+            raise LookupError(f"{self.job} {params}: extração não encontrada no cache (modo replay)")
+        df = extract()
+        self.put(query, params, df)
+        return df
+
+    def mark_loaded(self, query: str, params: Optional[Dict] = None) -> None:
+        if not self.enabled:
+            return
+        path = self._path(query, params)
+        if os.path.exists(path):
+            with open(f"{path}.loaded", 'w', encoding='utf-8'):
+                pass
+
+    def evict(self) -> Dict[str, int]:
+        """
+        Delete expired files, then the oldest ones while the job's folder
+        exceeds max_size_mb
+
+        Returns:
+            {'expired': n, 'evicted': n}
+        """
+        summary = {'expired': 0, 'evicted': 0}
+        if not os.path.isdir(self.folder):
+            return summary
+
+        files = []
+        for name in os.listdir(self.folder):
+            if not name.endswith('.parquet'):
+                continue
+            path = os.path.join(self.folder, name)
+            if self._expired(path):
+                self._remove(path)
+                summary['expired'] += 1
+            else:
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+
+        max_bytes = self.config.get('max_size_mb', 2048) * 1024 * 1024
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            summary['evicted'] += 1
+
+        if summary['expired'] or summary['evicted']:
+            self.logger.info(f"Cache {self.job}: {summary['expired']} expirados, {summary['evicted']} removidos por tamanho")
+        return summary
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        for file_path in (path, f"{path}.loaded"):
+            if os.path.exists(file_path):
+                os.remove(file_path)
@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+from .log_handler import setup_logger
+from .run_history import propagate
+
+# Limite de tarefas simultâneas por loja, compartilhado por todos os jobs do processo
+_source_slots: Dict[Any, threading.BoundedSemaphore] = {}
+_source_slots_lock = threading.Lock()
+
+
+def _slot(store: Any, limit: int) -> threading.BoundedSemaphore:
+    with _source_slots_lock:
+        if store not in _source_slots:
+            _source_slots[store] = threading.BoundedSemaphore(limit)
+        return _source_slots[store]
+
+
+def store_id(source_config: Dict) -> Any:
+    return source_config.get('filial', source_config.get('host'))
+
+
+class StoreFanIn:
+    """
+    Runs the same task against every store's source database concurrently.
+
+    At most max_stores stores run at once, and each store accepts at most
+    max_connections_per_source tasks at a time across all jobs of the
+    process, so two jobs fanning in together never pile up on one Uniplus
+    server. A failing store does not stop the others.
+    """
+
+    def __init__(self, source_configs: List[Dict], max_stores: int = 4,
+                 max_connections_per_source: int = 1):
+        self.source_configs = source_configs
+        self.max_stores = max_stores
+        self.max_connections_per_source = max_connections_per_source
+        self.logger = setup_logger("fan_in", log_file="logs/fan_in.log")
+
+    def _run_store(self, task: Callable[[Dict], Any], source_config: Dict) -> Any:
+        store = store_id(source_config)
+        with _slot(store, self.max_connections_per_source):
+            self.logger.info(f"Loja {store}: iniciando")
+            return task(source_config)
+
+    def run(self, task: Callable[[Dict], Any]) -> Dict[Any, Dict]:
+        """
+        Args:
+            task: Called with each store's source config
+
+        Returns:
+            {store id: {'status': 'success'|'failed', 'result' or 'error'}}
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_stores, len(self.source_configs)))) as executor:
+            futures = {
+                store_id(config): executor.submit(
+                    propagate(self._run_store, f"@{store_id(config)}"), task, config
+                )
+                for config in self.source_configs
+            }
+            for store, future in futures.items():
+                try:
+                    results[store] = {'status': 'success', 'result': future.result()}
+                except Exception as e:
+                    results[store] = {'status': 'failed', 'error': str(e)}
+                    self.logger.error(f"Loja {store}: falha - {str(e)}")
+        return results
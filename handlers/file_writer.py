@@ -0,0 +1,298 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from .log_handler import setup_logger
+from .xml_blob_store import content_hash
+
+
+class FileManifest:
+    """
+    Local SQLite index of the files already written: key -> (path, size, hash).
+
+    Lives outside the synced download folder so the sync client never sees it.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                key         TEXT PRIMARY KEY,
+                path        TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                hash        TEXT NOT NULL,
+                written_at  TEXT NOT NULL
+            )
+        """)
+        self.connection.commit()
+
+    def get_hashes(self, keys: Iterable[str], batch_size: int = 500) -> Dict[str, str]:
+        keys = list(keys)
+        hashes = {}
+        for i in range(0, len(keys), batch_size):
+            batch = keys[i:i + batch_size]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.connection.execute(
+                f"SELECT key, hash FROM files WHERE key IN ({placeholders})", batch
+            )
+            hashes.update(dict(rows))
+        return hashes
+
+    def record_many(self, entries: List[Tuple[str, str, int, str]]) -> None:
+        """
+        Args:
+            entries: (key, path, size, hash) tuples
+        """
+        if not entries:
+            return
+        now = datetime.now().isoformat(timespec='seconds')
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO files (key, path, size, hash, written_at) VALUES (?, ?, ?, ?, ?)",
+            [entry + (now,) for entry in entries]
+        )
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class ManifestWriter:
+    """
+    Common part of the writers: the FileManifest, the stats and the skipping
+    of keys whose content is already written.
+    """
+
+    def __init__(self, manifest_path: str):
+        self.manifest = FileManifest(manifest_path)
+        self.stats = {'written': 0, 'skipped': 0, 'failed': 0}
+        self.logger = setup_logger("file_writer", log_file="logs/file_writer.log")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> Dict[str, int]:
+        """
+        Close the manifest; subclasses finish their writes first and call this last
+        """
+        self.manifest.close()
+        self.logger.info(f"{type(self).__name__} finished: {self.stats}")
+        return self.stats
+
+    def filter_current(self, hashes: Dict[str, Optional[str]]) -> List[str]:
+        """
+        Keys that need writing: not in the manifest or with a different hash
+        (keys without a known hash are always written). Skipped keys are counted.
+        """
+        stored = self.manifest.get_hashes(hashes.keys())
+        needed = [key for key, h in hashes.items() if h is None or stored.get(key) != h]
+        self.stats['skipped'] += len(hashes) - len(needed)
+        return needed
+
+
+class AtomicFileWriter(ManifestWriter):
+    """
+    Writes files on a thread pool, each one to a temp file in the destination
+    folder followed by an atomic os.replace, so a crash never leaves a
+    truncated file behind. Every written file is recorded in a FileManifest;
+    keys whose manifest hash matches the content hash are skipped.
+
+    Usage:
+        with AtomicFileWriter(folder, manifest_path) as writer:
+            pending = writer.filter_current({key: hash, ...})
+            writer.write(key, data, hash)
+        writer.stats
+    """
+
+    def __init__(self, folder: str, manifest_path: str, workers: int = 8,
+                 max_pending: Optional[int] = None, suffix: str = '.xml'):
+        super().__init__(manifest_path)
+        self.folder = folder
+        self.suffix = suffix
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # Limita os dados em memória aguardando escrita
+        self.max_pending = max_pending or workers * 4
+        self.pending: List[Future] = []
+
+    def _write_file(self, key: str, data: bytes, data_hash: Optional[str]) -> Tuple[str, str, int, str]:
+        path = os.path.join(self.folder, f"{key}{self.suffix}")
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix=f".{key}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key, path, len(data), data_hash or content_hash(data)
+
+    def write(self, key: str, data: bytes, data_hash: Optional[str] = None) -> None:
+        """
+        Queue a file for writing (blocks while max_pending writes are in flight)
+        """
+        if len(self.pending) >= self.max_pending:
+            self._drain(wait_all=False)
+        self.pending.append(self.executor.submit(self._write_file, key, data, data_hash))
+
+    def _drain(self, wait_all: bool = True) -> None:
+        # Aguarda metade da fila (ou toda) e registra no manifest o que terminou
+        target = 0 if wait_all else len(self.pending) // 2
+        entries = []
+        while len(self.pending) > target:
+            future = self.pending.pop(0)
+            try:
+                entries.append(future.result())
+                self.stats['written'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                self.logger.error(f"Error writing file: {str(e)}")
+        self.manifest.record_many(entries)
+
+    def close(self) -> Dict[str, int]:
+        self._drain(wait_all=True)
+        self.executor.shutdown(wait=True)
+        return super().close()
+
+
+class ZipArchiveWriter(ManifestWriter):
+    """
+    Packs files into compressed zip archives, one per group (e.g. emission day
+    or supplier), instead of one file per key.
+
+    Members are buffered per archive and appended in one pass: the archive is
+    copied to a temp file, the new members are appended and the copy replaces
+    the original, so a crash never corrupts an existing archive. When a key is
+    written again (changed XML) the archive is rebuilt without its old member,
+    so archives never accumulate stale copies. The FileManifest indexes
+    key -> archive, which allows reading one member without extracting.
+
+    Every flush copies the whole archive, so its cost grows with the group:
+    a group should stay small (a day's NFes, not a supplier's whole history).
+    Above max_archive_bytes a warning is logged.
+    """
+
+    def __init__(self, folder: str, manifest_path: str, workers: int = 4,
+                 max_buffer_bytes: int = 64 * 1024 * 1024, prefix: str = 'nfe_',
+                 suffix: str = '.xml', compresslevel: int = 9,
+                 max_archive_bytes: int = 512 * 1024 * 1024):
+        super().__init__(manifest_path)
+        self.folder = folder
+        self.prefix = prefix
+        self.suffix = suffix
+        self.compresslevel = compresslevel
+        self.max_archive_bytes = max_archive_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_buffer_bytes = max_buffer_bytes
+        self.buffers: Dict[str, List[Tuple[str, bytes, Optional[str]]]] = {}
+        self.buffered_bytes = 0
+        # Último flush de cada arquivo: um mesmo zip nunca é escrito em paralelo
+        self.last_flush: Dict[str, Future] = {}
+        self.flushes: List[Tuple[str, int, Future]] = []
+
+    def archive_path(self, group: str) -> str:
+        return os.path.join(self.folder, f"{self.prefix}{group}.zip")
+
+    def write(self, key: str, data: bytes, data_hash: Optional[str] = None, group: str = 'sem_grupo') -> None:
+        """
+        Buffer a member for the archive of its group; flushes the largest buffer
+        when max_buffer_bytes is exceeded.
+        """
+        path = self.archive_path(group)
+        self.buffers.setdefault(path, []).append((key, data, data_hash))
+        self.buffered_bytes += len(data)
+        if self.buffered_bytes > self.max_buffer_bytes:
+            largest = max(self.buffers, key=lambda p: sum(len(m[1]) for m in self.buffers[p]))
+            self._flush(largest)
+
+    def _append_members(self, path: str, members: List[Tuple[str, bytes, Optional[str]]],
+                        previous: Optional[Future]) -> List[Tuple[str, str, int, str]]:
+        if previous is not None:
+            previous.result()
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, prefix='.archive.', suffix='.tmp')
+        os.close(fd)
+        names = {f"{key}{self.suffix}" for key, _, _ in members}
+        try:
+            replaced = set()
+            if os.path.exists(path):
+                with zipfile.ZipFile(path) as existing:
+                    replaced = names.intersection(existing.namelist())
+            if replaced:
+                # XML alterado: reescreve o zip sem as versões antigas (sem membros duplicados)
+                self._rebuild(path, tmp_path, replaced)
+                mode = 'a'
+            elif os.path.exists(path):
+                shutil.copyfile(path, tmp_path)
+                mode = 'a'
+            else:
+                mode = 'w'
+            with zipfile.ZipFile(tmp_path, mode, compression=zipfile.ZIP_DEFLATED,
+                                 compresslevel=self.compresslevel) as archive:
+                for key, data, _ in members:
+                    archive.writestr(f"{key}{self.suffix}", data)
+            os.replace(tmp_path, path)
+            if os.path.getsize(path) > self.max_archive_bytes:
+                self.logger.warning(
+                    f"{path} passou de {self.max_archive_bytes // (1024 * 1024)} MB: cada gravação copia o zip "
+                    f"inteiro, use um agrupamento menor"
+                )
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return [(key, path, len(data), data_hash or content_hash(data)) for key, data, data_hash in members]
+
+    def _rebuild(self, path: str, tmp_path: str, skip: set) -> None:
+        # Última versão de cada membro (zips antigos podem ter duplicatas), sem os substituídos
+        with zipfile.ZipFile(path) as source, \
+                zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED,
+                                compresslevel=self.compresslevel) as target:
+            latest = {info.filename: info for info in source.infolist()}
+            for name, info in latest.items():
+                if name not in skip:
+                    target.writestr(info, source.read(info))
+
+    def _flush(self, path: str) -> None:
+        members = self.buffers.pop(path)
+        self.buffered_bytes -= sum(len(m[1]) for m in members)
+        future = self.executor.submit(self._append_members, path, members, self.last_flush.get(path))
+        self.last_flush[path] = future
+        self.flushes.append((path, len(members), future))
+
+    def close(self) -> Dict[str, int]:
+        for path in list(self.buffers):
+            self._flush(path)
+        for path, count, future in self.flushes:
+            try:
+                entries = future.result()
+                self.manifest.record_many(entries)
+                self.stats['written'] += len(entries)
+            except Exception as e:
+                self.stats['failed'] += count
+                self.logger.error(f"Error writing archive {path}: {str(e)}")
+        self.executor.shutdown(wait=True)
+        return super().close()
+
+    @staticmethod
+    def read(manifest_path: str, key: str, suffix: str = '.xml') -> Optional[bytes]:
+        """
+        Read one member by key, locating its archive through the manifest
+        """
+        manifest = FileManifest(manifest_path)
+        try:
+            row = manifest.connection.execute("SELECT path FROM files WHERE key = ?", (key,)).fetchone()
+        finally:
+            manifest.close()
+        if row is None or not os.path.exists(row[0]):
+            return None
+        with zipfile.ZipFile(row[0]) as archive:
+            return archive.read(f"{key}{suffix}")
@@ -0,0 +1,202 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+from .cron import cron_weekdays
+from .query_loader import get_etl_config
+from .log_handler import setup_logger
+
+# Um governador por processo, criado no primeiro uso
+_governor: Optional['ExtractionGovernor'] = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> Optional['ExtractionGovernor']:
+    """
+    Process-wide extraction governor, or None when the "governor" block is
+    missing or disabled
+    """
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            try:
+                config = get_etl_config('governor')
+            except ValueError:
+                return None
+            if not config.get('enabled', False):
+                return None
+            _governor = ExtractionGovernor(config)
+        return _governor
+
+
+class BusinessHours:
+    """
+    Windows when the stores are open, e.g.
+    [{"weekdays": "1-6", "start": "07:00", "end": "22:00"}]. weekdays uses
+    cron notation (0 or 7 = Sunday); a window whose end is before its start
+    runs past midnight.
+    """
+
+    def __init__(self, windows: List[Dict]):
+        self.windows = []
+        for window in windows:
+            weekdays = cron_weekdays(str(window.get('weekdays', '*')))
+            start = datetime.strptime(window['start'], '%H:%M').time()
+            end = datetime.strptime(window['end'], '%H:%M').time()
+            self.windows.append((weekdays, start, end))
+
+    def _open_window_end(self, moment: datetime) -> Optional[datetime]:
+        # Fim da janela aberta em 'moment' (a mais longa, se houver sobreposição)
+        ends = []
+        for weekdays, start, end in self.windows:
+            now = moment.time()
+            if start < end:
+                if moment.weekday() in weekdays and start <= now < end:
+                    ends.append(datetime.combine(moment.date(), end))
+            elif moment.weekday() in weekdays and now >= start:
+                ends.append(datetime.combine(moment.date() + timedelta(days=1), end))
+            elif (moment.weekday() - 1) % 7 in weekdays and now < end:
+                ends.append(datetime.combine(moment.date(), end))
+        return max(ends) if ends else None
+
+    def is_open(self, moment: Optional[datetime] = None) -> bool:
+        return self._open_window_end(moment or datetime.now()) is not None
+
+    def closes_at(self, moment: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        When business hours end (following back-to-back windows); None if closed
+        """
+        moment = moment or datetime.now()
+        end = self._open_window_end(moment)
+        for _ in range(14):
+            following = self._open_window_end(end) if end is not None else None
+            if following is None:
+                break
+            end = following
+        return end
+
+
+class ExtractionGovernor:
+    """
+    Paces queries against the Uniplus source databases so extractions do not
+    compete with the checkout lanes.
+
+    The active profile ("business" during business hours, "off_hours"
+    otherwise) sets, per source database:
+      - max_concurrent_queries: source queries running at once
+      - max_rows_per_second: fetch rate, shared by the queries on that source
+      - fetch_rows: rows per round trip of the server-side cursor
+      - latency_threshold_ms / max_backoff_s: when the round trip of the
+        session SET goes above the threshold (moving average), new queries
+        wait with exponential backoff and run one at a time
+
+    query_classes set statement_timeout and work_mem per class ("light",
+    "heavy"), with an optional "business" override. Jobs in heavy_jobs are
+    deferred to the end of business hours (defer_seconds).
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.business_hours = BusinessHours(config.get('business_hours', []))
+        self._condition = threading.Condition()
+        self._active: Dict[str, int] = {}
+        self._next_free: Dict[str, float] = {}
+        self._latency: Dict[str, float] = {}
+        self._slow_streak: Dict[str, int] = {}
+        self.logger = setup_logger("governor", log_file="logs/governor.log")
+
+    def profile(self, moment: Optional[datetime] = None) -> Dict:
+        name = 'business' if self.business_hours.is_open(moment) else 'off_hours'
+        return self.config.get(name, {})
+
+    def fetch_rows(self) -> int:
+        return self.profile().get('fetch_rows', 5000)
+
+    def session_settings(self, query_class: str) -> Dict[str, str]:
+        """
+        statement_timeout/work_mem of a query class for the current profile
+        """
+        settings = dict(self.config.get('query_classes', {}).get(query_class, {}))
+        business = settings.pop('business', {})
+        if self.business_hours.is_open():
+            settings.update(business)
+        return {key: str(value) for key, value in settings.items() if key in ('statement_timeout', 'work_mem')}
+
+    def _backoff(self, source: str) -> float:
+        profile = self.profile()
+        threshold = profile.get('latency_threshold_ms')
+        streak = self._slow_streak.get(source, 0)
+        if not threshold or not streak:
+            return 0.0
+        return min(profile.get('max_backoff_s', 30), 2 ** (streak - 1))
+
+    @contextmanager
+    def slot(self, source: str) -> Iterator[None]:
+        """
+        Wait for a free query slot on this source (after any latency backoff)
+        """
+        delay = self._backoff(source)
+        if delay:
+            self.logger.warning(
+                f"{source}: latência de {self._latency.get(source, 0):.0f}ms, aguardando {delay:.0f}s"
+            )
+            time.sleep(delay)
+
+        with self._condition:
+            while True:
+                limit = self.profile().get('max_concurrent_queries') or 1_000_000
+                if self._slow_streak.get(source):
+                    limit = 1
+                if self._active.get(source, 0) < limit:
+                    break
+                # Reavalia a cada 30s: o limite muda quando o expediente termina
+                self._condition.wait(timeout=30)
+            self._active[source] = self._active.get(source, 0) + 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active[source] -= 1
+                self._condition.notify_all()
+
+    def observe_latency(self, source: str, seconds: float) -> None:
+        """
+        Record a round-trip sample (moving average) and update the backoff streak
+        """
+        ms = seconds * 1000
+        previous = self._latency.get(source)
+        self._latency[source] = ms if previous is None else 0.7 * previous + 0.3 * ms
+        threshold = self.profile().get('latency_threshold_ms')
+        if threshold and self._latency[source] > threshold:
+            self._slow_streak[source] = self._slow_streak.get(source, 0) + 1
+        else:
+            self._slow_streak[source] = 0
+
+    def throttle(self, source: str, rows: int) -> None:
+        """
+        Sleep so the rows fetched from this source stay under max_rows_per_second
+        """
+        limit = self.profile().get('max_rows_per_second')
+        if not limit or rows <= 0:
+            return
+        with self._condition:
+            now = time.monotonic()
+            start = max(self._next_free.get(source, now), now)
+            self._next_free[source] = start + rows / limit
+            wait_seconds = self._next_free[source] - now
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+    def defer_seconds(self, job_name: str, moment: Optional[datetime] = None) -> float:
+        """
+        Seconds a job must wait before starting: until business hours end for
+        heavy jobs, 0 otherwise
+        """
+        if not self.config.get('defer_heavy_jobs', False) or job_name not in self.config.get('heavy_jobs', []):
+            return 0.0
+        moment = moment or datetime.now()
+        closes_at = self.business_hours.closes_at(moment)
+        if closes_at is None:
+            return 0.0
+        return max(0.0, (closes_at - moment).total_seconds())
@@ -15,6 +15,9 @@ def setup_logger(
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
+    # Fecha os handlers anteriores: o mesmo logger é recriado a cada instância de ETL
+    for handler in logger.handlers:
+        handler.close()
     logger.handlers = []
 
     console_handler = logging.StreamHandler(sys.stdout)
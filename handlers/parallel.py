@@ -0,0 +1,80 @@
+import os
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+
+def hash_partition(df: pd.DataFrame, key_columns: List[str], partitions: int) -> List[pd.DataFrame]:
+    """
+    Split a DataFrame into partitions by hashing the key columns.
+
+    Rows with the same key always land in the same partition, so operations
+    such as drop_duplicates(subset=key_columns) stay correct per partition.
+    Each partition keeps the original row order and index.
+
+    Args:
+        df: DataFrame to split
+        key_columns: Columns used to compute the partition of each row
+        partitions: Number of partitions
+
+    Returns:
+        List of non-empty partitions
+    """
+    codes = pd.util.hash_pandas_object(df[key_columns], index=False).to_numpy() % partitions
+    # Um único argsort estável em vez de uma máscara booleana por partição
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(partitions + 1))
+    return [
+        df.iloc[order[start:end]]
+        for start, end in zip(bounds[:-1], bounds[1:])
+        if end > start
+    ]
+
+
+def transform_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool for parallel_transform, created once per run and reused for
+    every day: spawning workers (and re-importing pandas in each) costs more
+    than transforming a day.
+    """
+    # spawn: fork de um processo com várias threads pode travar o filho em locks herdados
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def parallel_transform(df: pd.DataFrame, func: Callable[[pd.DataFrame], pd.DataFrame],
+                       key_columns: List[str], workers: Optional[int] = None,
+                       executor: Optional[ProcessPoolExecutor] = None) -> pd.DataFrame:
+    """
+    Apply a transform to hash partitions of a DataFrame on a process pool.
+
+    func must be picklable (a module-level function or a functools.partial of
+    one) and must only need the rows of its own partition. Workers are
+    spawned, not forked: the caller may be a scheduler/daemon thread. The partial results
+    are concatenated and put back in the original row order.
+
+    Args:
+        df: DataFrame to transform
+        func: Transform applied to each partition
+        key_columns: Columns used for hash partitioning
+        workers: Number of processes (default: os.cpu_count())
+        executor: Pool from transform_pool() to reuse; without it a pool is
+            created and shut down for this call only
+
+    Returns:
+        Transformed DataFrame
+    """
+    workers = workers or os.cpu_count() or 1
+    partitions = hash_partition(df, key_columns, workers)
+
+    if len(partitions) <= 1:
+        return func(df)
+
+    if executor is not None:
+        results = list(executor.map(func, partitions))
+    else:
+        with transform_pool(len(partitions)) as pool:
+            results = list(pool.map(func, partitions))
+
+    return pd.concat(results).sort_index(kind="stable")
@@ -0,0 +1,241 @@
+import re
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from .db_connection import DatabaseConnection
+from .query_loader import get_etl_config, load_query_from_file
+from .log_handler import setup_logger
+
+# Criação/desanexação de partições: uma de cada vez (várias lojas carregam o mesmo mês)
+_partition_lock = threading.Lock()
+
+_BOUND_FROM = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})")
+
+
+def _month_start(value) -> date:
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], '%Y-%m-%d')
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class PartitionManager:
+    """
+    Monthly range partitions of a target table, configured by the ETL's
+    "partitioning" entry (e.g. {"column": "emissao", "months_ahead": 3}):
+
+        <table>_pYYYYMM   FOR VALUES FROM ('YYYY-MM-01') TO (next month)
+        <table>_default   rows without a date
+
+    migration_file converts the existing table once, only when explicitly
+    asked (maintain(migrate=True), --migrate-partitions); the old table is
+    kept as <table>_pre_particionamento. Loads go straight to the partition
+    of their date (route()), which is created on demand, so each upsert only
+    probes that month's unique index.
+
+    With retention_months, partitions that ended before that many months ago
+    are detached and moved to archive_schema ("retention_action": "detach") or
+    dropped ("drop"); loads of those months are refused.
+    """
+
+    def __init__(self, target_connection: DatabaseConnection, etl_name: str):
+        self.target_connection = target_connection
+        self.etl_name = etl_name
+        etl_config = get_etl_config(etl_name)
+        self.settings = etl_config.get('partitioning', {})
+        self.schema = etl_config.get('schema', 'public')
+        self.table = etl_config['table']
+        self._partitioned = False
+        self._known: Dict[date, str] = {}
+        self.logger = setup_logger("partitions", log_file="logs/partitions.log")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.settings.get('enabled', False))
+
+    def partition_name(self, month: date) -> str:
+        return f"{self.table}_p{month.strftime('%Y%m')}"
+
+    def is_partitioned(self) -> bool:
+        # Só o resultado positivo fica em memória: a migração pode acontecer com o daemon no ar
+        if not self._partitioned:
+            result = self.target_connection.get_data(
+                "SELECT relkind::text AS relkind FROM pg_class WHERE oid = to_regclass(%(name)s)",
+                {'name': f"{self.schema}.{self.table}"}
+            )
+            self._partitioned = not result.empty and result.iloc[0, 0] == 'p'
+        return self._partitioned
+
+    def partitions(self) -> Dict[date, str]:
+        """
+        Attached monthly partitions, by first day of the month
+        """
+        result = self.target_connection.get_data(
+            """
+            SELECT c.relname::text AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%(name)s)
+            """,
+            {'name': f"{self.schema}.{self.table}"}
+        )
+        found = {}
+        for name, bound in result.itertuples(index=False):
+            match = _BOUND_FROM.search(bound or '')
+            if match:
+                found[_month_start(match.group(1))] = name
+        return found
+
+    def retention_start(self, today: Optional[date] = None) -> Optional[date]:
+        """
+        First month kept attached, or None without retention
+        """
+        months = self.settings.get('retention_months')
+        if not months:
+            return None
+        return _add_months(_month_start(today or date.today()), -int(months))
+
+    def _check_retention(self) -> None:
+        # Reconciliação e divergências comparam a origem com o destino nessa janela
+        months = self.settings.get('retention_months')
+        reconciliation = get_etl_config(self.etl_name).get('reconciliation', {})
+        lookback = max(reconciliation.get('lookback_days') or 0,
+                       reconciliation.get('drift', {}).get('lookback_days') or 0)
+        if months and int(months) * 28 < lookback:
+            raise ValueError(
+                f"{self.etl_name}: retention_months ({months}) menor que a janela de reconciliação ({lookback} dias)"
+            )
+
+    def _create(self, month: date) -> str:
+        name = self.partition_name(month)
+        self.target_connection.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.schema}.{name}
+            PARTITION OF {self.schema}.{self.table}
+            FOR VALUES FROM (%(desde)s) TO (%(ate)s)
+            """,
+            {'desde': month.isoformat(), 'ate': _add_months(month, 1).isoformat()}
+        )
+        self.logger.info(f"Partição criada: {self.schema}.{name}")
+        return name
+
+    def route(self, day: str) -> str:
+        """
+        Table a day's rows are loaded into: its monthly partition (created when
+        missing) on a partitioned table, the table itself otherwise
+
+        Args:
+            day: Date being loaded (format: 'YYYY-MM-DD')
+        """
+        if not self.enabled or not self.is_partitioned():
+            return self.table
+        month = _month_start(day)
+        if month in self._known:
+            return self._known[month]
+
+        start = self.retention_start()
+        if start and month < start:
+            raise ValueError(f"{self.table}: {day} é anterior à retenção ({start}), partição arquivada")
+        with _partition_lock:
+            existing = self.partitions()
+            name = existing.get(month) or self._create(month)
+        self._known[month] = name
+        return name
+
+    def create_ahead(self, today: Optional[date] = None) -> List[str]:
+        """
+        Create the partitions of the current month and of the next months_ahead months
+
+        Returns:
+            Names of the partitions created
+        """
+        current = _month_start(today or date.today())
+        created = []
+        with _partition_lock:
+            existing = self.partitions()
+            for offset in range(int(self.settings.get('months_ahead', 3)) + 1):
+                month = _add_months(current, offset)
+                if month not in existing:
+                    created.append(self._create(month))
+        return created
+
+    def apply_retention(self, today: Optional[date] = None) -> Dict[str, List[str]]:
+        """
+        Detach (moving to archive_schema) or drop the partitions that ended
+        before retention_start()
+
+        Returns:
+            {'detached': [...], 'dropped': [...]}
+        """
+        summary = {'detached': [], 'dropped': []}
+        start = self.retention_start(today)
+        if start is None:
+            return summary
+        self._check_retention()
+
+        action = self.settings.get('retention_action', 'detach')
+        archive_schema = self.settings.get('archive_schema', 'arquivo')
+        with _partition_lock:
+            for month, name in sorted(self.partitions().items()):
+                if month >= start:
+                    continue
+                with self.target_connection.transaction() as cursor:
+                    cursor.execute(f"ALTER TABLE {self.schema}.{self.table} DETACH PARTITION {self.schema}.{name}")
+                    if action == 'drop':
+                        cursor.execute(f"DROP TABLE {self.schema}.{name}")
+                    else:
+                        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+                        cursor.execute(f"ALTER TABLE {self.schema}.{name} SET SCHEMA {archive_schema}")
+                self._known.pop(month, None)
+                summary['dropped' if action == 'drop' else 'detached'].append(name)
+                self.logger.info(
+                    f"Partição {name} {'removida' if action == 'drop' else f'arquivada em {archive_schema}'}"
+                )
+        return summary
+
+    def maintain(self, migrate: bool = False, today: Optional[date] = None) -> Dict:
+        """
+        Create the partitions ahead and apply the retention. A table not yet
+        partitioned is only converted (migration_file) when migrate is True;
+        otherwise it is left as it is.
+
+        Returns:
+            Summary with migrated, created, detached and dropped partitions
+        """
+        summary = {'migrated': False, 'created': [], 'detached': [], 'dropped': []}
+        if not self.enabled:
+            return summary
+        self._check_retention()
+
+        if not self.is_partitioned():
+            if not migrate:
+                self.logger.info(f"{self.schema}.{self.table} ainda não é particionada (use --migrate-partitions)")
+                return summary
+            if not self.settings.get('migration_file'):
+                raise ValueError(f"{self.table} não é particionada e não há migration_file configurado")
+            self.logger.info(f"Migrando {self.schema}.{self.table} para partições mensais")
+            with _partition_lock:
+                self.target_connection.execute(load_query_from_file(self.settings['migration_file']))
+            summary['migrated'] = True
+
+        summary['created'] = self.create_ahead(today)
+        summary.update(self.apply_retention(today))
+        return summary
+
+    def status(self) -> Dict:
+        """
+        Whether the table is partitioned and which months are attached
+        """
+        if not self.enabled or not self.is_partitioned():
+            return {"partitioned": False, "partitions": 0}
+        months = sorted(self.partitions())
+        return {
+            "partitioned": True,
+            "partitions": len(months),
+            "first": months[0].isoformat() if months else None,
+            "last": months[-1].isoformat() if months else None,
+        }
@@ -1,6 +1,31 @@
 import os
 import json
-from typing import Dict, Any
+import copy
+import threading
+from typing import Dict, Any, Tuple
+
+# Ajustes de execução (ex.: parâmetros da linha de comando) aplicados sobre o config_etl.json
+_config_overrides: Dict[str, Dict[str, Any]] = {}
+
+# Arquivos já lidos: caminho -> (mtime, conteúdo); relidos apenas quando alterados em disco
+_file_cache: Dict[str, Tuple[float, Any]] = {}
+_file_cache_lock = threading.Lock()
+
+def _read_cached(path: str, parse=None) -> Any:
+    """
+    Read (and optionally parse) a file once, re-reading only when its mtime
+    changes, so long-running processes do not re-read configs/queries per run
+    """
+    mtime = os.path.getmtime(path)
+    cached = _file_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    value = parse(content) if parse else content
+    with _file_cache_lock:
+        _file_cache[path] = (mtime, value)
+    return value
 
 def load_etl_config() -> Dict[str, Any]:
     """
@@ -10,8 +35,8 @@ def load_etl_config() -> Dict[str, Any]:
         Dictionary with ETL configurations
     """
     config_path = os.path.join('settings', 'config_etl.json')
-    with open(config_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    # Cópia: quem recebe o dicionário pode alterá-lo sem afetar o cache
+    return copy.deepcopy(_read_cached(config_path, json.loads))
 
 def load_query_from_file(query_file: str) -> str:
     """
@@ -28,8 +53,7 @@ def load_query_from_file(query_file: str) -> str:
     if not os.path.exists(query_path):
         raise FileNotFoundError(f"Query file not found: {query_path}")
     
-    with open(query_path, 'r', encoding='utf-8') as f:
-        return f.read().strip()
+    return _read_cached(query_path).strip()
 
 def get_etl_query(etl_name: str) -> str:
     """
@@ -64,9 +88,25 @@ def get_etl_config(etl_name: str) -> Dict[str, Any]:
     Returns:
         Configuration dictionary for the ETL process
     """
-    config = load_etl_config()
+    config = _read_cached(os.path.join('settings', 'config_etl.json'), json.loads)
     
     if etl_name not in config:
         raise ValueError(f"ETL configuration not found: {etl_name}")
     
-    return config[etl_name] 
\ No newline at end of file
+    return copy.deepcopy({**config[etl_name], **_config_overrides.get(etl_name, {})})
+
+def set_config_overrides(overrides: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Override configuration keys for the current process without editing
+    config_etl.json (e.g. batch sizes and workers given on the command line)
+    
+    Args:
+        overrides: {etl_name: {key: value}}; None values are ignored
+    """
+    for etl_name, values in overrides.items():
+        values = {key: value for key, value in values.items() if value is not None}
+        if values:
+            _config_overrides.setdefault(etl_name, {}).update(values)
+
+def clear_config_overrides() -> None:
+    _config_overrides.clear()
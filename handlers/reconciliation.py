@@ -0,0 +1,275 @@
+import pandas as pd
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from .db_connection import DatabaseConnection
+from .query_loader import get_etl_config, load_query_from_file
+from .log_handler import setup_logger
+
+
+class KeySetReconciler:
+    """
+    Detects rows deleted in the source by comparing key-set fingerprints.
+
+    Both sides reduce the unique_columns of an ETL to one md5 per key and, per
+    bucket (a date or an id range), to COUNT(*) plus the sum of the hashes.
+    Only these per-bucket fingerprints cross the network. Buckets whose
+    fingerprints differ are narrowed down to key hashes, and target keys
+    missing from the source are deleted.
+
+    The source side is the 'source_keys_query' of the ETL's 'reconciliation'
+    config: it must return the unique_columns with the target column names
+    and types, so both sides render the same key text.
+
+    With several stores, 'filial' restricts the target side to the rows of
+    the store whose source is being compared.
+
+    find_drift() extends the fingerprint with the 'drift' settings (state
+    columns in the row hash, rounded sums of value columns) to find the days
+    whose content changed in the source after they were loaded.
+    """
+
+    def __init__(self, source_connection: DatabaseConnection,
+                 target_connection: DatabaseConnection, etl_name: str, filial: Optional[int] = None):
+        self.source_connection = source_connection
+        self.target_connection = target_connection
+        self.etl_name = etl_name
+        self.filial = filial
+        self.logger = setup_logger("reconciliation", log_file="logs/reconciliation.log")
+
+        self.config = get_etl_config(etl_name)
+        self.settings = self.config.get('reconciliation', {})
+        self.unique_columns = self.config['unique_columns']
+        self.bucket_expression = self.settings.get('bucket_expression', self.unique_columns[0])
+        self.table = f"{self.config.get('schema', 'public')}.{self.config['table']}"
+
+    def _key_hash_expression(self) -> str:
+        # Texto canônico da chave; '\N' diferencia NULL de string vazia
+        parts = [f"coalesce({col}::text, '\\N')" for col in self.unique_columns]
+        return f"md5(concat_ws('|', {', '.join(parts)}))"
+
+    def _window(self) -> tuple:
+        """
+        Restrict the comparison to the last 'lookback_days' of 'window_column'
+        (whole table when not configured).
+        """
+        column = self.settings.get('window_column')
+        lookback = self.settings.get('lookback_days')
+        if not column or not lookback:
+            return "TRUE", {}
+        return f"{column} >= %(desde)s", {'desde': date.today() - timedelta(days=lookback)}
+
+    def _store_filter(self) -> str:
+        if self.filial is None:
+            return "TRUE"
+        return f"filial::text = '{int(self.filial)}'"
+
+    def _sources(self, extra_columns: List[str] = ()) -> Dict[str, tuple]:
+        source_keys = load_query_from_file(self.settings['source_keys_query']).rstrip(';')
+        columns = list(self.unique_columns) + [col for col in extra_columns if col not in self.unique_columns]
+        target_keys = f"SELECT {', '.join(columns)} FROM {self.table} WHERE {self._store_filter()}"
+        return {
+            'source': (self.source_connection, source_keys),
+            'target': (self.target_connection, target_keys),
+        }
+
+    def _fingerprint_query(self, keys_query: str, window: str) -> str:
+        return f"""
+            SELECT bucket,
+                   COUNT(*) AS row_count,
+                   SUM(('x' || substr(key_hash, 1, 15))::bit(60)::bigint) AS key_sum
+            FROM (
+                SELECT DISTINCT {self.bucket_expression} AS bucket, {self._key_hash_expression()} AS key_hash
+                FROM ({keys_query}) k
+                WHERE {window}
+            ) f
+            GROUP BY bucket
+        """
+
+    def _bucket_filter(self) -> str:
+        return (f"({self.bucket_expression} = ANY(%(buckets)s) "
+                f"OR ({self.bucket_expression} IS NULL AND %(null_bucket)s))")
+
+    def _keys_query(self, keys_query: str, window: str) -> str:
+        return f"""
+            SELECT DISTINCT {self.bucket_expression} AS bucket, {self._key_hash_expression()} AS key_hash
+            FROM ({keys_query}) k
+            WHERE {window} AND {self._bucket_filter()}
+        """
+
+    @staticmethod
+    def _bucket_params(buckets: List) -> Dict:
+        values = [b.item() if hasattr(b, 'item') else b for b in buckets if not pd.isna(b)]
+        return {'buckets': values, 'null_bucket': len(values) < len(buckets)}
+
+    def get_fingerprints(self) -> pd.DataFrame:
+        """
+        Per-bucket fingerprints of both sides.
+
+        Returns:
+            DataFrame indexed by bucket with source/target row_count and key_sum
+        """
+        window, params = self._window()
+        frames = []
+        for side, (connection, keys_query) in self._sources().items():
+            result = connection.get_data(self._fingerprint_query(keys_query, window), params)
+            frames.append(
+                result.set_index('bucket')[['row_count', 'key_sum']].add_prefix(f"{side}_")
+            )
+        return pd.concat(frames, axis=1)
+
+    @staticmethod
+    def differing_buckets(fingerprints: pd.DataFrame) -> List:
+        """
+        Buckets whose row count or key sum differ between source and target.
+        """
+        if fingerprints.empty:
+            return []
+        source = fingerprints[['source_row_count', 'source_key_sum']].to_numpy()
+        target = fingerprints[['target_row_count', 'target_key_sum']].to_numpy()
+        # Bucket só de um lado aparece com NaN e também conta como divergente
+        differs = ~(source == target).all(axis=1)
+        return fingerprints.index[differs].tolist()
+
+    def _drift_fingerprint_query(self, keys_query: str, window: str, drift: Dict) -> str:
+        state_columns = drift.get('state_columns', [])
+        value_columns = drift.get('value_columns', [])
+        digits = drift.get('round_digits', 2)
+        # Chave + colunas de estado (ex.: canc): muda quando a linha é cancelada/corrigida
+        parts = [f"coalesce({col}::text, '\\N')" for col in list(self.unique_columns) + state_columns]
+        values = ''.join(f", round({col}::numeric, {digits}) AS v_{col}" for col in value_columns)
+        sums = ''.join(f", COALESCE(SUM(v_{col}), 0) AS sum_{col}" for col in value_columns)
+        return f"""
+            SELECT bucket,
+                   COUNT(*) AS row_count,
+                   SUM(('x' || substr(row_hash, 1, 15))::bit(60)::bigint) AS row_sum{sums}
+            FROM (
+                SELECT DISTINCT {self.bucket_expression} AS bucket,
+                       md5(concat_ws('|', {', '.join(parts)})) AS row_hash{values}
+                FROM ({keys_query}) k
+                WHERE {window}
+            ) f
+            GROUP BY bucket
+        """
+
+    def find_drift(self) -> Dict:
+        """
+        Days (buckets) of the last drift 'lookback_days' (today excluded, it is
+        still open) whose row count, row-hash sum or value sums differ between
+        source and target: late uploads, cancellations, corrected values.
+
+        Returns:
+            {'buckets_checked': n, 'buckets': [differing buckets]}
+        """
+        drift = self.settings.get('drift', {})
+        column = self.settings.get('window_column', self.bucket_expression)
+        window = f"{column} >= %(desde)s AND {column} < %(ate)s"
+        params = {'desde': date.today() - timedelta(days=drift.get('lookback_days', 45)), 'ate': date.today()}
+        extra_columns = drift.get('state_columns', []) + drift.get('value_columns', [])
+
+        frames = []
+        for side, (connection, keys_query) in self._sources(extra_columns).items():
+            result = connection.get_data(self._drift_fingerprint_query(keys_query, window, drift), params)
+            frames.append(result.set_index('bucket').add_prefix(f"{side}_"))
+        fingerprints = pd.concat(frames, axis=1)
+
+        buckets = []
+        if not fingerprints.empty:
+            metrics = [col[len('source_'):] for col in fingerprints.columns if col.startswith('source_')]
+            source = fingerprints[[f"source_{m}" for m in metrics]].astype(object).to_numpy()
+            target = fingerprints[[f"target_{m}" for m in metrics]].astype(object).to_numpy()
+            # Dia só de um lado aparece com NaN e também conta como divergente
+            buckets = fingerprints.index[~(source == target).all(axis=1)].tolist()
+
+        self.logger.info(f"{self.etl_name}: {len(buckets)} de {len(fingerprints)} dias com divergência de conteúdo")
+        return {'buckets_checked': len(fingerprints), 'buckets': buckets}
+
+    def _get_key_hashes(self, side: str, buckets: List) -> pd.DataFrame:
+        connection, keys_query = self._sources()[side]
+        window, params = self._window()
+        params.update(self._bucket_params(buckets))
+        return connection.get_data(self._keys_query(keys_query, window), params)
+
+    def _delete_orphans(self, buckets: List, key_hashes: List[str], batch_size: int = 5000) -> int:
+        query = f"""
+            DELETE FROM {self.table}
+            WHERE {self._store_filter()}
+              AND {self._bucket_filter()}
+              AND {self._key_hash_expression()} = ANY(%(key_hashes)s)
+        """
+        params = self._bucket_params(buckets)
+        deleted = 0
+        with self.target_connection.transaction() as cursor:
+            for i in range(0, len(key_hashes), batch_size):
+                cursor.execute(query, {**params, 'key_hashes': key_hashes[i:i + batch_size]})
+                deleted += cursor.rowcount
+        return deleted
+
+    def reconcile(self, dry_run: bool = False) -> Dict:
+        """
+        Compare fingerprints, narrow down to differing buckets and delete the
+        orphaned target rows.
+
+        A bucket is skipped (not deleted) when the orphans exceed
+        'max_delete_ratio' of its target rows: that usually means a key cast
+        mismatch in source_keys_query or an incomplete source, not real deletions.
+
+        Args:
+            dry_run: Only report the orphans, without deleting
+
+        Returns:
+            Summary with checked/differing buckets, orphans deleted, keys missing
+            in the target and buckets skipped, plus the buckets with deletions
+        """
+        max_ratio = self.settings.get('max_delete_ratio', 0.2)
+
+        fingerprints = self.get_fingerprints()
+        differing = self.differing_buckets(fingerprints)
+        summary = {
+            "buckets_checked": len(fingerprints),
+            "buckets_differing": len(differing),
+            "deleted": 0,
+            "missing": 0,
+            "skipped": [],
+            "buckets": [],
+        }
+        self.logger.info(
+            f"{self.etl_name}: {len(differing)} de {len(fingerprints)} buckets com fingerprints divergentes"
+        )
+        if not differing:
+            return summary
+
+        source_keys = self._get_key_hashes('source', differing)
+        target_keys = self._get_key_hashes('target', differing)
+        source_sets = source_keys.groupby('bucket', dropna=False)['key_hash'].agg(set)
+
+        for bucket, group in target_keys.groupby('bucket', dropna=False):
+            expected = source_sets.get(bucket, set())
+            orphans = [key for key in group['key_hash'] if key not in expected]
+            summary["missing"] += len(expected - set(group['key_hash']))
+            if not orphans:
+                continue
+
+            if len(orphans) > max_ratio * len(group):
+                self.logger.warning(
+                    f"{self.etl_name}: bucket {bucket} ignorado - {len(orphans)} de {len(group)} "
+                    f"chaves sem correspondência na origem (acima de max_delete_ratio={max_ratio})"
+                )
+                summary["skipped"].append(str(bucket))
+                continue
+
+            if not dry_run:
+                summary["deleted"] += self._delete_orphans([bucket], orphans)
+            else:
+                summary["deleted"] += len(orphans)
+            summary["buckets"].append(bucket)
+            self.logger.info(f"{self.etl_name}: bucket {bucket} - {len(orphans)} linhas órfãs")
+
+        # Buckets presentes só na origem: chaves ainda não carregadas
+        missing_buckets = set(source_sets.index) - set(target_keys['bucket'])
+        summary["missing"] += sum(len(source_sets[b]) for b in missing_buckets)
+
+        self.logger.info(
+            f"{self.etl_name}: {summary['deleted']} linhas órfãs {'encontradas' if dry_run else 'removidas'}, "
+            f"{summary['missing']} chaves da origem ausentes no destino"
+        )
+        return summary
@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import pandas as pd
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from .db_connection import DatabaseConnection
+from .query_loader import get_etl_config, load_query_from_file
+from .log_handler import setup_logger
+
+try:
+    import resource
+except ImportError:  # Windows: sem pico de memória
+    resource = None
+
+# Execução e job ativos na thread atual (cada job roda na sua thread)
+_local = threading.local()
+
+# DDL de etl_run_history: uma vez por processo (o daemon salva a cada execução de job)
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def peak_memory_mb() -> Optional[float]:
+    """
+    Peak resident memory of the process so far (None where the resource
+    module is unavailable, e.g. Windows)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: KB no Linux, bytes no macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def current_run() -> Optional['RunHistory']:
+    return getattr(_local, 'run', None)
+
+
+def frame_bytes(df: Optional[pd.DataFrame]) -> Optional[int]:
+    """
+    In-memory size of a DataFrame; None outside a recorded run, since the
+    deep memory_usage walks every object value
+    """
+    if df is None or current_run() is None:
+        return None
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+def propagate(func: Callable, job_suffix: Optional[str] = None) -> Callable:
+    """
+    Function that runs with the run/job active on the calling thread, for work
+    handed to other threads (e.g. one thread per store). job_suffix tags the
+    entries (vendas_daily@2).
+    """
+    run, job = current_run(), getattr(_local, 'job', None)
+    if run is not None and job_suffix:
+        job = f"{job}{job_suffix}"
+
+    def run_propagated(*args, **kwargs):
+        previous = current_run(), getattr(_local, 'job', None)
+        _local.run, _local.job = run, job
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.run, _local.job = previous
+    return run_propagated
+
+
+@contextmanager
+def stage(stage_name: str, etl_date: Optional[str] = None):
+    """
+    Time one stage of the job running on this thread and record it in the
+    active run (no-op when there is none). The yielded dict takes the counters:
+
+        with stage('extract', date) as counters:
+            df = extract()
+            counters['rows'] = len(df)
+            counters['bytes'] = frame_bytes(df)
+    """
+    counters = {'rows': None, 'bytes': None}
+    started_at = datetime.now()
+    started = time.perf_counter()
+    status, error = 'success', None
+    try:
+        yield counters
+    except Exception as e:
+        status, error = 'failed', str(e)
+        raise
+    finally:
+        run = current_run()
+        if run is not None:
+            run.record(_local.job, stage_name, etl_date, started_at, time.perf_counter() - started,
+                       counters.get('rows'), counters.get('bytes'), status, error)
+
+
+class RunHistory:
+    """
+    Per-run performance record: one entry per job, date and stage (extract,
+    transform, load, ...) with duration, rows, bytes and process peak memory,
+    plus a 'total' entry per job.
+
+    save() writes a JSON report (report_folder/run_<run_id>.json, unless
+    write_report is False) and appends the entries to the etl_run_history
+    table of the target database, which feeds trend() (e.g. p95 load time
+    over the last 30 days).
+    """
+
+    def __init__(self, target_connection: Optional[DatabaseConnection] = None, write_report: bool = True):
+        self.config = get_etl_config('run_history')
+        self.target_connection = target_connection
+        self.write_report = write_report
+        self.run_id = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self.started_at = datetime.now()
+        self.entries: List[Dict] = []
+        self._lock = threading.Lock()
+        self.logger = setup_logger("run_history", log_file="logs/run_history.log")
+
+    def record(self, job: str, stage_name: str, etl_date: Optional[str], started_at: datetime,
+               duration: float, rows: Optional[int] = None, size_bytes: Optional[int] = None,
+               status: str = 'success', error: Optional[str] = None) -> None:
+        entry = {
+            'run_id': self.run_id,
+            'job': job,
+            'etl_date': etl_date,
+            'stage': stage_name,
+            'started_at': started_at,
+            'duration_s': round(duration, 3),
+            'rows': rows,
+            'bytes': size_bytes,
+            'peak_memory_mb': peak_memory_mb(),
+            'status': status,
+            'error': error[:1000] if error else None,
+        }
+        with self._lock:
+            self.entries.append(entry)
+
+    def wrap(self, job: str, func: Callable) -> Callable:
+        """
+        Job function that activates this run on its thread and records the
+        job's 'total' stage
+        """
+        def run_job():
+            previous = current_run(), getattr(_local, 'job', None)
+            _local.run, _local.job = self, job
+            try:
+                with stage('total') as counters:
+                    result = func()
+                    if isinstance(result, dict) and isinstance(result.get('processed'), int):
+                        counters['rows'] = result['processed']
+                    return result
+            finally:
+                _local.run, _local.job = previous
+        return run_job
+
+    def report(self) -> Dict:
+        """
+        JSON-ready report: entries grouped by job, with per-stage totals
+        """
+        jobs = {}
+        for entry in self.entries:
+            job = jobs.setdefault(entry['job'], {'stages': {}, 'entries': []})
+            totals = job['stages'].setdefault(entry['stage'], {'duration_s': 0.0, 'rows': 0, 'bytes': 0, 'count': 0})
+            totals['duration_s'] = round(totals['duration_s'] + entry['duration_s'], 3)
+            totals['rows'] += entry['rows'] or 0
+            totals['bytes'] += entry['bytes'] or 0
+            totals['count'] += 1
+            job['entries'].append({k: v for k, v in entry.items() if k not in ('run_id', 'job')})
+        return {
+            'run_id': self.run_id,
+            'started_at': self.started_at,
+            'finished_at': datetime.now(),
+            'peak_memory_mb': peak_memory_mb(),
+            'jobs': jobs,
+        }
+
+    def save(self) -> Optional[str]:
+        """
+        Write the JSON report and persist the entries. Failures are logged and
+        never break the ETL run.
+
+        Returns:
+            Path of the JSON report (None when not written)
+        """
+        global _table_ready
+        path = None
+        if self.write_report:
+            try:
+                folder = self.config.get('report_folder', 'reports')
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, f"run_{self.run_id}.json")
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(self.report(), f, indent=2, ensure_ascii=False, default=str)
+            except Exception as e:
+                self.logger.error(f"Falha ao gravar relatório da execução {self.run_id}: {str(e)}")
+
+        if self.target_connection is not None and self.entries:
+            try:
+                with _table_lock:
+                    if not _table_ready:
+                        self.target_connection.execute(load_query_from_file(self.config['ddl_file']))
+                        _table_ready = True
+                with self.target_connection.transaction() as cursor:
+                    # Tabela fixa, como etl_sync_ledger: a mesma do ddl_file e do trend_query
+                    self.target_connection.insert_rows(cursor, 'etl_run_history', self.entries)
+            except Exception as e:
+                self.logger.error(f"Falha ao gravar histórico da execução {self.run_id}: {str(e)}")
+
+        self.logger.info(f"Execução {self.run_id}: {len(self.entries)} registros de etapas, relatório em {path}")
+        return path
+
+
+def trend(target_connection: DatabaseConnection, job: Optional[str] = None, stage_name: Optional[str] = None,
+          days: int = 30) -> pd.DataFrame:
+    """
+    Duration percentiles (p50/p95/max) and row counts per job and stage over
+    the last 'days' days, from etl_run_history
+    """
+    config = get_etl_config('run_history')
+    query = load_query_from_file(config['trend_query'])
+    return target_connection.get_data(query, {'job': job, 'stage': stage_name, 'days': days})
@@ -0,0 +1,197 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from .log_handler import setup_logger
+
+# Recursos (bancos/disco) ocupados por cada classe de job
+RESOURCE_CLASSES = {
+    'source-heavy': ('source', 'target'),
+    'target-heavy': ('target',),
+    'disk': ('disk', 'target'),
+}
+
+
+class Job:
+    """
+    A unit of work for the JobScheduler.
+
+    Args:
+        name: Unique job name
+        func: Callable run without arguments; its return value is kept in the summary
+        depends_on: Names of the jobs that must succeed before this one starts
+        resource_class: Key of RESOURCE_CLASSES (which databases/disk it occupies)
+    """
+
+    def __init__(self, name: str, func: Callable[[], Any], depends_on: Optional[List[str]] = None,
+                 resource_class: str = 'source-heavy'):
+        if resource_class not in RESOURCE_CLASSES:
+            raise ValueError(f"Unknown resource class for job {name}: {resource_class}")
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on or [])
+        self.resource_class = resource_class
+
+    @property
+    def resources(self) -> tuple:
+        return RESOURCE_CLASSES[self.resource_class]
+
+
+class JobScheduler:
+    """
+    Runs a DAG of jobs on a thread pool.
+
+    A job starts as soon as all of its dependencies succeeded and every
+    resource of its class has a free slot (resource_limits caps the jobs
+    running at once per database/disk). Jobs whose dependency failed are
+    skipped. Ready jobs with more dependents start first, so the longest
+    chain is not delayed by independent work.
+
+    defer(job_name) may return the seconds a ready job must still wait (e.g.
+    heavy extractions held until the end of business hours); other jobs keep
+    running meanwhile.
+    """
+
+    def __init__(self, jobs: List[Job], max_workers: int = 4,
+                 resource_limits: Optional[Dict[str, int]] = None,
+                 defer: Optional[Callable[[str], float]] = None):
+        self.jobs = {job.name: job for job in jobs}
+        if len(self.jobs) != len(jobs):
+            raise ValueError("Duplicate job names")
+        self.order = [job.name for job in jobs]
+        self.max_workers = max_workers
+        self.resource_limits = resource_limits or {}
+        self.defer = defer
+        self.logger = setup_logger("scheduler", log_file="logs/scheduler.log")
+        self._validate()
+        self.dependents = {name: self._count_dependents(name) for name in self.order}
+
+    def _validate(self) -> None:
+        for job in self.jobs.values():
+            unknown = [dep for dep in job.depends_on if dep not in self.jobs]
+            if unknown:
+                raise ValueError(f"Job {job.name} depends on unknown jobs: {unknown}")
+
+        # Ordenação topológica só para detectar ciclos
+        remaining = {name: set(job.depends_on) for name, job in self.jobs.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Dependency cycle between jobs: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def _count_dependents(self, name: str) -> int:
+        seen, stack = set(), [name]
+        while stack:
+            current = stack.pop()
+            for job in self.jobs.values():
+                if current in job.depends_on and job.name not in seen:
+                    seen.add(job.name)
+                    stack.append(job.name)
+        return len(seen)
+
+    def _has_capacity(self, job: Job, in_use: Dict[str, int]) -> bool:
+        return all(
+            in_use.get(resource, 0) < self.resource_limits.get(resource, self.max_workers)
+            for resource in job.resources
+        )
+
+    def _run_job(self, job: Job) -> Any:
+        self.logger.info(f"Job {job.name} iniciado")
+        return job.func()
+
+    def run(self) -> Dict[str, Dict]:
+        """
+        Run every job respecting dependencies and resource limits.
+
+        Returns:
+            Per-job summary: status (success/failed/skipped), started_at,
+            duration (seconds), result or error
+        """
+        summary = {name: {'status': 'pending'} for name in self.order}
+        pending = list(self.order)
+        running: Dict[Future, tuple] = {}
+        in_use: Dict[str, int] = {}
+        deferred = set()
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # Dependência com falha: o job e seus dependentes são pulados
+                for name in list(pending):
+                    failed = [dep for dep in self.jobs[name].depends_on
+                              if summary[dep]['status'] in ('failed', 'skipped')]
+                    if failed:
+                        pending.remove(name)
+                        summary[name] = {'status': 'skipped', 'error': f"dependency failed: {', '.join(failed)}"}
+                        self.logger.warning(f"Job {name} pulado - dependência com falha: {failed}")
+
+                ready = [
+                    name for name in pending
+                    if all(summary[dep]['status'] == 'success' for dep in self.jobs[name].depends_on)
+                ]
+                ready.sort(key=lambda name: -self.dependents[name])
+                wake = None
+                for name in ready:
+                    job = self.jobs[name]
+                    delay = self.defer(name) if self.defer else 0
+                    if delay > 0:
+                        if name not in deferred:
+                            deferred.add(name)
+                            self.logger.info(f"Job {name} adiado por {delay / 60:.0f} min (horário comercial)")
+                        wake = delay if wake is None else min(wake, delay)
+                        continue
+                    if len(running) >= self.max_workers or not self._has_capacity(job, in_use):
+                        continue
+                    for resource in job.resources:
+                        in_use[resource] = in_use.get(resource, 0) + 1
+                    pending.remove(name)
+                    summary[name] = {'status': 'running', 'started_at': datetime.now().isoformat(timespec='seconds')}
+                    running[executor.submit(self._run_job, job)] = (name, time.perf_counter())
+
+                if not running:
+                    if wake is None:
+                        break
+                    # Só jobs adiados: reavalia periodicamente
+                    time.sleep(min(wake, 60))
+                    continue
+
+                done, _ = wait(running, timeout=min(wake, 60) if wake else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, job_started = running.pop(future)
+                    for resource in self.jobs[name].resources:
+                        in_use[resource] -= 1
+                    duration = round(time.perf_counter() - job_started, 2)
+                    summary[name]['duration'] = duration
+                    try:
+                        summary[name]['result'] = future.result()
+                        summary[name]['status'] = 'success'
+                        self.logger.info(f"Job {name} concluído em {duration}s")
+                    except Exception as e:
+                        summary[name]['status'] = 'failed'
+                        summary[name]['error'] = str(e)
+                        self.logger.error(f"Job {name} falhou após {duration}s: {str(e)}")
+
+        total = round(time.perf_counter() - started, 2)
+        self.logger.info(f"Scheduler finished in {total}s\n{self.format_summary(summary, total)}")
+        return summary
+
+    @staticmethod
+    def format_summary(summary: Dict[str, Dict], total: Optional[float] = None) -> str:
+        """
+        Per-job timing table (one line per job)
+        """
+        lines = [f"{'job':<36} {'status':<8} {'start':<20} {'seconds':>8}"]
+        for name, info in summary.items():
+            duration = info.get('duration')
+            lines.append(
+                f"{name:<36} {info['status']:<8} {info.get('started_at', '-'):<20} "
+                f"{'-' if duration is None else f'{duration:.2f}':>8}"
+            )
+        if total is not None:
+            busy = sum(info.get('duration', 0) for info in summary.values())
+            lines.append(f"wall time: {total:.2f}s (sum of jobs: {busy:.2f}s)")
+        return '\n'.join(lines)
@@ -0,0 +1,171 @@
+import pandas as pd
+from datetime import datetime
+from typing import List, Optional
+from .db_connection import DatabaseConnection
+from .query_loader import load_query_from_file
+from .log_handler import setup_logger
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_DRIFT = 'drift'
+
+
+def frame_checksum(df: pd.DataFrame) -> Optional[str]:
+    """
+    Order-independent checksum of a DataFrame's contents (hex string).
+    Used to record what the source returned for a date.
+
+    Args:
+        df: DataFrame to fingerprint
+
+    Returns:
+        16-char hex checksum, or None for an empty frame
+    """
+    if df.empty:
+        return None
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return f"{int(hashes.sum(dtype='uint64')):016x}"
+
+
+class SyncLedger:
+    """
+    Per-ETL, per-date sync state kept in the target database (etl_sync_ledger).
+
+    Replaces the company_schedule anti-joins against the full target tables:
+    a date is pending while it has no 'done' row for the ETL, which is an
+    indexed lookup on the ledger primary key. Days with no source rows are
+    marked 'done' with row_count 0, so they are not re-extracted forever.
+    Only closed days (before today) are ever marked 'done'.
+    """
+
+    def __init__(self, target_connection: DatabaseConnection, etl_name: str, filial: Optional[int] = None):
+        self.target_connection = target_connection
+        # Várias lojas: um ledger por loja ('vendas_daily@2')
+        self.etl_name = etl_name if filial is None else f"{etl_name}@{filial}"
+        self.filial = filial
+        self.logger = setup_logger("sync_ledger", log_file="logs/sync_ledger.log")
+        self._table_ready = False
+
+    def ensure_table(self) -> None:
+        if self._table_ready:
+            return
+        self.target_connection.execute(load_query_from_file('create_etl_sync_ledger.sql'))
+        self._table_ready = True
+
+    def seed_from_target(self, seed_query_file: str) -> int:
+        """
+        Bootstrap the ledger from dates already present in the target table.
+        Only runs while the ledger has no rows for this ETL (one-time full scan).
+
+        Args:
+            seed_query_file: SQL file that inserts the already loaded dates
+
+        Returns:
+            Number of dates seeded
+        """
+        self.ensure_table()
+        existing = self.target_connection.get_data(
+            "SELECT 1 FROM etl_sync_ledger WHERE etl_name = %(etl_name)s LIMIT 1",
+            {'etl_name': self.etl_name}
+        )
+        if not existing.empty:
+            return 0
+
+        seeded = self.target_connection.execute(
+            load_query_from_file(seed_query_file),
+            {'etl_name': self.etl_name, 'filial': self.filial}
+        )
+        self.logger.info(f"Ledger de {self.etl_name} inicializado com {seeded} datas já carregadas")
+        return seeded
+
+    def get_pending_dates(self) -> pd.DataFrame:
+        """
+        Dates from company_schedule without a 'done' entry for this ETL.
+
+        Returns:
+            DataFrame with a single date column
+        """
+        self.ensure_table()
+        query = load_query_from_file('sync_ledger_missing_dates.sql')
+        return self.target_connection.get_data(query, {'etl_name': self.etl_name, 'status': STATUS_DONE})
+
+    def mark_done(self, date: str, row_count: int, source_checksum: Optional[str] = None,
+                  started_at: Optional[datetime] = None, cursor=None) -> None:
+        """
+        Record a successfully loaded date.
+
+        Pass the cursor of the load transaction so the ledger entry is committed
+        atomically with the loaded rows; without it a separate transaction is used.
+
+        Args:
+            date: Loaded date (format: 'YYYY-MM-DD')
+            row_count: Number of rows loaded (0 for empty days)
+            source_checksum: Checksum of the extracted rows
+            started_at: When processing of the date started
+            cursor: Optional cursor of an open transaction
+        """
+        if str(date)[:10] >= datetime.now().strftime('%Y-%m-%d'):
+            # Dia ainda aberto (hoje ou futuro): fica pendente e é reextraído depois de fechado
+            self.logger.info(f"{self.etl_name} {date}: dia em aberto, não marcado como concluído")
+            return
+        self._write(cursor, date, STATUS_DONE, row_count, source_checksum, started_at, None)
+
+    def mark_drift(self, dates: List[str]) -> int:
+        """
+        Send loaded dates back to pending because their content changed in the
+        source (they are reloaded by the drift re-sync or the next run).
+
+        Returns:
+            Number of ledger entries updated
+        """
+        if not dates:
+            return 0
+        self.ensure_table()
+        return self.target_connection.execute(
+            """
+            UPDATE etl_sync_ledger
+            SET status = %(status)s, error = NULL
+            WHERE etl_name = %(etl_name)s AND data = ANY(%(datas)s::date[])
+            """,
+            {'etl_name': self.etl_name, 'status': STATUS_DRIFT, 'datas': list(dates)}
+        )
+
+    def mark_failed(self, date: str, error: str, started_at: Optional[datetime] = None) -> None:
+        """
+        Record a failed date (it stays pending and is retried on the next run).
+        """
+        try:
+            self._write(None, date, STATUS_FAILED, 0, None, started_at, error[:1000])
+        except Exception as e:
+            self.logger.error(f"Não foi possível registrar falha de {self.etl_name} em {date}: {str(e)}")
+
+    def _write(self, cursor, date: str, status: str, row_count: int, source_checksum: Optional[str],
+               started_at: Optional[datetime], error: Optional[str]) -> None:
+        query = """
+            INSERT INTO etl_sync_ledger
+                (etl_name, data, status, row_count, source_checksum, started_at, finished_at, error)
+            VALUES
+                (%(etl_name)s, %(data)s, %(status)s, %(row_count)s, %(source_checksum)s,
+                 %(started_at)s, now(), %(error)s)
+            ON CONFLICT (etl_name, data) DO UPDATE SET
+                status = EXCLUDED.status,
+                row_count = EXCLUDED.row_count,
+                source_checksum = EXCLUDED.source_checksum,
+                started_at = EXCLUDED.started_at,
+                finished_at = EXCLUDED.finished_at,
+                error = EXCLUDED.error
+        """
+        params = {
+            'etl_name': self.etl_name,
+            'data': date,
+            'status': status,
+            'row_count': int(row_count),
+            'source_checksum': source_checksum,
+            'started_at': started_at,
+            'error': error,
+        }
+        if cursor is not None:
+            cursor.execute(query, params)
+            return
+        self.ensure_table()
+        self.target_connection.execute(query, params)
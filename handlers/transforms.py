@@ -0,0 +1,189 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+# Formato explícito para pd.to_datetime: evita a inferência elemento a elemento
+# e aceita tanto objetos datetime/date vindos do psycopg2 quanto strings ISO.
+ISO_FORMAT = "ISO8601"
+
+
+def normalize_text(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """
+    Convert columns to text in place, preserving nulls.
+
+    Unlike the old astype(str) + "== 'None'" pattern, missing values stay
+    missing instead of becoming the strings 'None' or 'nan', and columns that
+    already have a string dtype are left untouched.
+
+    Args:
+        df: DataFrame to modify
+        columns: Columns to normalize (missing columns are ignored)
+
+    Returns:
+        The same DataFrame, for chaining
+    """
+    for col in columns:
+        if col not in df.columns:
+            continue
+        series = df[col]
+        if series.dtype == object or not pd.api.types.is_string_dtype(series):
+            df[col] = series.astype("str")
+    return df
+
+
+def to_numeric(df: pd.DataFrame, columns: List[str], dtype: Optional[str] = None) -> pd.DataFrame:
+    """
+    Convert columns to numbers in place, coercing invalid values to null.
+
+    Args:
+        df: DataFrame to modify
+        columns: Columns to convert (missing columns are ignored)
+        dtype: Optional dtype to cast to after conversion (e.g. 'Int64')
+
+    Returns:
+        The same DataFrame, for chaining
+    """
+    for col in columns:
+        if col not in df.columns:
+            continue
+        converted = pd.to_numeric(df[col], errors="coerce")
+        df[col] = converted.astype(dtype) if dtype else converted
+    return df
+
+
+def parse_datetimes(df: pd.DataFrame, columns: List[str], fmt: str = ISO_FORMAT,
+                    as_date: bool = False) -> pd.DataFrame:
+    """
+    Parse columns as timestamps (or dates) in place using an explicit format.
+
+    Timestamps stay as datetime64 (nulls as NaT); dates become datetime.date
+    objects, built once per distinct day instead of once per row.
+
+    Args:
+        df: DataFrame to modify
+        columns: Columns to parse (missing columns are ignored)
+        fmt: Format passed to pd.to_datetime (default: ISO8601)
+        as_date: If True, keep only the date part (datetime.date values)
+
+    Returns:
+        The same DataFrame, for chaining
+    """
+    for col in columns:
+        if col not in df.columns:
+            continue
+        series = df[col]
+        if not pd.api.types.is_datetime64_any_dtype(series):
+            series = pd.to_datetime(series, format=fmt, errors="coerce")
+        if as_date:
+            codes, uniques = pd.factorize(series.dt.normalize())
+            dates = np.append(np.asarray(uniques.date, dtype=object), None)
+            df[col] = pd.Series(dates[codes], index=df.index, dtype=object)
+        else:
+            df[col] = series
+    return df
+
+
+def map_values(df: pd.DataFrame, column: str, mapping: Dict, target: Optional[str] = None) -> pd.DataFrame:
+    """
+    Map categorical codes to labels in place (e.g. 0/1 -> 'Não'/'Sim').
+
+    Unmapped or null values become null.
+
+    Args:
+        df: DataFrame to modify
+        column: Source column with the codes
+        mapping: Dictionary code -> label
+        target: Output column (defaults to the source column)
+
+    Returns:
+        The same DataFrame, for chaining
+    """
+    df[target or column] = df[column].map(mapping)
+    return df
+
+
+def concat_columns(df: pd.DataFrame, target: str, columns: List[str], sep: str = "",
+                   na_rep: Optional[str] = None) -> pd.DataFrame:
+    """
+    Concatenate columns as text into a new column, in place.
+
+    Args:
+        df: DataFrame to modify
+        target: Output column
+        columns: Columns to concatenate, in order
+        sep: Separator between values
+        na_rep: Text used for nulls. If None, any null makes the result null
+
+    Returns:
+        The same DataFrame, for chaining
+    """
+    parts = [df[col].astype("str") for col in columns]
+    if na_rep is not None:
+        parts = [part.fillna(na_rep) for part in parts]
+    result = parts[0]
+    for part in parts[1:]:
+        result = result + sep + part
+    df[target] = result
+    return df
+
+
+def project_columns(df: pd.DataFrame, columns: List[str], fill_missing: bool = False) -> pd.DataFrame:
+    """
+    Keep only the given columns, in the given order.
+
+    Extra columns are dropped in place before reordering, so no intermediate
+    slice is created (and later assignments never hit a copy of a slice).
+
+    Args:
+        df: DataFrame to project
+        columns: Target columns, in order
+        fill_missing: If True, columns absent from df are added with None;
+                      otherwise they are skipped
+
+    Returns:
+        DataFrame with the projected columns
+    """
+    if fill_missing:
+        for col in columns:
+            if col not in df.columns:
+                df[col] = None
+        keep = list(columns)
+    else:
+        keep = [col for col in columns if col in df.columns]
+
+    extra = [col for col in df.columns if col not in keep]
+    if extra:
+        df.drop(columns=extra, inplace=True)
+    if list(df.columns) != keep:
+        df = df[keep]
+    return df
+
+
+def to_rows(df: pd.DataFrame) -> Tuple[List[str], List[tuple]]:
+    """
+    Convert a DataFrame into (columns, rows) ready for psycopg2.
+
+    Works column by column: nulls of every kind (None/NaN/NaT/pd.NA) become
+    None and timestamps become datetime.datetime, without going through
+    to_dict('records') and per-row dictionaries.
+
+    Args:
+        df: DataFrame to convert
+
+    Returns:
+        Tuple with the column names and the list of row tuples
+    """
+    values = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_dtype(series):
+            # datetime64 -> object devolve datetime.datetime e None para NaT
+            values.append(series.to_numpy(dtype="datetime64[us]").astype(object))
+            continue
+        mask = series.isna().to_numpy()
+        has_nulls = bool(mask.any())
+        array = series.to_numpy(dtype=object, copy=has_nulls)
+        if has_nulls:
+            array[mask] = None
+        values.append(array)
+    return list(df.columns), list(zip(*values))
@@ -0,0 +1,74 @@
+import pandas as pd
+from datetime import datetime
+from typing import Dict, Optional
+from .db_connection import DatabaseConnection
+from .query_loader import load_query_from_file
+from .log_handler import setup_logger
+
+
+class WatermarkStore:
+    """
+    Persisted change watermarks per ETL (etl_watermarks table in the target).
+
+    Each entry keeps the high-water mark of the last successful incremental
+    extraction and when the last full reconciliation ran.
+    """
+
+    def __init__(self, target_connection: DatabaseConnection):
+        self.target_connection = target_connection
+        self.logger = setup_logger("watermark", log_file="logs/watermark.log")
+        self._table_ready = False
+
+    def ensure_table(self) -> None:
+        if self._table_ready:
+            return
+        self.target_connection.execute(load_query_from_file('create_etl_watermarks.sql'))
+        self._table_ready = True
+
+    def get(self, etl_name: str) -> Dict[str, Optional[datetime]]:
+        """
+        Current state for an ETL.
+
+        Returns:
+            Dictionary with 'watermark' and 'last_full_sync' (None when unknown)
+        """
+        self.ensure_table()
+        result = self.target_connection.get_data(
+            "SELECT watermark, last_full_sync FROM etl_watermarks WHERE etl_name = %(etl_name)s",
+            {'etl_name': etl_name}
+        )
+        if result.empty:
+            return {'watermark': None, 'last_full_sync': None}
+        row = result.iloc[0]
+        return {
+            key: None if pd.isna(row[key]) else pd.Timestamp(row[key]).to_pydatetime()
+            for key in ('watermark', 'last_full_sync')
+        }
+
+    def set(self, etl_name: str, watermark: Optional[datetime], full_sync: bool = False, cursor=None) -> None:
+        """
+        Store a new watermark. Pass the cursor of the load transaction so the
+        watermark only advances if the load commits.
+
+        Args:
+            etl_name: ETL name
+            watermark: New high-water mark (None keeps the current one)
+            full_sync: If True, also records now() as the last full reconciliation
+            cursor: Optional cursor of an open transaction
+        """
+        query = """
+            INSERT INTO etl_watermarks (etl_name, watermark, last_full_sync, updated_at)
+            VALUES (%(etl_name)s, %(watermark)s, CASE WHEN %(full_sync)s THEN now() END, now())
+            ON CONFLICT (etl_name) DO UPDATE SET
+                watermark = COALESCE(EXCLUDED.watermark, etl_watermarks.watermark),
+                last_full_sync = COALESCE(EXCLUDED.last_full_sync, etl_watermarks.last_full_sync),
+                updated_at = EXCLUDED.updated_at
+        """
+        params = {'etl_name': etl_name, 'watermark': watermark, 'full_sync': full_sync}
+        if cursor is not None:
+            cursor.execute(query, params)
+        else:
+            self.ensure_table()
+            self.target_connection.execute(query, params)
+        self.logger.info(f"Watermark de {etl_name} atualizado para {watermark} (full_sync={full_sync})")
+
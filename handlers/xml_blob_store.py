@@ -0,0 +1,122 @@
+import zlib
+import hashlib
+import pandas as pd
+from typing import Dict, Iterable, List, Optional, Set
+from .db_connection import DatabaseConnection
+from .query_loader import load_query_from_file
+from .log_handler import setup_logger
+
+
+def content_hash(data) -> Optional[str]:
+    """
+    Content address of an XML: md5 hex, the same value PostgreSQL's md5(bytea)
+    returns, so the source can compute it without sending the XML.
+    """
+    if data is None:
+        return None
+    return hashlib.md5(bytes(data)).hexdigest()
+
+
+class XmlBlobStore:
+    """
+    Content-addressed store of NFe XMLs (nfe_xml_blobs: hash -> zlib blob).
+
+    The report table keeps only arquivo_xml_hash. A blob is written once per
+    distinct content; rows sharing an XML, or reloads of an unchanged XML,
+    reuse the stored blob.
+    """
+
+    def __init__(self, target_connection: DatabaseConnection, compression_level: int = 6):
+        self.target_connection = target_connection
+        self.compression_level = compression_level
+        self.logger = setup_logger("xml_blob_store", log_file="logs/xml_blob_store.log")
+        self._table_ready = False
+
+    def ensure_table(self) -> None:
+        if self._table_ready:
+            return
+        self.target_connection.execute(load_query_from_file('create_nfe_xml_blobs.sql'))
+        self._table_ready = True
+
+    def existing_hashes(self, hashes: Iterable[str]) -> Set[str]:
+        """
+        Subset of the given hashes already stored.
+        """
+        hashes = [h for h in set(hashes) if h]
+        if not hashes:
+            return set()
+        self.ensure_table()
+        result = self.target_connection.get_data(
+            "SELECT hash FROM nfe_xml_blobs WHERE hash = ANY(%(hashes)s)",
+            {'hashes': hashes}
+        )
+        return set(result['hash']) if not result.empty else set()
+
+    def put_many(self, blobs: Dict[str, bytes], batch_size: int = 200) -> int:
+        """
+        Compress and store blobs (hash -> raw XML) whose hash is not stored yet.
+
+        Returns:
+            Number of blobs written
+        """
+        new = {h: data for h, data in blobs.items() if h and data is not None}
+        new = {h: new[h] for h in set(new) - self.existing_hashes(new)}
+        if not new:
+            return 0
+
+        rows = [
+            (h, len(data), zlib.compress(bytes(data), self.compression_level))
+            for h, data in new.items()
+        ]
+        query = """
+            INSERT INTO nfe_xml_blobs (hash, tamanho, xml_zlib)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (hash) DO NOTHING
+        """
+        with self.target_connection.transaction() as cursor:
+            for i in range(0, len(rows), batch_size):
+                cursor.executemany(query, rows[i:i + batch_size])
+
+        self.logger.info(f"{len(rows)} novos XMLs gravados em nfe_xml_blobs")
+        return len(rows)
+
+    def store_frame(self, df: pd.DataFrame, xml_column: str = 'arquivo_xml',
+                    hash_column: str = 'arquivo_xml_hash') -> pd.DataFrame:
+        """
+        Move the inline XMLs of a DataFrame into the store: fills hash_column,
+        writes the new blobs and clears xml_column (the row keeps only the hash).
+        """
+        if xml_column not in df.columns:
+            return df
+        has_xml = df[xml_column].notna()
+        if hash_column not in df.columns:
+            df[hash_column] = None
+        df.loc[has_xml, hash_column] = [content_hash(data) for data in df.loc[has_xml, xml_column]]
+
+        self.put_many(dict(zip(df.loc[has_xml, hash_column], df.loc[has_xml, xml_column])))
+        df[xml_column] = None
+        return df
+
+    @staticmethod
+    def decompress(blob) -> Optional[bytes]:
+        return zlib.decompress(bytes(blob)) if blob is not None else None
+
+    def get(self, xml_hash: str) -> Optional[bytes]:
+        """
+        Raw XML for a hash (None when not stored).
+        """
+        self.ensure_table()
+        result = self.target_connection.get_data(
+            "SELECT xml_zlib FROM nfe_xml_blobs WHERE hash = %(hash)s",
+            {'hash': xml_hash}
+        )
+        if result.empty:
+            return None
+        return self.decompress(result['xml_zlib'].iloc[0])
+
+    def missing(self, hashes: List[str]) -> List[str]:
+        """
+        Hashes not stored yet (the only XMLs that need to be transferred).
+        """
+        wanted = {h for h in hashes if h}
+        return sorted(wanted - self.existing_hashes(wanted))
@@ -1,22 +1,88 @@
 # Example usage of the ETL services
+import argparse
+import json
+import sys
+import pandas as pd
 from services.vendas_daily import VendasDailyETL
 from services.notas_fiscais import NotasFiscaisETL
 from services.catalogo import CatalogoETL
 from services.xml_downloader import XMLDownloaderService
 from services.contas_a_pagar import ContasAPagarETL
 from services.movimentacao_estoque import MovimentacaoEstoqueETL
-from settings.db_config import get_source_config, get_target_config
-from datetime import datetime, date
+from services.daily_aggregates import DailyAggregatesETL
+from services.lake_export import LakeExportETL, pq
+from services.nfe_items import NfeItemsETL
+from handlers.scheduler import Job, JobScheduler
+from handlers.daemon import JobDaemon, schedule_from_config
+from handlers.db_connection import DatabaseConnection
+from handlers.fan_in import StoreFanIn, store_id
+from handlers.governor import get_governor
+from handlers.partitions import PartitionManager
+from handlers.run_history import RunHistory, trend, stage
+from handlers.query_loader import get_etl_config, set_config_overrides
+from settings.db_config import get_source_config, get_source_configs, get_target_config
+from datetime import datetime, date, timedelta
 
-def run_vendas_daily_etl():
+def _changed_dates(result: dict) -> list:
+    # Datas alteradas por uma loja: carregadas (run_etl/run_intraday) ou reconciliadas
+    if 'dates' in result:
+        return result['dates']['processed']
+    if 'date' in result:
+        return [result['date']]
+    return [pd.Timestamp(bucket).strftime('%Y-%m-%d') for bucket in result.get('buckets', [])]
+
+def run_across_stores(etl_name: str, etl_factory, run, refresh_aggregates: bool = True):
+    """
+    Executa um ETL de vendas/estoque em todas as lojas (UNICO_STORES) em
+    paralelo e recalcula as tabelas fato_* (e a exportação para o lake) uma
+    única vez, para as datas alteradas em qualquer loja. Com uma única origem, executa como antes.
+    Args:
+        etl_name: 'vendas_daily' ou 'movimentacao_estoque'
+        etl_factory: Recebe a configuração de origem e retorna a instância do ETL
+        run: Recebe a instância do ETL e refresh_aggregates; retorna o resumo
+    """
+    source_configs = get_source_configs()
+    if len(source_configs) == 1 and 'filial' not in source_configs[0]:
+        return run(etl_factory(source_configs[0]), refresh_aggregates)
+
+    config = get_etl_config('stores')
+    fan_in = StoreFanIn(
+        source_configs,
+        max_stores=config.get('max_stores', 4),
+        max_connections_per_source=config.get('max_connections_per_source', 1)
+    )
+    # Cada loja sem recalcular agregados: DELETE + INSERT concorrentes no mesmo dia duplicariam linhas
+    stores = fan_in.run(lambda source_config: run(etl_factory(source_config), False))
+    succeeded = [info['result'] for info in stores.values() if info['status'] == 'success']
+
+    summary = {
+        "processed": sum(r['processed'] for r in succeeded if isinstance(r.get('processed'), int)),
+        "stores": stores,
+    }
+    dates = sorted({date for result in succeeded for date in _changed_dates(result)})
+    if refresh_aggregates and dates:
+        with stage('aggregates'):
+            summary["aggregates"] = DailyAggregatesETL(get_target_config()).refresh(etl_name, dates)
+        with stage('lake_export'):
+            summary["lake_export"] = LakeExportETL(get_target_config()).export(etl_name, dates)
+
+    failed = {store: info['error'] for store, info in stores.items() if info['status'] != 'success'}
+    if failed:
+        # As lojas que concluíram já estão carregadas; o job fica com falha pelas demais
+        raise RuntimeError(f"{etl_name}: falha nas lojas " + "; ".join(f"{store}: {error}" for store, error in failed.items()))
+    return summary
+
+def run_vendas_daily_etl(dates: list = None):
     """
     Run the daily sales ETL for all missing dates
-    This is the main entry point - always processes missing dates from company_schedule
+    This is the main entry point - processes missing dates from company_schedule,
+    or only the given dates (format: 'YYYY-MM-DD').
+    With UNICO_STORES, runs for every store (see run_across_stores)
     """
-    source_config = get_source_config()
-    target_config = get_target_config()
-    etl = VendasDailyETL(source_config, target_config)
-    return etl.run_etl()
+    return run_across_stores(
+        'vendas_daily', lambda source_config: VendasDailyETL(source_config, get_target_config()),
+        lambda etl, refresh_aggregates: etl.run_etl(dates, refresh_aggregates=refresh_aggregates)
+    )
 
 def run_notas_fiscais_etl(date_filter: str = None):
     """
@@ -25,66 +91,490 @@ def run_notas_fiscais_etl(date_filter: str = None):
         date_filter: Optional date filter (format: 'YYYY-MM-DD'). 
                     If None, will fetch all records.
                     If provided, will fetch records from that date onwards.
+                    Ignored with load_mode "incremental" (only new/changed NFes by chave).
     """
     source_config = get_source_config()
     target_config = get_target_config()
     etl = NotasFiscaisETL(source_config, target_config)
-    etl.run_etl(date_filter)
+    return etl.run_etl(date_filter)
+
+def run_nfe_items_etl():
+    """
+    Interpreta os XMLs de NFe ainda não processados e carrega os itens em fato_nfe_itens
+    """
+    target_config = get_target_config()
+    etl = NfeItemsETL(target_config)
+    return etl.run_etl()
 
 def run_catalogo_etl():
     """
     Run the catalogo (product catalog) ETL
     This will sync all active products from the source database to the target catalog table
+    With sync_mode "diff" returns the counts of inserted/updated/deleted/unchanged SKUs
     """
     source_config = get_source_config()
     target_config = get_target_config()
     etl = CatalogoETL(source_config, target_config)
-    etl.run_etl()
+    return etl.run_etl()
 
-def run_contas_a_pagar_etl():
+def run_contas_a_pagar_etl(full_sync: bool = False):
     """
     Executa o ETL de contas a pagar (com UPSERT)
+    Incremental pelo watermark; full_sync=True força a extração completa
     """
     source_config = get_source_config()
     target_config = get_target_config()
     etl = ContasAPagarETL(source_config, target_config)
-    return etl.run_etl()
+    return etl.run_etl(full_sync=full_sync)
 
-def run_movimentacao_estoque_etl():
+def run_movimentacao_estoque_etl(dates: list = None):
     """
     Executa o ETL de movimentação de estoque para datas faltantes
-    Processa automaticamente as datas faltantes baseado na tabela company_schedule usando UPSERT
+    Processa automaticamente as datas faltantes baseado na tabela company_schedule usando UPSERT,
+    ou apenas as datas informadas (formato 'YYYY-MM-DD').
+    Com UNICO_STORES, executa para todas as lojas (ver run_across_stores)
+    """
+    return run_across_stores(
+        'movimentacao_estoque', lambda source_config: MovimentacaoEstoqueETL(source_config, get_target_config()),
+        lambda etl, refresh_aggregates: etl.run_etl(dates, refresh_aggregates=refresh_aggregates)
+    )
+
+def run_daily_aggregates(etl_name: str, dates: list):
+    """
+    Recalcula manualmente as tabelas fato_* de um ETL para as datas informadas
+    Args:
+        etl_name: 'vendas_daily' ou 'movimentacao_estoque'
+        dates: Lista de datas no formato 'YYYY-MM-DD'
     """
+    target_config = get_target_config()
+    aggregates = DailyAggregatesETL(target_config)
+    return aggregates.refresh(etl_name, dates)
+
+def run_lake_export(etl_name: str, dates: list):
+    """
+    Exporta manualmente para o lake (Parquet por dia) as datas informadas de um ETL
+    Args:
+        etl_name: 'vendas_daily' ou 'movimentacao_estoque'
+        dates: Lista de datas no formato 'YYYY-MM-DD'
+    """
+    target_config = get_target_config()
+    return LakeExportETL(target_config).export(etl_name, dates)
+
+def run_reconciliation(etl_name: str, dry_run: bool = False):
+    """
+    Remove do destino as linhas excluídas/canceladas na origem, comparando
+    fingerprints das chaves (unique_columns) por bucket
+    Args:
+        etl_name: 'vendas_daily', 'movimentacao_estoque' ou 'contas_a_pagar'
+        dry_run: Apenas conta as linhas órfãs, sem excluir
+    """
+    etl_classes = {
+        'vendas_daily': VendasDailyETL,
+        'movimentacao_estoque': MovimentacaoEstoqueETL,
+        'contas_a_pagar': ContasAPagarETL,
+    }
+    if etl_name in ('vendas_daily', 'movimentacao_estoque'):
+        # Por loja: cada origem é comparada apenas com as linhas da sua filial
+        return run_across_stores(
+            etl_name, lambda source_config: etl_classes[etl_name](source_config, get_target_config()),
+            lambda etl, refresh_aggregates: etl.reconcile_deletions(dry_run=dry_run,
+                                                                    refresh_aggregates=refresh_aggregates),
+            refresh_aggregates=not dry_run
+        )
     source_config = get_source_config()
     target_config = get_target_config()
-    etl = MovimentacaoEstoqueETL(source_config, target_config)
-    return etl.run_etl()
+    etl = etl_classes[etl_name](source_config, target_config)
+    return etl.reconcile_deletions(dry_run=dry_run)
+
+def run_drift_resync(etl_name: str, dry_run: bool = False):
+    """
+    Reprocessa apenas os dias cujo conteúdo mudou na origem depois da carga
+    (contagem, hash das chaves/estado e somas de valores por dia, nos últimos
+    drift.lookback_days dias)
+    Args:
+        etl_name: 'vendas_daily' ou 'movimentacao_estoque'
+        dry_run: Apenas lista os dias divergentes, sem reprocessar
+    """
+    etl_classes = {
+        'vendas_daily': VendasDailyETL,
+        'movimentacao_estoque': MovimentacaoEstoqueETL,
+    }
+    return run_across_stores(
+        etl_name, lambda source_config: etl_classes[etl_name](source_config, get_target_config()),
+        lambda etl, refresh_aggregates: etl.resync_drift(dry_run=dry_run, refresh_aggregates=refresh_aggregates),
+        refresh_aggregates=not dry_run
+    )
+
+def run_partition_maintenance(etl_names: list = None, migrate: bool = False):
+    """
+    Partições mensais das tabelas de vendas e estoque: cria as partições dos
+    próximos meses e aplica a retenção
+    Args:
+        etl_names: ETLs com "partitioning" (padrão: vendas_daily e movimentacao_estoque)
+        migrate: Converte as tabelas ainda não particionadas (só via --migrate-partitions)
+    """
+    target_config = get_target_config()
+    return {
+        etl_name: PartitionManager(DatabaseConnection(target_config), etl_name).maintain(migrate=migrate)
+        for etl_name in etl_names or ['vendas_daily', 'movimentacao_estoque']
+    }
 
 def run_xml_download(download_folder: str = r"G:\Meu Drive"):
     target_config = get_target_config()
     downloader = XMLDownloaderService(target_config, download_folder)
     return downloader.run_xml_download()
 
-if __name__ == "__main__":
+def date_range(start: str, end: str = None) -> list:
+    """
+    Datas de start até end (inclusive), formato 'YYYY-MM-DD'
+    """
+    first = datetime.strptime(start, '%Y-%m-%d').date()
+    last = datetime.strptime(end, '%Y-%m-%d').date() if end else first
+    if last < first:
+        raise ValueError(f"--to ({end}) is before --from ({start})")
+    return [(first + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((last - first).days + 1)]
+
+def build_jobs(names: list = None, dates: list = None):
+    """
+    Jobs da carga noturna; dependências e classe de recurso vêm do bloco
+    "scheduler" do config_etl.json
+    Args:
+        names: Executa apenas estes jobs (dependências fora da seleção são ignoradas)
+        dates: Datas explícitas para os ETLs diários (vendas, estoque); notas
+               fiscais usa a primeira como filtro de emissão
+    """
+    job_funcs = {
+        'partitions': run_partition_maintenance,
+        'vendas_daily': lambda: run_vendas_daily_etl(dates),
+        'notas_fiscais': lambda: run_notas_fiscais_etl(dates[0] if dates else None),
+        'nfe_items': run_nfe_items_etl,
+        'catalogo': run_catalogo_etl,
+        'contas_a_pagar': run_contas_a_pagar_etl,
+        'movimentacao_estoque': lambda: run_movimentacao_estoque_etl(dates),
+        'reconciliation_vendas_daily': lambda: run_reconciliation('vendas_daily'),
+        'reconciliation_contas_a_pagar': lambda: run_reconciliation('contas_a_pagar'),
+        'reconciliation_movimentacao_estoque': lambda: run_reconciliation('movimentacao_estoque'),
+        'drift_vendas_daily': lambda: run_drift_resync('vendas_daily'),
+        'drift_movimentacao_estoque': lambda: run_drift_resync('movimentacao_estoque'),
+        'xml_download': run_xml_download,
+    }
+    jobs_config = get_etl_config('scheduler')['jobs']
+    unknown = [name for name in names or [] if name not in jobs_config]
+    if unknown:
+        raise ValueError(f"Unknown jobs: {', '.join(unknown)} (available: {', '.join(jobs_config)})")
+    selected = [name for name in jobs_config if not names or name in names]
+    return [
+        Job(
+            name,
+            job_funcs[name],
+            [dep for dep in jobs_config[name].get('depends_on', []) if dep in selected],
+            jobs_config[name].get('resource_class', 'source-heavy')
+        )
+        for name in selected
+    ]
+
+def run_all_jobs(names: list = None, dates: list = None, max_workers: int = None):
+    """
+    Executa a carga completa (ou os jobs informados) em paralelo, respeitando
+    dependências e os limites de jobs simultâneos por banco
+    Returns:
+        Resumo por job (status, início, duração, resultado ou erro)
+    """
+    config = get_etl_config('scheduler')
+    jobs = build_jobs(names, dates)
+    history = None
+    if get_etl_config('run_history').get('enabled', False):
+        # Tempos, linhas e bytes por job/data/etapa: relatório JSON + etl_run_history
+        history = RunHistory(DatabaseConnection(get_target_config()))
+        for job in jobs:
+            job.func = history.wrap(job.name, job.func)
+    governor = get_governor()
+    scheduler = JobScheduler(
+        jobs,
+        max_workers=max_workers or config.get('max_workers', 4),
+        resource_limits=config.get('resource_limits'),
+        defer=governor.defer_seconds if governor else None
+    )
+    summary = scheduler.run()
+    if history is not None:
+        history.save()
+    return summary
+
+def run_history_trend(job: str = None, stage: str = None, days: int = 30):
+    """
+    Percentis de duração (p50/p95/máx) por job e etapa nos últimos dias
+    Exemplo: run_history_trend('movimentacao_estoque', 'load', 30)
+    """
+    return trend(DatabaseConnection(get_target_config()), job, stage, days)
+
+def plan_jobs(names: list = None, dates: list = None) -> dict:
+    """
+    Dry-run: datas previstas e estimativa de linhas de cada job, sem extrair nem carregar
+    """
+    source_config = get_source_config()
+    target_config = get_target_config()
+
+    def per_store(etl_class):
+        # Várias lojas: um plano por filial
+        source_configs = get_source_configs()
+        if len(source_configs) == 1 and 'filial' not in source_configs[0]:
+            return etl_class(source_configs[0], target_config).plan(dates)
+        return {store_id(config): etl_class(config, target_config).plan(dates) for config in source_configs}
+
+    planners = {
+        'vendas_daily': lambda: per_store(VendasDailyETL),
+        'notas_fiscais': lambda: NotasFiscaisETL(source_config, target_config).plan(dates[0] if dates else None),
+        'nfe_items': lambda: {"estimated_rows": len(NfeItemsETL(target_config).get_pending(get_etl_config('nfe_items')))},
+        'catalogo': lambda: CatalogoETL(source_config, target_config).plan(),
+        'contas_a_pagar': lambda: ContasAPagarETL(source_config, target_config).plan(),
+        'movimentacao_estoque': lambda: per_store(MovimentacaoEstoqueETL),
+        'partitions': lambda: {
+            etl_name: PartitionManager(DatabaseConnection(target_config), etl_name).status()
+            for etl_name in ('vendas_daily', 'movimentacao_estoque')
+        },
+        'xml_download': lambda: {"estimated_rows": len(
+            XMLDownloaderService(target_config, get_etl_config('xml_downloader').get('default_folder', '.')).get_xml_index()
+        )},
+    }
+    plans = {}
+    for job in build_jobs(names, dates):
+        if job.name.startswith('reconciliation_'):
+            etl_name = job.name[len('reconciliation_'):]
+            settings = get_etl_config(etl_name).get('reconciliation', {})
+            plans[job.name] = {"lookback_days": settings.get('lookback_days'), "estimated_rows": None}
+            continue
+        if job.name.startswith('drift_'):
+            etl_name = job.name[len('drift_'):]
+            settings = get_etl_config(etl_name).get('reconciliation', {}).get('drift', {})
+            plans[job.name] = {"lookback_days": settings.get('lookback_days', 45), "estimated_rows": None}
+            continue
+        try:
+            plans[job.name] = planners[job.name]()
+        except Exception as e:
+            plans[job.name] = {"error": str(e)}
+    return plans
+
+def run_daemon():
+    """
+    Modo residente: cada job do bloco "daemon" roda no seu intervalo/cron,
+    sem sobrepor execuções do mesmo job. Conexões (pool), queries/configs
+    lidas e as instâncias dos ETLs ficam carregadas entre as execuções.
+    """
+    config = get_etl_config('daemon')
+    scheduler_config = get_etl_config('scheduler')
+    DatabaseConnection.enable_pooling(config.get('pool_size', 20), config.get('pool_timeout_seconds', 300))
+    source_config = get_source_config()
+    target_config = get_target_config()
+
+    # Uma instância por job (jobs diferentes podem rodar ao mesmo tempo)
+    instances = {}
+    def warm(name, factory):
+        if name not in instances:
+            instances[name] = factory()
+        return instances[name]
+
+    def etl(name, cls):
+        return warm(name, lambda: cls(source_config, target_config))
+
+    def stores(name, etl_name, cls, run):
+        # Vendas/estoque em todas as lojas; uma instância por job e loja
+        return run_across_stores(
+            etl_name,
+            lambda store_config: warm(f"{name}@{store_id(store_config)}", lambda: cls(store_config, target_config)),
+            run
+        )
+
+    download_folder = get_etl_config('xml_downloader').get('default_folder', r"G:\Meu Drive")
+    job_funcs = {
+        'vendas_intraday': lambda: stores(
+            'vendas_intraday', 'vendas_daily', VendasDailyETL,
+            lambda instance, refresh: instance.run_intraday(refresh_aggregates=refresh)
+        ),
+        'vendas_daily': lambda: stores(
+            'vendas_daily', 'vendas_daily', VendasDailyETL,
+            lambda instance, refresh: instance.run_etl(refresh_aggregates=refresh)
+        ),
+        'notas_fiscais': lambda: etl('notas_fiscais', NotasFiscaisETL).run_etl(),
+        'nfe_items': lambda: warm('nfe_items', lambda: NfeItemsETL(target_config)).run_etl(),
+        'catalogo': lambda: etl('catalogo', CatalogoETL).run_etl(),
+        'contas_a_pagar': lambda: etl('contas_a_pagar', ContasAPagarETL).run_etl(),
+        'movimentacao_estoque': lambda: stores(
+            'movimentacao_estoque', 'movimentacao_estoque', MovimentacaoEstoqueETL,
+            lambda instance, refresh: instance.run_etl(refresh_aggregates=refresh)
+        ),
+        'reconciliation_vendas_daily': lambda: stores(
+            'reconciliation_vendas_daily', 'vendas_daily', VendasDailyETL,
+            lambda instance, refresh: instance.reconcile_deletions(refresh_aggregates=refresh)
+        ),
+        'reconciliation_contas_a_pagar':
+            lambda: etl('reconciliation_contas_a_pagar', ContasAPagarETL).reconcile_deletions(),
+        'reconciliation_movimentacao_estoque': lambda: stores(
+            'reconciliation_movimentacao_estoque', 'movimentacao_estoque', MovimentacaoEstoqueETL,
+            lambda instance, refresh: instance.reconcile_deletions(refresh_aggregates=refresh)
+        ),
+        'drift_vendas_daily': lambda: stores(
+            'drift_vendas_daily', 'vendas_daily', VendasDailyETL,
+            lambda instance, refresh: instance.resync_drift(refresh_aggregates=refresh)
+        ),
+        'drift_movimentacao_estoque': lambda: stores(
+            'drift_movimentacao_estoque', 'movimentacao_estoque', MovimentacaoEstoqueETL,
+            lambda instance, refresh: instance.resync_drift(refresh_aggregates=refresh)
+        ),
+        'partitions': run_partition_maintenance,
+        'xml_download': lambda: warm(
+            'xml_download', lambda: XMLDownloaderService(target_config, download_folder)
+        ).run_xml_download(),
+    }
+
+    def recorded(name, func):
+        # Cada execução do daemon gera seu próprio registro no histórico, só na tabela
+        # (um JSON por execução encheria reports/) e com conexão própria: jobs salvam em paralelo
+        def run_recorded():
+            history = RunHistory(DatabaseConnection(target_config), write_report=False)
+            try:
+                return history.wrap(name, func)()
+            finally:
+                history.save()
+        return run_recorded
+
+    record_history = get_etl_config('run_history').get('enabled', False)
+    jobs, schedules = [], {}
+    for name, settings in config['jobs'].items():
+        if name not in job_funcs:
+            raise ValueError(f"Unknown daemon job: {name} (available: {', '.join(job_funcs)})")
+        if record_history:
+            job_funcs[name] = recorded(name, job_funcs[name])
+        resource_class = settings.get(
+            'resource_class',
+            scheduler_config['jobs'].get(name, {}).get('resource_class', 'source-heavy')
+        )
+        jobs.append(Job(name, job_funcs[name], resource_class=resource_class))
+        schedules[name] = schedule_from_config(settings)
+
+    governor = get_governor()
+    daemon = JobDaemon(
+        jobs,
+        schedules,
+        max_workers=config.get('max_workers', scheduler_config.get('max_workers', 4)),
+        resource_limits=scheduler_config.get('resource_limits'),
+        defer=governor.defer_seconds if governor else None
+    )
+    try:
+        return daemon.run()
+    finally:
+        DatabaseConnection.close_pools()
+
+def parse_args(argv: list = None):
+    parser = argparse.ArgumentParser(
+        description="Executa os ETLs Uniplus -> destino. Sem jobs informados, executa todos."
+    )
+    parser.add_argument('jobs', nargs='*', help="Jobs do bloco 'scheduler' do config_etl.json")
+    parser.add_argument('--from', dest='date_from', help="Primeira data (YYYY-MM-DD) em vez das datas faltantes")
+    parser.add_argument('--to', dest='date_to', help="Última data (YYYY-MM-DD, padrão: --from)")
+    parser.add_argument('--workers', type=int,
+                        help="Jobs simultâneos e processos/threads dos ETLs (transform, parser, escrita de XMLs)")
+    parser.add_argument('--batch-size', type=int,
+                        help="Chaves por consulta de extração (NFes, itens, XMLs)")
+    parser.add_argument('--chunk-rows', type=int,
+                        help="Linhas por comando INSERT/UPSERT e por ida ao servidor no streaming de XMLs")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Mostra as datas previstas e a estimativa de linhas, sem executar")
+    parser.add_argument('--list', action='store_true', help="Lista os jobs disponíveis")
+    parser.add_argument('--trend', nargs='?', const='', metavar='JOB',
+                        help="Percentis de duração por etapa (etl_run_history), opcionalmente de um job")
+    parser.add_argument('--stage', help="Etapa para --trend (extract, transform, load, total, ...)")
+    parser.add_argument('--days', type=int, default=30, help="Janela em dias para --trend (padrão: 30)")
+    parser.add_argument('--ignore-business-hours', action='store_true',
+                        help="Não adia os jobs pesados para depois do horário comercial (o ritmo de extração continua valendo)")
+    parser.add_argument('--from-cache', action='store_true',
+                        help="Recarrega vendas/estoque a partir do cache de extração, sem consultar a origem")
+    parser.add_argument('--export-lake', action='store_true',
+                        help="Exporta para o lake as datas de --from/--to (vendas e estoque), sem executar os ETLs")
+    parser.add_argument('--migrate-partitions', action='store_true',
+                        help="Converte vendas/estoque em tabelas particionadas por mês (faça backup antes)")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Modo residente: executa os jobs do bloco 'daemon' nos seus intervalos/cron")
+    return parser.parse_args(argv)
+
+def apply_cli_overrides(args) -> None:
+    """
+    Aplica --workers/--batch-size/--chunk-rows sobre o config_etl.json (só nesta execução)
+    """
+    load_etls = ('vendas_daily', 'movimentacao_estoque', 'contas_a_pagar', 'notas_fiscais', 'catalogo', 'nfe_items')
+    overrides = {etl_name: {'load_batch_size': args.chunk_rows} for etl_name in load_etls}
+    overrides['movimentacao_estoque']['transform_workers'] = args.workers
+    overrides['nfe_items'].update({'workers': args.workers, 'batch_size': args.batch_size})
+    overrides['notas_fiscais']['fetch_batch_size'] = args.batch_size
+    overrides['xml_downloader'] = {
+        'writer_workers': args.workers,
+        'bulk_keys_per_query': args.batch_size,
+        'stream_itersize': args.chunk_rows,
+    }
+    if args.ignore_business_hours:
+        overrides['governor'] = {'defer_heavy_jobs': False}
+    if args.from_cache:
+        overrides['extraction_cache'] = {'enabled': True, 'replay': True}
+    set_config_overrides(overrides)
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+
+    if args.list:
+        for name, settings in get_etl_config('scheduler')['jobs'].items():
+            depends_on = ', '.join(settings.get('depends_on', [])) or '-'
+            print(f"{name:<36} {settings.get('resource_class', 'source-heavy'):<14} depends on: {depends_on}")
+        return 0
+
+    apply_cli_overrides(args)
+    dates = date_range(args.date_from, args.date_to) if args.date_from else None
+
+    if args.trend is not None:
+        result = run_history_trend(args.trend or None, args.stage, args.days)
+        print(result.to_string(index=False) if not result.empty else "Sem execuções registradas no período")
+        return 0
+
+    if args.daemon:
+        run_daemon()
+        return 0
 
-    print("Running vendas daily ETL for missing dates...")
-    summary = run_vendas_daily_etl()
-    print(f"Processed: {summary['processed']}, Failed: {summary['failed']}")
-    
-    print(f"Running notas fiscais ETL")
-    run_notas_fiscais_etl()
-    
-    print("Running catalogo ETL to sync product catalog")
-    run_catalogo_etl()
-
-    print("Running contas a pagar ETL")
-    cap_summary = run_contas_a_pagar_etl()
-    print(f"Registros processados (contas_a_pagar): {cap_summary['processed']}")
-
-    print("Running movimentacao estoque ETL for missing dates...")
-    estoque_summary = run_movimentacao_estoque_etl()
-    print(f"Processed: {estoque_summary['processed']}, Failed: {estoque_summary['failed']}")
-
-    print("Running XML download")
-    stats = run_xml_download()
-    print(f"Downloaded: {stats['downloaded']}, Failed: {stats['failed']}")
\ No newline at end of file
+    if args.export_lake:
+        if not dates:
+            print("--export-lake requires --from")
+            return 2
+        if pq is None:
+            print("--export-lake requires pyarrow (pip install pyarrow)")
+            return 2
+        # Exportação manual vale mesmo com o lake desligado na carga
+        set_config_overrides({'lake_export': {'enabled': True}})
+        lake_etls = [name for name in args.jobs or ['vendas_daily', 'movimentacao_estoque']
+                     if get_etl_config(name).get('lake_export')]
+        results = {name: run_lake_export(name, dates) for name in lake_etls}
+        print(json.dumps(results, indent=2, ensure_ascii=False, default=str))
+        return 1 if any(result['failed'] for result in results.values()) else 0
+
+    if args.migrate_partitions:
+        partition_etls = args.jobs or ['vendas_daily', 'movimentacao_estoque']
+        disabled = [name for name in partition_etls
+                    if not get_etl_config(name).get('partitioning', {}).get('enabled')]
+        if disabled:
+            print(f"--migrate-partitions requires \"partitioning\": {{\"enabled\": true}} in: {', '.join(disabled)}")
+            return 2
+        results = run_partition_maintenance(partition_etls, migrate=True)
+        print(json.dumps(results, indent=2, ensure_ascii=False, default=str))
+        return 0
+
+    if args.dry_run:
+        print(json.dumps(plan_jobs(args.jobs, dates), indent=2, ensure_ascii=False, default=str))
+        return 0
+
+    print(f"Running jobs: {', '.join(args.jobs) if args.jobs else 'all'}")
+    job_summary = run_all_jobs(args.jobs, dates, args.workers)
+    print(JobScheduler.format_summary(job_summary))
+    failed_jobs = [name for name, info in job_summary.items() if info['status'] != 'success']
+    if failed_jobs:
+        print(f"Jobs with errors or skipped: {', '.join(failed_jobs)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
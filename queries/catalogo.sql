@@ -5,10 +5,15 @@ SELECT
     p.nomeecf as nome_pdv,  
     p.preco as preco_venda,  
     p.precoultimacompra as preco_ultima_compra,
-    se.quantidade as stock
+    sum(se.quantidade) as stock
 FROM  
     produto p  
 LEFT JOIN saldoestoque se  
     ON se.idproduto::text = p.codigo::text  
 WHERE  
-    p.inativo = 0;
\ No newline at end of file
+    p.inativo = 0
+-- Uma linha por produto: o saldo é a soma das linhas de saldoestoque
+GROUP BY  
+    p.codigo, p.ean, p.nome, p.nomeecf, p.preco, p.precoultimacompra
+ORDER BY  
+    p.codigo, p.ean, p.nome;
\ No newline at end of file
@@ -0,0 +1,6 @@
+-- Sincronização diferencial do catálogo: hash por SKU e índice para os DELETEs por sku
+ALTER TABLE public.catalogo
+    ADD COLUMN IF NOT EXISTS row_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS ix_catalogo_sku
+    ON public.catalogo (sku);
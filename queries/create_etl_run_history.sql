@@ -0,0 +1,18 @@
+-- Histórico de desempenho das execuções: uma linha por job, data e etapa
+CREATE TABLE IF NOT EXISTS etl_run_history (
+    id              BIGSERIAL PRIMARY KEY,
+    run_id          TEXT NOT NULL,
+    job             TEXT NOT NULL,
+    etl_date        DATE,
+    stage           TEXT NOT NULL,
+    started_at      TIMESTAMP NOT NULL,
+    duration_s      NUMERIC(12,3) NOT NULL,
+    rows            BIGINT,
+    bytes           BIGINT,
+    peak_memory_mb  NUMERIC(12,1),
+    status          TEXT NOT NULL,
+    error           TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_run_history_job_stage
+    ON etl_run_history (job, stage, started_at);
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS public.etl_sync_ledger (
+    etl_name        TEXT NOT NULL,
+    data            DATE NOT NULL,
+    status          TEXT NOT NULL,
+    row_count       INTEGER NOT NULL DEFAULT 0,
+    source_checksum TEXT,
+    started_at      TIMESTAMP,
+    finished_at     TIMESTAMP NOT NULL DEFAULT now(),
+    error           TEXT,
+    PRIMARY KEY (etl_name, data)
+);
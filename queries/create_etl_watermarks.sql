@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS public.etl_watermarks (
+    etl_name        TEXT PRIMARY KEY,
+    watermark       TIMESTAMP,
+    last_full_sync  TIMESTAMP,
+    updated_at      TIMESTAMP NOT NULL DEFAULT now()
+);
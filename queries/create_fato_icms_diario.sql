@@ -0,0 +1,17 @@
+CREATE TABLE IF NOT EXISTS public.fato_icms_diario (
+    data                DATE NOT NULL,
+    filial              INTEGER,
+    cfop                TEXT,
+    tipo_movimentacao   TEXT,
+    qtd_movimentos      INTEGER NOT NULL,
+    valor_total         NUMERIC(18,2),
+    icms                NUMERIC(18,2),
+    icms_st             NUMERIC(18,2),
+    pis_cofins          NUMERIC(18,2),
+    ipi                 NUMERIC(18,2),
+    outros_impostos     NUMERIC(18,2),
+    atualizado_em       TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_fato_icms_diario_data
+    ON public.fato_icms_diario (data);
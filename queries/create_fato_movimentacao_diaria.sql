@@ -0,0 +1,14 @@
+CREATE TABLE IF NOT EXISTS public.fato_movimentacao_diaria (
+    data                DATE NOT NULL,
+    filial              INTEGER,
+    codigo              TEXT,
+    tipo_movimentacao   TEXT,
+    qtd_movimentos      INTEGER NOT NULL,
+    quantidade          NUMERIC(18,4),
+    valor_total         NUMERIC(18,2),
+    custo_medio_total   NUMERIC(18,2),
+    atualizado_em       TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_fato_movimentacao_diaria_data
+    ON public.fato_movimentacao_diaria (data);
@@ -0,0 +1,43 @@
+-- Itens das NFes de compra, extraídos dos XMLs em nfe_xml_blobs (NfeItemsETL)
+CREATE TABLE IF NOT EXISTS public.fato_nfe_itens (
+    chave             TEXT NOT NULL,
+    n_item            INTEGER NOT NULL,
+    arquivo_xml_hash  TEXT NOT NULL,
+    data_emissao      TIMESTAMPTZ,
+    cnpj_emitente     TEXT,
+    codigo_produto    TEXT,
+    ean               TEXT,
+    descricao         TEXT,
+    ncm               TEXT,
+    cfop              TEXT,
+    unidade           TEXT,
+    quantidade        NUMERIC(18,4),
+    valor_unitario    NUMERIC(21,10),
+    valor_total       NUMERIC(18,2),
+    valor_desconto    NUMERIC(18,2),
+    icms_cst          TEXT,
+    icms_base         NUMERIC(18,2),
+    icms_aliquota     NUMERIC(7,4),
+    icms_valor        NUMERIC(18,2),
+    icms_st_valor     NUMERIC(18,2),
+    ipi_valor         NUMERIC(18,2),
+    pis_valor         NUMERIC(18,2),
+    cofins_valor      NUMERIC(18,2),
+    PRIMARY KEY (chave, n_item)
+);
+
+CREATE INDEX IF NOT EXISTS ix_fato_nfe_itens_ean ON public.fato_nfe_itens (ean);
+CREATE INDEX IF NOT EXISTS ix_fato_nfe_itens_hash ON public.fato_nfe_itens (chave, arquivo_xml_hash);
+
+-- Resultado da leitura de cada XML (ok, empty = sem itens, error = XML inválido).
+-- XMLs sem det (resumos, eventos) e inválidos não geram itens; sem este registro
+-- voltariam como pendentes a cada execução.
+CREATE TABLE IF NOT EXISTS public.fato_nfe_itens_status (
+    chave             TEXT NOT NULL,
+    arquivo_xml_hash  TEXT NOT NULL,
+    status            TEXT NOT NULL,
+    itens             INTEGER NOT NULL DEFAULT 0,
+    error             TEXT,
+    parsed_at         TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (chave, arquivo_xml_hash)
+);
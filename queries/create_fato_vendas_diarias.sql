@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS public.fato_vendas_diarias (
+    data                    DATE NOT NULL,
+    filial                  INTEGER,
+    pdv                     TEXT,
+    finalizador             TEXT NOT NULL,
+    qtd_cupons              INTEGER NOT NULL,
+    qtd_cupons_cancelados   INTEGER NOT NULL,
+    valor_finalizador       NUMERIC(18,2) NOT NULL,
+    troco                   NUMERIC(18,2) NOT NULL,
+    valor_recebido          NUMERIC(18,2) NOT NULL,
+    atualizado_em           TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_fato_vendas_diarias_data
+    ON public.fato_vendas_diarias (data);
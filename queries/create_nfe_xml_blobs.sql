@@ -0,0 +1,14 @@
+-- Armazenamento endereçado por conteúdo dos XMLs de NFe (hash md5 -> XML zlib).
+-- report_uniplus_notas_fiscais guarda apenas arquivo_xml_hash.
+CREATE TABLE IF NOT EXISTS public.nfe_xml_blobs (
+    hash        TEXT PRIMARY KEY,
+    tamanho     INTEGER NOT NULL,
+    xml_zlib    BYTEA NOT NULL,
+    created_at  TIMESTAMP NOT NULL DEFAULT now()
+);
+
+ALTER TABLE public.report_uniplus_notas_fiscais
+    ADD COLUMN IF NOT EXISTS arquivo_xml_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS ix_report_uniplus_notas_fiscais_xml_hash
+    ON public.report_uniplus_notas_fiscais (arquivo_xml_hash);
@@ -0,0 +1,9 @@
+-- Migração do modo incremental: UPSERT por chave exige índice único.
+-- Remove duplicatas deixadas pelas cargas TRUNCATE + INSERT (mantém a última linha física).
+DELETE FROM public.report_uniplus_notas_fiscais a
+USING public.report_uniplus_notas_fiscais b
+WHERE a.chave = b.chave
+  AND a.ctid < b.ctid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_report_uniplus_notas_fiscais_chave
+    ON public.report_uniplus_notas_fiscais (chave);
@@ -0,0 +1,38 @@
+-- Uma linha por dia / filial / CFOP / tipo de movimentação, a partir dos
+-- tributos já carregados em movimentacao_estoque.
+INSERT INTO public.fato_icms_diario (
+    data,
+    filial,
+    cfop,
+    tipo_movimentacao,
+    qtd_movimentos,
+    valor_total,
+    icms,
+    icms_st,
+    pis_cofins,
+    ipi,
+    outros_impostos,
+    atualizado_em
+)
+SELECT
+    d.data,
+    me.filial,
+    me.cfop,
+    me.tipo_movimentacao,
+    COUNT(*) AS qtd_movimentos,
+    SUM(me.valortotal) AS valor_total,
+    SUM(me.icms) AS icms,
+    SUM(me.icms_st) AS icms_st,
+    SUM(me.pis_cofins) AS pis_cofins,
+    SUM(me.ipi) AS ipi,
+    SUM(me.outros_impostos) AS outros_impostos,
+    now() AS atualizado_em
+FROM unnest(%(datas)s::date[]) AS d(data)
+JOIN public.movimentacao_estoque me
+    ON me.datahora >= d.data
+   AND me.datahora < d.data + 1
+GROUP BY
+    d.data,
+    me.filial,
+    me.cfop,
+    me.tipo_movimentacao;
@@ -0,0 +1,32 @@
+-- Uma linha por dia / filial / produto / tipo de movimentação.
+-- O filtro por intervalo [dia, dia + 1) permite usar o índice em datahora.
+INSERT INTO public.fato_movimentacao_diaria (
+    data,
+    filial,
+    codigo,
+    tipo_movimentacao,
+    qtd_movimentos,
+    quantidade,
+    valor_total,
+    custo_medio_total,
+    atualizado_em
+)
+SELECT
+    d.data,
+    me.filial,
+    me.codigo,
+    me.tipo_movimentacao,
+    COUNT(*) AS qtd_movimentos,
+    SUM(me.qtd) AS quantidade,
+    SUM(me.valortotal) AS valor_total,
+    SUM(me.qtd * me.customedio) AS custo_medio_total,
+    now() AS atualizado_em
+FROM unnest(%(datas)s::date[]) AS d(data)
+JOIN public.movimentacao_estoque me
+    ON me.datahora >= d.data
+   AND me.datahora < d.data + 1
+GROUP BY
+    d.data,
+    me.filial,
+    me.codigo,
+    me.tipo_movimentacao;
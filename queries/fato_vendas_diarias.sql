@@ -0,0 +1,33 @@
+-- Uma linha por dia / filial / pdv / finalizador.
+-- uniplus_vendas_pdvs tem uma linha por pagamento do cupom, por isso os valores
+-- vêm de valor_finalizador/troco e os cupons são contados com DISTINCT documento.
+INSERT INTO public.fato_vendas_diarias (
+    data,
+    filial,
+    pdv,
+    finalizador,
+    qtd_cupons,
+    qtd_cupons_cancelados,
+    valor_finalizador,
+    troco,
+    valor_recebido,
+    atualizado_em
+)
+SELECT
+    v.emissao AS data,
+    v.filial::integer AS filial,
+    v.pdv::text AS pdv,
+    COALESCE(v.finalizador, 'N/D') AS finalizador,
+    COUNT(DISTINCT v.documento) FILTER (WHERE v.canc IS DISTINCT FROM 'Sim') AS qtd_cupons,
+    COUNT(DISTINCT v.documento) FILTER (WHERE v.canc = 'Sim') AS qtd_cupons_cancelados,
+    COALESCE(SUM(v.valor_finalizador) FILTER (WHERE v.canc IS DISTINCT FROM 'Sim'), 0) AS valor_finalizador,
+    COALESCE(SUM(v.troco) FILTER (WHERE v.canc IS DISTINCT FROM 'Sim'), 0) AS troco,
+    COALESCE(SUM(v.valor_finalizador - COALESCE(v.troco, 0)) FILTER (WHERE v.canc IS DISTINCT FROM 'Sim'), 0) AS valor_recebido,
+    now() AS atualizado_em
+FROM public.uniplus_vendas_pdvs v
+WHERE v.emissao = ANY(%(datas)s::date[])
+GROUP BY
+    v.emissao,
+    v.filial,
+    v.pdv,
+    COALESCE(v.finalizador, 'N/D');
@@ -0,0 +1,124 @@
+-- Particionamento mensal: converte uniplus_vendas_pdvs em tabela particionada por
+-- RANGE (emissao), uma partição por mês (uniplus_vendas_pdvs_pAAAAMM) e uniplus_vendas_pdvs_default
+-- para linhas sem data. A tabela atual é copiada para as partições e fica como
+-- uniplus_vendas_pdvs_pre_particionamento (cópia de segurança, sem índices: remova
+-- depois de conferir); índices e constraints são recriados na tabela nova. Falha,
+-- sem alterar nada, se houver views ou chaves estrangeiras dependendo da tabela ou
+-- índice único/PK sem emissao. Permissões (GRANT) não são copiadas.
+-- Executado só por `python main.py --migrate-partitions`.
+DO $$
+DECLARE
+    r record;
+    ddl text[] := '{}';
+    stmt text;
+    mes date;
+    ultimo date;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'public.uniplus_vendas_pdvs'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+    IF to_regclass('public.uniplus_vendas_pdvs_pre_particionamento') IS NOT NULL THEN
+        RAISE EXCEPTION 'public.uniplus_vendas_pdvs_pre_particionamento já existe';
+    END IF;
+    IF EXISTS (
+        SELECT 1 FROM pg_depend d JOIN pg_rewrite w ON w.oid = d.objid
+        WHERE d.refobjid = 'public.uniplus_vendas_pdvs'::regclass AND w.ev_class <> d.refobjid
+    ) OR EXISTS (
+        SELECT 1 FROM pg_constraint WHERE confrelid = 'public.uniplus_vendas_pdvs'::regclass AND contype = 'f'
+    ) THEN
+        RAISE EXCEPTION 'public.uniplus_vendas_pdvs tem views ou chaves estrangeiras dependentes';
+    END IF;
+
+    -- Definições dos índices e constraints antes de renomear
+    FOR r IN
+        SELECT pg_get_indexdef(i.indexrelid) AS def, i.indisunique,
+               EXISTS (
+                   SELECT 1
+                   FROM unnest(i.indkey::int2[]) k
+                   JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k
+                   WHERE a.attname = 'emissao'
+               ) AS has_column
+        FROM pg_index i
+        WHERE i.indrelid = 'public.uniplus_vendas_pdvs'::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+    LOOP
+        IF r.indisunique AND NOT r.has_column THEN
+            RAISE EXCEPTION 'Índice único sem emissao: %', r.def;
+        ELSE
+            ddl := ddl || r.def;
+        END IF;
+    END LOOP;
+
+    FOR r IN
+        SELECT c.conname, pg_get_constraintdef(c.oid) AS def,
+               EXISTS (
+                   SELECT 1
+                   FROM unnest(c.conkey) k
+                   JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k
+                   WHERE a.attname = 'emissao'
+               ) AS has_column
+        FROM pg_constraint c
+        WHERE c.conrelid = 'public.uniplus_vendas_pdvs'::regclass
+          AND c.contype IN ('p', 'u')
+    LOOP
+        IF NOT r.has_column THEN
+            RAISE EXCEPTION 'Constraint sem emissao: % %', r.conname, r.def;
+        ELSE
+            ddl := ddl || format('ALTER TABLE public.uniplus_vendas_pdvs ADD CONSTRAINT %I %s', r.conname, r.def);
+        END IF;
+    END LOOP;
+
+    ALTER TABLE public.uniplus_vendas_pdvs RENAME TO uniplus_vendas_pdvs_pre_particionamento;
+    CREATE TABLE public.uniplus_vendas_pdvs (
+        LIKE public.uniplus_vendas_pdvs_pre_particionamento INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS
+    ) PARTITION BY RANGE (emissao);
+    CREATE TABLE public.uniplus_vendas_pdvs_default PARTITION OF public.uniplus_vendas_pdvs DEFAULT;
+
+    SELECT date_trunc('month', min(emissao))::date, date_trunc('month', max(emissao))::date
+    INTO mes, ultimo
+    FROM public.uniplus_vendas_pdvs_pre_particionamento;
+    mes := coalesce(mes, date_trunc('month', current_date)::date);
+    ultimo := greatest(coalesce(ultimo, mes), date_trunc('month', current_date)::date);
+    WHILE mes <= ultimo LOOP
+        EXECUTE format(
+            'CREATE TABLE public.%I PARTITION OF public.uniplus_vendas_pdvs FOR VALUES FROM (%L) TO (%L)',
+            'uniplus_vendas_pdvs_p' || to_char(mes, 'YYYYMM'), mes, (mes + interval '1 month')::date
+        );
+        mes := (mes + interval '1 month')::date;
+    END LOOP;
+
+    INSERT INTO public.uniplus_vendas_pdvs SELECT * FROM public.uniplus_vendas_pdvs_pre_particionamento;
+
+    -- Sequências (serial) passam a pertencer à tabela nova: a cópia pode ser removida depois
+    FOR r IN
+        SELECT d.objid::regclass::text AS seq, a.attname
+        FROM pg_depend d
+        JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+        JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+        WHERE d.refobjid = 'public.uniplus_vendas_pdvs_pre_particionamento'::regclass
+          AND d.deptype = 'a'
+    LOOP
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY public.uniplus_vendas_pdvs.%I', r.seq, r.attname);
+    END LOOP;
+
+    -- Os nomes dos índices ficam livres para a tabela nova
+    FOR r IN
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = 'public.uniplus_vendas_pdvs_pre_particionamento'::regclass AND contype IN ('p', 'u')
+    LOOP
+        EXECUTE format('ALTER TABLE public.uniplus_vendas_pdvs_pre_particionamento DROP CONSTRAINT %I', r.conname);
+    END LOOP;
+    FOR r IN
+        SELECT indexrelid::regclass::text AS name FROM pg_index
+        WHERE indrelid = 'public.uniplus_vendas_pdvs_pre_particionamento'::regclass
+    LOOP
+        EXECUTE format('DROP INDEX %s', r.name);
+    END LOOP;
+
+    -- Índices criados depois da cópia: mais rápido e já propagados às partições
+    FOREACH stmt IN ARRAY ddl LOOP
+        EXECUTE stmt;
+    END LOOP;
+    ANALYZE public.uniplus_vendas_pdvs;
+END
+$$;
@@ -0,0 +1,43 @@
+-- Várias lojas (UNICO_STORES): a chave única passa a incluir a filial, para que
+-- cada loja carregue a mesma tabela sem conflitar com as demais.
+-- Remove constraints/índices únicos antigos sem filial e cria o novo índice.
+DO $$
+DECLARE
+    r record;
+BEGIN
+    FOR r IN
+        SELECT c.conname
+        FROM pg_constraint c
+        WHERE c.conrelid = 'public.uniplus_vendas_pdvs'::regclass
+          AND c.contype = 'u'
+          AND NOT EXISTS (
+              SELECT 1
+              FROM unnest(c.conkey) k
+              JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k
+              WHERE a.attname = 'filial'
+          )
+    LOOP
+        EXECUTE format('ALTER TABLE public.uniplus_vendas_pdvs DROP CONSTRAINT %I', r.conname);
+    END LOOP;
+
+    FOR r IN
+        SELECT i.indexrelid::regclass::text AS index_name
+        FROM pg_index i
+        WHERE i.indrelid = 'public.uniplus_vendas_pdvs'::regclass
+          AND i.indisunique
+          AND NOT i.indisprimary
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+          AND NOT EXISTS (
+              SELECT 1
+              FROM unnest(i.indkey::int2[]) k
+              JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k
+              WHERE a.attname = 'filial'
+          )
+    LOOP
+        EXECUTE format('DROP INDEX %s', r.index_name);
+    END LOOP;
+END
+$$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_uniplus_vendas_pdvs_filial
+    ON public.uniplus_vendas_pdvs (filial, emissao, hora, documento, v_liquido);
@@ -15,7 +15,7 @@ SELECT
     -- Identificação
     -- =========================
     'Geral' AS local_estoque,
-    1 AS filial,
+    %(filial)s::integer AS filial,
     CASE
         WHEN m.tipodocumento::text IN ('2', '3') THEN n.numeronotafiscal::text
         WHEN m.tipodocumento::text IN ('1') THEN o.serienfce::text || '/' || o.numeronfce::text
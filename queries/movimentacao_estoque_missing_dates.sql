@@ -1,6 +1,11 @@
+-- Faixa em datahora (em vez de DATE(datahora)): usa o índice e, com a tabela
+-- particionada, só lê a partição do mês de cada data
 SELECT DISTINCT cs."date"
 FROM company_schedule cs
-LEFT JOIN movimentacao_estoque me ON DATE(me.datahora) = cs."date"
-WHERE me.datahora IS NULL
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM movimentacao_estoque me
+    WHERE me.datahora >= cs."date"
+      AND me.datahora < cs."date" + 1
+)
 ORDER BY cs."date";
-
@@ -0,0 +1,20 @@
+-- NFes cujo XML atual (arquivo_xml_hash) ainda não foi lido: sem registro em
+-- fato_nfe_itens_status (ok, vazio ou com erro) nem itens em fato_nfe_itens.
+-- Um XML novo para a mesma chave (hash diferente) volta a ficar pendente.
+SELECT DISTINCT r.chave, r.arquivo_xml_hash
+FROM report_uniplus_notas_fiscais r
+WHERE r.arquivo_xml_hash IS NOT NULL
+  AND r.chave IS NOT NULL
+  AND NOT EXISTS (
+      SELECT 1
+      FROM fato_nfe_itens_status s
+      WHERE s.chave = r.chave
+        AND s.arquivo_xml_hash = r.arquivo_xml_hash
+  )
+  AND NOT EXISTS (
+      SELECT 1
+      FROM fato_nfe_itens i
+      WHERE i.chave = r.chave
+        AND i.arquivo_xml_hash = r.arquivo_xml_hash
+  )
+ORDER BY r.chave
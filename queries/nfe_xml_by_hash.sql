@@ -0,0 +1,7 @@
+-- XMLs ainda ausentes do nfe_xml_blobs: só estes atravessam a rede
+SELECT DISTINCT ON (md5(df.arquivoxml))
+    md5(df.arquivoxml) AS hash,
+    df.arquivoxml
+FROM documentofiscalfornecedor df
+WHERE df.chaveacesso = ANY(%(chaves)s)
+  AND md5(df.arquivoxml) = ANY(%(hashes)s)
@@ -0,0 +1,30 @@
+-- Estado leve de cada NFe na origem (sem arquivoxml), usado pelo modo incremental
+-- para descobrir NFes novas ou com situação/manifestação/status/data_inclusao/XML alterados.
+-- Mesmos CASEs de notas_fiscais.sql, para comparar com o destino já transformado.
+SELECT
+    df.chaveacesso AS chave,
+    CASE 
+        WHEN df.situacaonfe = 1 THEN 'autorizada'
+        WHEN df.situacaonfe = 3 THEN 'cancelada'
+        ELSE 'nao_autorizada'
+    END AS situacao,
+    df.situacaomanifestacao AS manifestacao,
+    CASE 
+        WHEN df.situacaodocumentofiscal = 1 THEN 'pendente_processamento'
+        WHEN df.situacaodocumentofiscal = 2 THEN 'importacao_pendente'
+        WHEN df.situacaodocumentofiscal = 3 THEN 'liberacao_pendente'
+        WHEN df.situacaodocumentofiscal = 4 THEN 'xml_importado'
+        WHEN df.situacaodocumentofiscal = 5 THEN 'exclusao_pendente'
+        WHEN df.situacaodocumentofiscal = 6 THEN 'cancelada_pelo_fornecedor'
+        WHEN df.situacaodocumentofiscal = 8 THEN 'entrada_fornecedor'
+        ELSE 'desconhecida'
+    END AS status,
+    n.datainclusao AS data_inclusao,
+    -- Tamanho lido do cabeçalho TOAST, sem descompactar o XML
+    octet_length(df.arquivoxml) AS xml_tamanho
+FROM  
+    documentofiscalfornecedor df 
+LEFT JOIN notafiscal n
+    ON df.chaveacesso = n.chavenfe AND n.tipodocumento = 'E'
+ORDER BY  
+    df.emissao DESC
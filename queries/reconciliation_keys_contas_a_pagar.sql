@@ -0,0 +1,11 @@
+-- Chaves de contas_a_pagar (unique_columns) calculadas na origem,
+-- com os mesmos aliases e tipos da tabela de destino.
+SELECT
+    f.tipo::text AS tipo,
+    split_part(f.documento, '/', 1) AS documento,
+    f.idorigem::bigint AS id_origem,
+    f.parcela::integer AS parcela,
+    f.vencimentooriginal::date AS vencimento_original,
+    f.registro::timestamp AS registro
+FROM financeiro f
+WHERE f.tipo = 'P'
@@ -0,0 +1,32 @@
+-- Chaves de movimentacao_estoque (unique_columns) calculadas na origem.
+-- Mesmas regras de documento/tipo_movimentacao da query de extração, sem os
+-- joins de notafiscalitem/item, que não participam da chave.
+-- qtd e valortotal entram nas somas do fingerprint de divergências.
+SELECT
+    m.datahora::timestamp AS datahora,
+    p.codigo::text AS codigo,
+    CASE
+        WHEN m.tipodocumento::text IN ('2', '3') THEN n.numeronotafiscal::text
+        WHEN m.tipodocumento::text IN ('1') THEN o.serienfce::text || '/' || o.numeronfce::text
+        ELSE NULL
+    END AS documento,
+    m.tipodocumento::integer AS tipodocumento,
+    CASE
+        WHEN m.tipodocumento::text IN ('2', '3') THEN 'E'
+        WHEN m.tipodocumento::text IN ('1') THEN 'S'
+        ELSE NULL
+    END AS tipo_movimentacao,
+    m.currenttimemillis::bigint AS currenttimemillis,
+    CASE
+        WHEN m.quantidadeentrada IS NULL OR m.quantidadeentrada = 0 THEN m.quantidadesaida
+        ELSE m.quantidadeentrada
+    END AS qtd,
+    m.valortotal
+FROM public.movimentoestoque m
+INNER JOIN public.produto p
+    ON p.id::text = m.idproduto::text
+LEFT JOIN public.operacao o
+    ON m.idoriginal = o.id
+LEFT JOIN public.notafiscal n
+    ON m.idoriginal = n.id
+WHERE m.cancelado = 0
@@ -0,0 +1,12 @@
+-- Chaves de uniplus_vendas_pdvs (unique_columns) calculadas na origem.
+-- Mesmas regras do VendasDailyETL.transform_data e mesmos tipos do destino,
+-- para que o texto canônico da chave seja idêntico nos dois lados.
+-- canc entra no fingerprint de divergências (cancelamentos após a carga).
+SELECT
+    m2.data::date AS emissao,
+    m2.horainicial::timestamp AS hora,
+    coalesce(m2.serienfce::text, 'None') || '/' || coalesce(m2.numeronfce::text, 'None') AS documento,
+    m2.valorliquido::numeric(18,2) AS v_liquido,
+    CASE m2.cancelado WHEN 0 THEN 'Não' WHEN 1 THEN 'Sim' END AS canc
+FROM operacao m2
+WHERE m2.tipo = 1
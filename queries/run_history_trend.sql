@@ -0,0 +1,18 @@
+-- Tendência de desempenho por job e etapa (ex.: p95 do load de movimentacao_estoque em 30 dias)
+SELECT
+    job,
+    stage,
+    COUNT(*) AS execucoes,
+    ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_s)::numeric, 3) AS p50_s,
+    ROUND(percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_s)::numeric, 3) AS p95_s,
+    MAX(duration_s) AS max_s,
+    ROUND(AVG(rows)) AS avg_rows,
+    ROUND(SUM(rows) / NULLIF(SUM(duration_s), 0)) AS rows_per_s,
+    MAX(peak_memory_mb) AS max_peak_memory_mb,
+    SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) AS falhas
+FROM etl_run_history
+WHERE started_at >= now() - make_interval(days => %(days)s)
+  AND (%(job)s::text IS NULL OR job = %(job)s)
+  AND (%(stage)s::text IS NULL OR stage = %(stage)s)
+GROUP BY job, stage
+ORDER BY job, stage;
@@ -0,0 +1,14 @@
+-- Datas do company_schedule ainda não concluídas para o ETL.
+-- Busca pela PK de etl_sync_ledger, sem varrer a tabela de destino.
+-- Só dias fechados: o dia corrente é carregado pelo intraday.
+SELECT DISTINCT cs."date"
+FROM company_schedule cs
+WHERE cs."date" < current_date
+  AND NOT EXISTS (
+    SELECT 1
+    FROM etl_sync_ledger l
+    WHERE l.etl_name = %(etl_name)s
+      AND l.data = cs."date"
+      AND l.status = %(status)s
+)
+ORDER BY cs."date";
@@ -0,0 +1,15 @@
+-- Inicialização única do ledger com as datas já presentes em movimentacao_estoque
+-- (com várias lojas, apenas as linhas da filial do ledger)
+INSERT INTO etl_sync_ledger (etl_name, data, status, row_count, finished_at)
+SELECT
+    %(etl_name)s,
+    DATE(me.datahora),
+    'done',
+    COUNT(*),
+    now()
+FROM movimentacao_estoque me
+WHERE me.datahora IS NOT NULL
+  AND me.datahora < current_date
+  AND (%(filial)s::text IS NULL OR me.filial::text = %(filial)s::text)
+GROUP BY DATE(me.datahora)
+ON CONFLICT (etl_name, data) DO NOTHING;
@@ -0,0 +1,15 @@
+-- Inicialização única do ledger com as datas já presentes em uniplus_vendas_pdvs
+-- (com várias lojas, apenas as linhas da filial do ledger)
+INSERT INTO etl_sync_ledger (etl_name, data, status, row_count, finished_at)
+SELECT
+    %(etl_name)s,
+    v.emissao,
+    'done',
+    COUNT(*),
+    now()
+FROM uniplus_vendas_pdvs v
+WHERE v.emissao IS NOT NULL
+  AND v.emissao < current_date
+  AND (%(filial)s::text IS NULL OR v.filial::text = %(filial)s::text)
+GROUP BY v.emissao
+ON CONFLICT (etl_name, data) DO NOTHING;
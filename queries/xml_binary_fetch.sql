@@ -1,3 +1,5 @@
-SELECT arquivo_xml 
-FROM report_uniplus_notas_fiscais 
-WHERE chave = %(chave)s 
\ No newline at end of file
+SELECT r.arquivo_xml, b.xml_zlib
+FROM report_uniplus_notas_fiscais r
+LEFT JOIN nfe_xml_blobs b
+    ON b.hash = r.arquivo_xml_hash
+WHERE r.chave = %(chave)s
@@ -0,0 +1,11 @@
+-- Busca em lote dos XMLs: o chamador antepõe a CTE "chaves"
+-- (xml_download_filter.sql ou uma lista explícita de chaves)
+SELECT DISTINCT ON (r.chave)
+    r.chave,
+    r.arquivo_xml,
+    b.xml_zlib
+FROM report_uniplus_notas_fiscais r
+LEFT JOIN nfe_xml_blobs b
+    ON b.hash = r.arquivo_xml_hash
+WHERE r.chave IN (SELECT chave FROM chaves)
+ORDER BY r.chave
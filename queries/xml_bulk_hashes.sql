@@ -0,0 +1,11 @@
+-- Hash do XML atual de cada chave, sem o conteúdo: permite pular os arquivos
+-- já gravados e inalterados (manifest local) antes de buscar qualquer XML.
+-- O chamador antepõe a CTE "chaves", como em xml_bulk_fetch.sql
+SELECT DISTINCT ON (r.chave)
+    r.chave,
+    r.arquivo_xml_hash,
+    r.data_emissao::date AS data_emissao,
+    r.cpnj_cpf
+FROM report_uniplus_notas_fiscais r
+WHERE r.chave IN (SELECT chave FROM chaves)
+ORDER BY r.chave
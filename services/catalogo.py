@@ -1,12 +1,21 @@
 import pandas as pd
 from handlers.db_connection import DatabaseConnection
-from handlers.query_loader import get_etl_query, get_etl_config
+from handlers.query_loader import get_etl_query, get_etl_config, load_query_from_file
 from handlers.log_handler import setup_logger
-from typing import Dict, Optional
+from handlers import transforms
+from handlers.change_feed import RedisChangeFeed, json_value
+from handlers.run_history import stage, frame_bytes
+from settings.db_config import get_redis_config
+from typing import Dict, List, Optional
+
+# Colunas comparadas pelo row_hash (tudo exceto a chave)
+HASH_COLUMNS = ['ean', 'nome', 'nome_pdv', 'preco_ultima_compra', 'preco_venda', 'stock']
 
 class CatalogoETL:
     def __init__(self, source_config: Dict, target_config: Dict):
-        self.source_connection = DatabaseConnection(source_config)
+        self.source_connection = DatabaseConnection(
+            source_config, query_class=get_etl_config('catalogo').get('query_class', 'light')
+        )
         self.target_connection = DatabaseConnection(target_config)
         self.logger = setup_logger("catalogo_etl", log_file="logs/catalogo_etl.log")
         
@@ -27,22 +36,17 @@ class CatalogoETL:
             df = df.rename(columns=column_mapping)
             
             text_columns = ['sku', 'ean', 'nome', 'nome_pdv']
-            for col in text_columns:
-                if col in df.columns:
-                    df[col] = df[col].astype(str)
-                    df.loc[df[col] == 'None', col] = None
+            transforms.normalize_text(df, text_columns)
             
             numeric_columns = ['preco_venda', 'preco_ultima_compra', 'stock']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
+            transforms.to_numeric(df, numeric_columns)
             
             columns = [
                 'sku', 'ean', 'nome', 'nome_pdv', 
                 'preco_ultima_compra', 'preco_venda', 'stock'
             ]
             
-            return df[columns]
+            return transforms.project_columns(df, columns)
             
         except Exception as e:
             self.logger.error(f"Error during transformation: {str(e)}")
@@ -77,7 +81,8 @@ class CatalogoETL:
             self.target_connection.insert_batch(
                 table_name=table_name,
                 data=df,
-                schema=schema
+                schema=schema,
+                batch_size=config.get('load_batch_size', 1000)
             )
             
             self.logger.info("Data load completed successfully")
@@ -86,20 +91,219 @@ class CatalogoETL:
             self.logger.error(f"Error during data load: {str(e)}")
             raise
 
-    def run_etl(self) -> None:
+    @staticmethod
+    def row_hashes(df: pd.DataFrame) -> pd.Series:
+        """
+        Per-SKU hash of HASH_COLUMNS (hex), computed on the text rendering of
+        the values so it does not depend on the dtypes of a given extraction.
+        """
+        canonical = df[HASH_COLUMNS].astype('str').fillna('')
+        hashes = pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+        return pd.Series([f"{h:016x}" for h in hashes], index=df.index)
+
+    def _ensure_row_hash(self, config: Dict) -> None:
+        self.target_connection.execute(load_query_from_file(config['row_hash_ddl_file']))
+
+    def compute_delta(self, df: pd.DataFrame, target_state: pd.DataFrame) -> Dict:
+        """
+        Diff the extracted catalog against the stored row hashes, in memory.
+
+        Args:
+            df: Transformed catalog with row_hash
+            target_state: sku/row_hash currently in the target
+
+        Returns:
+            Dictionary with 'inserts' and 'updates' (DataFrames to write),
+            'deletes' (SKUs no longer active in the source) and 'unchanged' (count)
+        """
+        current = pd.Series(target_state['row_hash'].to_numpy(), index=target_state['sku']) \
+            if not target_state.empty else pd.Series(dtype='str')
+        current = current[~current.index.duplicated()]
+
+        stored = current.reindex(df['sku']).to_numpy()
+        is_new = ~df['sku'].isin(current.index).to_numpy()
+        is_changed = ~is_new & (stored != df['row_hash'].to_numpy())
+
+        return {
+            'inserts': df[is_new],
+            'updates': df[is_changed],
+            'deletes': current.index.difference(df['sku']).tolist(),
+            'unchanged': int((~is_new & ~is_changed).sum()),
+        }
+
+    def apply_delta(self, delta: Dict) -> None:
+        """
+        Write only the delta in one transaction: DELETE the updated and removed
+        SKUs, then INSERT the new versions and the new SKUs.
+        """
+        config = get_etl_config('catalogo')
+        table_name = config.get('table', 'catalogo')
+        schema = config.get('schema', 'public')
+
+        to_delete = delta['deletes'] + delta['updates']['sku'].tolist()
+        to_write = pd.concat([delta['inserts'], delta['updates']])
+
+        with self.target_connection.transaction() as cursor:
+            if to_delete:
+                cursor.execute(
+                    f"DELETE FROM {schema}.{table_name} WHERE sku = ANY(%(skus)s)",
+                    {'skus': to_delete}
+                )
+            self.target_connection.insert_rows(cursor, table_name, to_write, schema=schema,
+                                               batch_size=config.get('load_batch_size', 1000))
+
+    @staticmethod
+    def build_change_events(delta: Dict, old_rows: pd.DataFrame) -> List[Dict]:
+        """
+        Compact change events for the delta: sku, ean, changed fields and their
+        old/new values (all HASH_COLUMNS for inserts and deletes). Updates
+        where no HASH_COLUMNS value differs produce no event.
+        """
+        old = old_rows.drop_duplicates(subset=['sku']).set_index('sku') if not old_rows.empty else pd.DataFrame()
+        events = []
+
+        for row in delta['inserts'].to_dict('records'):
+            new = {col: json_value(row[col]) for col in HASH_COLUMNS}
+            events.append({'op': 'insert', 'sku': row['sku'], 'ean': row['ean'],
+                           'changed': HASH_COLUMNS, 'old': {}, 'new': new})
+
+        for row in delta['updates'].to_dict('records'):
+            previous = old.loc[row['sku']].to_dict() if row['sku'] in old.index else {}
+            changed = [
+                col for col in HASH_COLUMNS
+                if json_value(previous.get(col)) != json_value(row[col])
+            ]
+            # Só o row_hash mudou (coluna recém-criada ou outro formato de hash)
+            if not changed:
+                continue
+            events.append({
+                'op': 'update', 'sku': row['sku'], 'ean': row['ean'], 'changed': changed,
+                'old': {col: json_value(previous.get(col)) for col in changed},
+                'new': {col: json_value(row[col]) for col in changed},
+            })
+
+        for sku in delta['deletes']:
+            previous = old.loc[sku].to_dict() if sku in old.index else {}
+            events.append({
+                'op': 'delete', 'sku': sku, 'ean': previous.get('ean'), 'changed': HASH_COLUMNS,
+                'old': {col: json_value(previous.get(col)) for col in HASH_COLUMNS}, 'new': {},
+            })
+        return events
+
+    def publish_changes(self, delta: Dict, old_rows: pd.DataFrame) -> int:
+        """
+        Publish the delta to the configured Redis stream. A feed failure is logged
+        and does not fail the sync (the catalog itself is already committed).
+        """
+        feed_config = get_etl_config('catalogo').get('change_feed', {})
+        events = self.build_change_events(delta, old_rows)
+        if not events:
+            return 0
+        try:
+            feed = RedisChangeFeed(
+                get_redis_config(),
+                stream=feed_config.get('stream', 'catalogo:changes'),
+                maxlen=feed_config.get('maxlen', 100000),
+                batch_size=feed_config.get('batch_size', 500)
+            )
+            return feed.publish(events)
+        except Exception as e:
+            self.logger.error(f"Error publishing catalog changes: {str(e)}")
+            return 0
+
+    def run_diff_sync(self, df: pd.DataFrame) -> Dict[str, int]:
+        """
+        Differential sync: only inserted, changed and deactivated SKUs are written
+        """
+        config = get_etl_config('catalogo')
+        table_name = config.get('table', 'catalogo')
+        schema = config.get('schema', 'public')
+        self._ensure_row_hash(config)
+
+        # Sem sku não há chave para comparar (NaN iria para o DELETE ... ANY como float)
+        missing_sku = df['sku'].isna()
+        if missing_sku.any():
+            self.logger.warning(f"Ignoring {int(missing_sku.sum())} source rows without SKU")
+            df = df[~missing_sku]
+        # catalogo.sql já agrega o saldo por produto e ordena: sobra só produto com código repetido
+        duplicated = df['sku'].duplicated(keep='first')
+        if duplicated.any():
+            self.logger.warning(f"Ignoring {int(duplicated.sum())} duplicated SKUs in source")
+            df = df[~duplicated]
+        df = df.assign(row_hash=self.row_hashes(df))
+
+        with stage('compare') as counters:
+            target_state = self.target_connection.get_data(
+                f"SELECT sku, row_hash FROM {schema}.{table_name} WHERE sku IS NOT NULL"
+            )
+            delta = self.compute_delta(df, target_state)
+            counters['rows'] = len(target_state)
+        
+        # Valores anteriores só dos SKUs alterados/removidos, para o change feed
+        feed_enabled = config.get('change_feed', {}).get('enabled', False)
+        old_rows = pd.DataFrame()
+        changed_skus = delta['updates']['sku'].tolist() + delta['deletes']
+        if feed_enabled and changed_skus:
+            old_rows = self.target_connection.get_data(
+                f"SELECT sku, {', '.join(HASH_COLUMNS)} FROM {schema}.{table_name} WHERE sku = ANY(%(skus)s)",
+                {'skus': changed_skus}
+            )
+        
+        with stage('load') as counters:
+            self.apply_delta(delta)
+            counters['rows'] = len(delta['inserts']) + len(delta['updates']) + len(delta['deletes'])
+
+        counts = {
+            'processed': len(delta['inserts']) + len(delta['updates']) + len(delta['deletes']),
+            'inserted': len(delta['inserts']),
+            'updated': len(delta['updates']),
+            'deleted': len(delta['deletes']),
+            'unchanged': delta['unchanged'],
+        }
+        if feed_enabled:
+            with stage('publish') as counters:
+                counts['events_published'] = self.publish_changes(delta, old_rows)
+                counters['rows'] = counts['events_published']
+        self.logger.info(f"Catalog diff applied: {counts}")
+        return counts
+
+    def plan(self) -> Dict:
+        """
+        Planner's row estimate of the catalog extraction, without extracting
+        """
+        return {
+            "mode": get_etl_config('catalogo').get('sync_mode', 'full'),
+            "estimated_rows": self.source_connection.estimate_rows(get_etl_query('catalogo')),
+        }
+
+    def run_etl(self) -> Optional[Dict[str, int]]:
         try:
             self.logger.info("Starting catalog ETL process")
             
-            raw_data = self.extract_data()
+            with stage('extract') as counters:
+                raw_data = self.extract_data()
+                counters['rows'] = len(raw_data)
+                counters['bytes'] = frame_bytes(raw_data)
             
             if raw_data.empty:
+                # Origem vazia não apaga o catálogo inteiro no modo diff
                 self.logger.warning("No data found in source")
-                return
+                return {"processed": 0}
+            
+            with stage('transform') as counters:
+                transformed_data = self.transform_data(raw_data)
+                counters['rows'] = len(transformed_data)
+            
+            if get_etl_config('catalogo').get('sync_mode', 'full') == 'diff':
+                return self.run_diff_sync(transformed_data)
             
-            transformed_data = self.transform_data(raw_data)
-            self.load_data(transformed_data)
+            with stage('load') as counters:
+                counters['rows'] = len(transformed_data)
+                counters['bytes'] = frame_bytes(transformed_data)
+                self.load_data(transformed_data)
             
             self.logger.info("ETL process completed successfully")
+            return {"processed": len(transformed_data)}
             
         except Exception as e:
             self.logger.error(f"ETL process failed: {str(e)}")
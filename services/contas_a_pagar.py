@@ -1,15 +1,24 @@
 import pandas as pd
 from handlers.db_connection import DatabaseConnection
-from handlers.query_loader import get_etl_query, get_etl_config
+from handlers.query_loader import get_etl_query, get_etl_config, load_query_from_file
 from handlers.log_handler import setup_logger
+from handlers import transforms
+from handlers.watermark import WatermarkStore
+from handlers.reconciliation import KeySetReconciler
+from handlers.run_history import stage, frame_bytes
 from typing import Dict, Optional
+from datetime import datetime, timedelta
 
 
 class ContasAPagarETL:
     def __init__(self, source_config: Dict, target_config: Dict):
-        self.source_connection = DatabaseConnection(source_config)
+        self.source_connection = DatabaseConnection(
+            source_config, query_class=get_etl_config('contas_a_pagar').get('query_class', 'light')
+        )
         self.target_connection = DatabaseConnection(target_config)
         self.logger = setup_logger("contas_a_pagar_etl", log_file="logs/contas_a_pagar_etl.log")
+        self.watermarks = WatermarkStore(self.target_connection)
+        self.reconciler = KeySetReconciler(self.source_connection, self.target_connection, "contas_a_pagar")
 
     def transform_data(self, df: pd.DataFrame) -> pd.DataFrame:
         try:
@@ -20,13 +29,10 @@ class ContasAPagarETL:
 
             # Campos numéricos
             numeric_columns = ["valor", "saldo"]
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors="coerce")
+            transforms.to_numeric(df, numeric_columns)
 
             # Campo inteiro (parcela)
-            if "parcela" in df.columns:
-                df["parcela"] = pd.to_numeric(df["parcela"], errors="coerce").astype("Int64")
+            transforms.to_numeric(df, ["parcela"], dtype="Int64")
 
             # id_origem pode ser bigint - tratar valores muito grandes
             if "id_origem" in df.columns:
@@ -44,15 +50,10 @@ class ContasAPagarETL:
                 "pagamento",
                 "baixa",
             ]
-            for col in date_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors="coerce")
-                    mask = pd.notna(df[col])
-                    df.loc[mask, col] = df.loc[mask, col].dt.date
+            transforms.parse_datetimes(df, date_columns, as_date=True)
 
             # Timestamp (registro)
-            if "registro" in df.columns:
-                df["registro"] = pd.to_datetime(df["registro"], errors="coerce")
+            transforms.parse_datetimes(df, ["registro"])
 
             # Campos de texto: normalizar strings e None
             text_columns = [
@@ -64,10 +65,7 @@ class ContasAPagarETL:
                 "codigo_barras",
                 "codigo_digitado",
             ]
-            for col in text_columns:
-                if col in df.columns:
-                    df[col] = df[col].astype(str)
-                    df.loc[df[col] == "None", col] = None
+            transforms.normalize_text(df, text_columns)
 
             # Garantir presença e ordem das colunas da tabela de destino
             columns = [
@@ -91,32 +89,68 @@ class ContasAPagarETL:
                 "codigo_digitado",
             ]
 
-            existing_columns = [c for c in columns if c in df.columns]
-            result = df[existing_columns]
-
-            # Limpeza final de NaT
-            for col in result.columns:
-                if str(result[col].dtype).startswith("datetime64"):
-                    result[col] = result[col].replace({pd.NaT: None})
-
-            return result
+            return transforms.project_columns(df, columns)
 
         except Exception as e:
             self.logger.error(f"Erro na transformação: {str(e)}")
             raise
 
-    def extract_data(self) -> pd.DataFrame:
+    def _should_run_full_sync(self, state: Dict) -> bool:
+        """
+        Full reconciliation when incremental mode is off, there is no watermark yet
+        or the last full sync is older than full_sync_interval_hours.
+        """
+        config = get_etl_config("contas_a_pagar")
+        if not config.get("incremental", False) or state["watermark"] is None:
+            return True
+        if state["last_full_sync"] is None:
+            return True
+        interval = timedelta(hours=config.get("full_sync_interval_hours", 168))
+        return datetime.now() - state["last_full_sync"] >= interval
+
+    def _compute_watermark(self, df: pd.DataFrame, started_at: datetime) -> Optional[datetime]:
+        """
+        Next watermark: latest registro/baixa/pagamento seen in the extraction,
+        capped at the start of the run (pagamentos agendados podem ter data futura)
+        and pulled back by watermark_overlap_hours as a safety margin.
+        """
+        config = get_etl_config("contas_a_pagar")
+        columns = [col for col in ("registro", "baixa", "pagamento") if col in df.columns]
+        if df.empty or not columns:
+            return None
+
+        latest = max(
+            (pd.to_datetime(df[col], format="ISO8601", errors="coerce").max() for col in columns),
+            key=lambda value: value if pd.notna(value) else pd.Timestamp.min,
+        )
+        if pd.isna(latest):
+            return None
+
+        overlap = timedelta(hours=config.get("watermark_overlap_hours", 24))
+        return min(latest.to_pydatetime(), started_at) - overlap
+
+    def extract_data(self, watermark: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Extract contas a pagar. Without a watermark, reads every title (full);
+        with a watermark, only titles registered, settled or paid since then.
+        """
         try:
-            self.logger.info("Iniciando extração de dados de contas_a_pagar")
-            query = get_etl_query("contas_a_pagar")
-            result = self.source_connection.get_data(query)
+            if watermark is None:
+                self.logger.info("Iniciando extração de dados de contas_a_pagar")
+                query = get_etl_query("contas_a_pagar")
+                result = self.source_connection.get_data(query)
+            else:
+                self.logger.info(f"Iniciando extração incremental de contas_a_pagar desde {watermark}")
+                config = get_etl_config("contas_a_pagar")
+                query = load_query_from_file(config["incremental_query"])
+                result = self.source_connection.get_data(query, {"watermark": watermark})
             self.logger.info(f"Extraídos {len(result)} registros")
             return result
         except Exception as e:
             self.logger.error(f"Erro na extração: {str(e)}")
             raise
 
-    def load_data(self, df: pd.DataFrame) -> None:
+    def load_data(self, df: pd.DataFrame, watermark: Optional[datetime] = None, full_sync: bool = False) -> None:
         try:
             self.logger.info(f"Carregando {len(df)} registros com UPSERT")
             config = get_etl_config("contas_a_pagar")
@@ -134,32 +168,96 @@ class ContasAPagarETL:
                 ],
             )
 
-            self.target_connection.upsert(
-                table_name=table_name,
-                data=df,
-                unique_columns=unique_columns,
-                schema=schema,
-            )
+            # UPSERT e avanço do watermark na mesma transação
+            with self.target_connection.transaction() as cursor:
+                self.target_connection.upsert_rows(
+                    cursor,
+                    table_name=table_name,
+                    data=df,
+                    unique_columns=unique_columns,
+                    schema=schema,
+                    batch_size=config.get("load_batch_size", 1000),
+                )
+                if config.get("incremental", False):
+                    self.watermarks.set("contas_a_pagar", watermark, full_sync=full_sync, cursor=cursor)
 
             self.logger.info("UPSERT concluído com sucesso")
         except Exception as e:
             self.logger.error(f"Erro no carregamento (UPSERT): {str(e)}")
             raise
 
-    def run_etl(self) -> dict:
+    def plan(self, full_sync: bool = False) -> dict:
+        """
+        Extraction mode a run would use and the planner's row estimate of its
+        query, without extracting
+        """
+        incremental = get_etl_config("contas_a_pagar").get("incremental", False)
+        state = self.watermarks.get("contas_a_pagar") if incremental else {"watermark": None, "last_full_sync": None}
+        full_sync = full_sync or self._should_run_full_sync(state)
+        if full_sync:
+            estimated = self.source_connection.estimate_rows(get_etl_query("contas_a_pagar"))
+        else:
+            query = load_query_from_file(get_etl_config("contas_a_pagar")["incremental_query"])
+            estimated = self.source_connection.estimate_rows(query, {"watermark": state["watermark"]})
+        return {
+            "mode": "full" if full_sync else "incremental",
+            "watermark": None if full_sync else str(state["watermark"]),
+            "estimated_rows": estimated,
+        }
+
+    def run_etl(self, full_sync: bool = False) -> dict:
+        """
+        Run the ETL. In incremental mode only titles changed since the stored
+        watermark are extracted; a full reconciliation runs when forced, when
+        there is no watermark yet or every full_sync_interval_hours.
+
+        Args:
+            full_sync: Force a full extraction
+        """
         try:
             self.logger.info("Iniciando processo ETL de contas_a_pagar")
-            raw = self.extract_data()
+            started_at = datetime.now()
+            incremental = get_etl_config("contas_a_pagar").get("incremental", False)
+
+            state = self.watermarks.get("contas_a_pagar") if incremental else {"watermark": None, "last_full_sync": None}
+            full_sync = full_sync or self._should_run_full_sync(state)
+            mode = "full" if full_sync else "incremental"
+            self.logger.info(f"Modo de extração: {mode}")
+
+            with stage("extract") as counters:
+                raw = self.extract_data(None if full_sync else state["watermark"])
+                counters["rows"] = len(raw)
+                counters["bytes"] = frame_bytes(raw)
             if raw.empty:
                 self.logger.warning("Nenhum dado retornado da origem")
-                return {"processed": 0}
+                if incremental and full_sync:
+                    self.watermarks.set("contas_a_pagar", None, full_sync=True)
+                return {"processed": 0, "mode": mode}
+
+            # Calculado antes do transform, que altera o DataFrame in place
+            watermark = self._compute_watermark(raw, started_at)
 
-            transformed = self.transform_data(raw)
-            self.load_data(transformed)
+            with stage("transform") as counters:
+                transformed = self.transform_data(raw)
+                counters["rows"] = len(transformed)
+            with stage("load") as counters:
+                counters["rows"] = len(transformed)
+                counters["bytes"] = frame_bytes(transformed)
+                self.load_data(transformed, watermark, full_sync=full_sync)
             self.logger.info(f"ETL concluído. Processados {len(transformed)} registros.")
-            return {"processed": len(transformed)}
+            return {"processed": len(transformed), "mode": mode}
         except Exception as e:
             self.logger.error(f"Falha no ETL: {str(e)}")
             raise
 
-
+    def reconcile_deletions(self, dry_run: bool = False) -> dict:
+        """
+        Delete titles removed from the source (key-set fingerprints per id_origem
+        range, see KeySetReconciler). Neither the UPSERT nor the incremental
+        extraction ever removes a title from the target.
+        """
+        try:
+            return self.reconciler.reconcile(dry_run=dry_run)
+        except Exception as e:
+            self.logger.error(f"Erro na reconciliação de exclusões: {str(e)}")
+            raise
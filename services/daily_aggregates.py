@@ -0,0 +1,82 @@
+from handlers.db_connection import DatabaseConnection
+from handlers.query_loader import get_etl_config, load_query_from_file
+from handlers.log_handler import setup_logger
+from typing import Dict, List
+
+
+class DailyAggregatesETL:
+    """
+    Post-load stage that rebuilds the daily fact tables (fato_*) only for the
+    dates touched by the current run. Runs entirely inside the target database.
+    """
+
+    def __init__(self, target_config: Dict):
+        self.target_connection = DatabaseConnection(target_config)
+        self.logger = setup_logger("daily_aggregates_etl", log_file="logs/daily_aggregates_etl.log")
+        self._ensured_tables = set()
+
+    def _ensure_table(self, aggregate_name: str, config: Dict) -> None:
+        ddl_file = config.get('ddl_file')
+        if not ddl_file or aggregate_name in self._ensured_tables:
+            return
+        self.target_connection.execute(load_query_from_file(ddl_file))
+        self._ensured_tables.add(aggregate_name)
+
+    def refresh_aggregate(self, aggregate_name: str, dates: List[str]) -> int:
+        """
+        Recompute one daily fact table for the given dates (DELETE + INSERT in one transaction)
+
+        Args:
+            aggregate_name: Aggregate entry in config_etl.json (e.g. 'vendas_diarias')
+            dates: Dates to recompute (format: 'YYYY-MM-DD')
+
+        Returns:
+            Number of aggregated rows inserted
+        """
+        config = get_etl_config(aggregate_name)
+        table_name = config.get('table')
+        schema = config.get('schema', 'public')
+        date_column = config.get('date_column', 'data')
+        query = load_query_from_file(config['aggregate_query'])
+
+        self._ensure_table(aggregate_name, config)
+
+        params = {'datas': list(dates)}
+        with self.target_connection.transaction() as cursor:
+            cursor.execute(
+                f"DELETE FROM {schema}.{table_name} WHERE {date_column} = ANY(%(datas)s::date[])",
+                params
+            )
+            cursor.execute(query, params)
+            inserted = cursor.rowcount
+
+        self.logger.info(f"{schema}.{table_name}: {inserted} linhas agregadas para {len(dates)} datas")
+        return inserted
+
+    def refresh(self, etl_name: str, dates: List[str]) -> Dict:
+        """
+        Recompute every aggregate declared under 'aggregates' for an ETL
+
+        Args:
+            etl_name: ETL whose load feeds the aggregates (e.g. 'vendas_daily')
+            dates: Dates loaded by the ETL in this run
+
+        Returns:
+            Summary with inserted rows per aggregate and failures
+        """
+        aggregates = get_etl_config(etl_name).get('aggregates', [])
+        summary = {"rows": {}, "failed": []}
+
+        if not aggregates or not dates:
+            return summary
+
+        self.logger.info(f"Atualizando agregados {aggregates} de {etl_name} para {len(dates)} datas")
+
+        for aggregate_name in aggregates:
+            try:
+                summary["rows"][aggregate_name] = self.refresh_aggregate(aggregate_name, dates)
+            except Exception as e:
+                summary["failed"].append({"aggregate": aggregate_name, "error": str(e)})
+                self.logger.error(f"Falha ao atualizar agregado {aggregate_name}: {str(e)}")
+
+        return summary
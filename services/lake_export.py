@@ -0,0 +1,157 @@
+import os
+import json
+import threading
+import pandas as pd
+from datetime import datetime
+from handlers.db_connection import DatabaseConnection
+from handlers.query_loader import get_etl_config
+from handlers.log_handler import setup_logger
+from typing import Dict, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # sem pyarrow: exportação desativada
+    pa = pq = None
+
+# Vendas e estoque podem exportar ao mesmo tempo: o manifesto é um arquivo só
+_manifest_lock = threading.Lock()
+
+
+class LakeExportETL:
+    """
+    Post-load stage that copies the days changed in a run from a target table
+    to date-partitioned Parquet files, for analytics with DuckDB/pandas
+    without querying the cloud database:
+
+        <folder>/<table>/data=YYYY-MM-DD/part-0.parquet
+
+    String columns are dictionary-encoded and column statistics are written.
+    A day that no longer has rows has its partition removed. <folder>/manifest.json
+    lists, per table, each partition's rows, size and export time.
+
+    Configured by the "lake_export" block (off by default) and, per ETL, a
+    "lake_export" entry with the day expression of its table (e.g.
+    {"date_expression": "emissao"}). Needs pyarrow (optional dependency);
+    without it the export is skipped.
+    """
+
+    def __init__(self, target_config: Dict):
+        self.target_connection = DatabaseConnection(target_config)
+        self.config = get_etl_config('lake_export')
+        self.folder = self.config.get('folder', 'lake')
+        self.logger = setup_logger("lake_export", log_file="logs/lake_export.log")
+        if self.config.get('enabled', False) and pq is None:
+            self.logger.warning("pyarrow não instalado - exportação para o lake desativada")
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.get('enabled', False) and pq is not None
+
+    def _partition_dir(self, table: str, date: str) -> str:
+        return os.path.join(self.folder, table, f"data={date}")
+
+    def _write_partition(self, df: pd.DataFrame, table: str, date: str) -> Dict:
+        partition_dir = self._partition_dir(table, date)
+        path = os.path.join(partition_dir, 'part-0.parquet')
+        os.makedirs(partition_dir, exist_ok=True)
+
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        string_columns = [
+            field.name for field in arrow_table.schema
+            if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+        ]
+        temp_path = f"{path}.tmp"
+        pq.write_table(
+            arrow_table,
+            temp_path,
+            compression=self.config.get('compression', 'zstd'),
+            use_dictionary=string_columns,
+            write_statistics=True,
+            row_group_size=self.config.get('row_group_size', 128 * 1024)
+        )
+        # Troca atômica: quem lê a partição nunca vê o arquivo pela metade
+        os.replace(temp_path, path)
+        return {
+            'path': os.path.relpath(path, self.folder),
+            'rows': len(df),
+            'bytes': os.path.getsize(path),
+            'exported_at': datetime.now().isoformat(timespec='seconds'),
+        }
+
+    def _remove_partition(self, table: str, date: str) -> None:
+        partition_dir = self._partition_dir(table, date)
+        if os.path.isdir(partition_dir):
+            for name in os.listdir(partition_dir):
+                os.remove(os.path.join(partition_dir, name))
+            os.rmdir(partition_dir)
+
+    def _update_manifest(self, table: str, partitions: Dict[str, Dict], columns: List[str]) -> None:
+        path = os.path.join(self.folder, 'manifest.json')
+        with _manifest_lock:
+            manifest = {'tables': {}}
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            entry = manifest['tables'].setdefault(table, {'partitions': {}})
+            if columns:
+                entry['columns'] = columns
+            for date, info in partitions.items():
+                if info is None:
+                    entry['partitions'].pop(date, None)
+                else:
+                    entry['partitions'][date] = info
+            entry['rows'] = sum(info['rows'] for info in entry['partitions'].values())
+            entry['bytes'] = sum(info['bytes'] for info in entry['partitions'].values())
+            manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+
+            os.makedirs(self.folder, exist_ok=True)
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False, sort_keys=True)
+            os.replace(f"{path}.tmp", path)
+
+    def export(self, etl_name: str, dates: List[str]) -> Dict:
+        """
+        Export the given days of an ETL's target table (one partition per day)
+
+        Args:
+            etl_name: ETL whose table is exported (e.g. 'vendas_daily')
+            dates: Days changed in this run (format: 'YYYY-MM-DD')
+
+        Returns:
+            Summary with exported rows per day, removed days and failures
+        """
+        summary = {"rows": {}, "removed": [], "failed": []}
+        etl_config = get_etl_config(etl_name)
+        settings = etl_config.get('lake_export')
+        if not self.enabled or not settings or not dates:
+            return summary
+
+        schema = etl_config.get('schema', 'public')
+        table = etl_config['table']
+        query = f"""
+            SELECT * FROM {schema}.{table}
+            WHERE {settings['date_expression']} = %(data)s::date
+            {f"ORDER BY {settings['order_by']}" if settings.get('order_by') else ''}
+        """
+
+        self.logger.info(f"Exportando {schema}.{table} para o lake: {len(dates)} dias")
+        partitions, columns = {}, []
+        for date in sorted(set(dates)):
+            try:
+                df = self.target_connection.get_data(query, {'data': date})
+                if df.empty:
+                    self._remove_partition(table, date)
+                    partitions[date] = None
+                    summary["removed"].append(date)
+                    continue
+                columns = list(df.columns)
+                partitions[date] = self._write_partition(df, table, date)
+                summary["rows"][date] = len(df)
+            except Exception as e:
+                summary["failed"].append({"date": date, "error": str(e)})
+                self.logger.error(f"Falha ao exportar {table} {date}: {str(e)}")
+
+        if partitions:
+            self._update_manifest(table, partitions, columns)
+        return summary
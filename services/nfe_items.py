@@ -0,0 +1,334 @@
+import os
+import zlib
+import multiprocessing
+from functools import lru_cache
+import pandas as pd
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from psycopg2.extras import execute_values
+from handlers.db_connection import DatabaseConnection
+from handlers.query_loader import get_etl_config, load_query_from_file
+from handlers.log_handler import setup_logger
+from handlers.run_history import stage
+
+# Colunas da fato_nfe_itens, na ordem das tuplas produzidas pelo parser
+ITEM_COLUMNS = [
+    'chave', 'n_item', 'arquivo_xml_hash', 'data_emissao', 'cnpj_emitente',
+    'codigo_produto', 'ean', 'descricao', 'ncm', 'cfop', 'unidade',
+    'quantidade', 'valor_unitario', 'valor_total', 'valor_desconto',
+    'icms_cst', 'icms_base', 'icms_aliquota', 'icms_valor', 'icms_st_valor',
+    'ipi_valor', 'pis_valor', 'cofins_valor',
+]
+
+# Resultado da leitura de cada XML em fato_nfe_itens_status
+STATUS_OK = 'ok'
+STATUS_EMPTY = 'empty'
+STATUS_ERROR = 'error'
+
+# Bytes descompactados entregues ao parser por vez
+CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=1024)
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _decimal(text: Optional[str]) -> Optional[Decimal]:
+    if not text:
+        return None
+    try:
+        return Decimal(text.strip())
+    except InvalidOperation:
+        return None
+
+
+def _find_text(elem: ET.Element, *path: str) -> Optional[str]:
+    """
+    Text of the first descendant following path (local names, namespace ignored).
+    """
+    current = elem
+    for name in path:
+        current = next((child for child in current if _local(child.tag) == name), None)
+        if current is None:
+            return None
+    text = current.text
+    return text.strip() if text else None
+
+
+def _children(elem: Optional[ET.Element]) -> Dict[str, ET.Element]:
+    """
+    Direct children by local name (one pass instead of a scan per field).
+    """
+    if elem is None:
+        return {}
+    return {_local(child.tag): child for child in elem}
+
+
+def _texts(elem: Optional[ET.Element]) -> Dict[str, Optional[str]]:
+    return {name: (child.text.strip() if child.text else None) for name, child in _children(elem).items()}
+
+
+def _item_row(det: ET.Element, header: Dict) -> tuple:
+    parts = _children(det)
+    prod = _texts(parts.get('prod'))
+    imposto = _children(parts.get('imposto'))
+
+    def group_texts(group_name):
+        # Grupos de tributo variam (ICMS00, ICMSSN102, PISAliq, PISOutr, IPITrib, ...)
+        values = {}
+        for child in imposto.get(group_name, ()):
+            values.update({k: v for k, v in _texts(child).items() if v is not None})
+        return values
+
+    icms = group_texts('ICMS')
+    ipi = group_texts('IPI')
+    pis = group_texts('PIS')
+    cofins = group_texts('COFINS')
+
+    ean = prod.get('cEAN')
+    return (
+        header.get('chave'),
+        int(det.get('nItem', 0)),
+        header.get('arquivo_xml_hash'),
+        header.get('data_emissao'),
+        header.get('cnpj_emitente'),
+        prod.get('cProd'),
+        None if ean in (None, 'SEM GTIN') else ean,
+        prod.get('xProd'),
+        prod.get('NCM'),
+        prod.get('CFOP'),
+        prod.get('uCom'),
+        _decimal(prod.get('qCom')),
+        _decimal(prod.get('vUnCom')),
+        _decimal(prod.get('vProd')),
+        _decimal(prod.get('vDesc')),
+        icms.get('CST') or icms.get('CSOSN'),
+        _decimal(icms.get('vBC')),
+        _decimal(icms.get('pICMS')),
+        _decimal(icms.get('vICMS')),
+        _decimal(icms.get('vICMSST')),
+        _decimal(ipi.get('vIPI')),
+        _decimal(pis.get('vPIS')),
+        _decimal(cofins.get('vCOFINS')),
+    )
+
+
+def iter_nfe_items(chunks: Iterable[bytes], chave: Optional[str] = None,
+                   arquivo_xml_hash: Optional[str] = None) -> Iterator[tuple]:
+    """
+    Stream the det items of one NFe XML.
+
+    The XML is fed to an incremental pull parser chunk by chunk and each det
+    (and the ide/emit headers) is cleared as soon as it is read, so memory
+    stays flat regardless of the number of items.
+
+    Args:
+        chunks: Pieces of the XML document
+        chave: NFe key (read from infNFe/@Id when not given)
+        arquivo_xml_hash: Content hash of the XML, stored with each item
+
+    Yields:
+        One tuple per item, in ITEM_COLUMNS order
+    """
+    # Eventos 'start' só são necessários para ler a chave do atributo Id
+    parser = ET.XMLPullParser(events=('end',) if chave else ('start', 'end'))
+    header = {'chave': chave, 'arquivo_xml_hash': arquivo_xml_hash}
+
+    def events():
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
+
+    for event, elem in events():
+        name = _local(elem.tag)
+        if event == 'start':
+            if name == 'infNFe' and not header['chave']:
+                header['chave'] = (elem.get('Id') or '').replace('NFe', '') or None
+            continue
+
+        if name == 'det':
+            yield _item_row(elem, header)
+            elem.clear()
+        elif name == 'ide':
+            header['data_emissao'] = _find_text(elem, 'dhEmi') or _find_text(elem, 'dEmi')
+            elem.clear()
+        elif name == 'emit':
+            header['cnpj_emitente'] = _find_text(elem, 'CNPJ') or _find_text(elem, 'CPF')
+            elem.clear()
+        elif name in ('total', 'transp', 'cobr', 'pag', 'infAdic', 'Signature'):
+            # Blocos sem itens: descartados assim que terminam
+            elem.clear()
+
+
+def parse_nfe_blob(task: Tuple[str, str, bytes]) -> Tuple[str, List[tuple], Optional[str]]:
+    """
+    Parse one compressed XML from nfe_xml_blobs. Module-level so it can run on
+    a process pool; the blob is decompressed incrementally as it is parsed.
+
+    Args:
+        task: (chave, arquivo_xml_hash, xml_zlib)
+
+    Returns:
+        (chave, item tuples, error message or None)
+    """
+    chave, xml_hash, xml_zlib = task
+
+    def chunks():
+        # max_length limita cada pedaço descompactado, mesmo com XMLs muito repetitivos
+        decompressor = zlib.decompressobj()
+        pending = xml_zlib
+        while pending:
+            yield decompressor.decompress(pending, CHUNK_SIZE)
+            pending = decompressor.unconsumed_tail
+        yield decompressor.flush()
+
+    try:
+        return chave, list(iter_nfe_items(chunks(), chave, xml_hash)), None
+    except (ET.ParseError, zlib.error, ValueError) as e:
+        return chave, [], str(e)
+
+
+class NfeItemsETL:
+    """
+    Parses the NFe XMLs stored in nfe_xml_blobs into the item-level purchase
+    fact table (fato_nfe_itens: EAN, NCM, CFOP, quantity, unit cost, taxes).
+
+    Only NFes whose current XML hash has not been parsed yet are read: each
+    parsed XML is recorded in fato_nfe_itens_status (ok, empty or error), so
+    XMLs without items or that fail to parse are not read again; a new XML
+    for the chave (different hash) is. Delete its status row to retry one.
+    """
+
+    def __init__(self, target_config: Dict):
+        self.target_connection = DatabaseConnection(target_config)
+        self.logger = setup_logger("nfe_items_etl", log_file="logs/nfe_items_etl.log")
+
+    def _ensure_table(self, config: Dict) -> None:
+        self.target_connection.execute(load_query_from_file(config['ddl_file']))
+
+    def get_pending(self, config: Dict) -> pd.DataFrame:
+        """
+        NFes (chave, arquivo_xml_hash) whose XML has not been parsed yet
+        """
+        return self.target_connection.get_data(load_query_from_file(config['pending_query']))
+
+    def fetch_blobs(self, config: Dict, hashes: List[str]) -> Dict[str, bytes]:
+        result = self.target_connection.get_data(
+            "SELECT hash, xml_zlib FROM nfe_xml_blobs WHERE hash = ANY(%(hashes)s)",
+            {'hashes': hashes}
+        )
+        return {h: bytes(blob) for h, blob in zip(result['hash'], result['xml_zlib'])}
+
+    def parse(self, tasks: List[Tuple[str, str, bytes]], executor: Optional[ProcessPoolExecutor] = None,
+              workers: int = 1) -> Tuple[List[tuple], List[tuple]]:
+        """
+        Parse a batch of XMLs, on the run's process pool when there is one
+
+        Returns:
+            (item tuples, one (chave, hash, status, itens, error) per XML)
+        """
+        if executor is not None and len(tasks) > 1:
+            results = list(executor.map(parse_nfe_blob, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+        else:
+            results = [parse_nfe_blob(task) for task in tasks]
+
+        rows, statuses = [], []
+        for (_, xml_hash, _), (chave, items, error) in zip(tasks, results):
+            if error:
+                self.logger.error(f"Falha ao interpretar XML da NFe {chave}: {error}")
+                statuses.append((chave, xml_hash, STATUS_ERROR, 0, error))
+                continue
+            statuses.append((chave, xml_hash, STATUS_OK if items else STATUS_EMPTY, len(items), None))
+            rows.extend(items)
+        return rows, statuses
+
+    def load(self, config: Dict, rows: List[tuple], statuses: List[tuple]) -> int:
+        """
+        Replace the items of the NFes parsed without error (DELETE + INSERT) and
+        record every parsed XML in fato_nfe_itens_status, in one transaction
+        """
+        table_name = config.get('table', 'fato_nfe_itens')
+        schema = config.get('schema', 'public')
+        # XML com erro: mantém os itens já carregados da NFe
+        chaves = [chave for chave, _, status, _, _ in statuses if status != STATUS_ERROR]
+        with self.target_connection.transaction() as cursor:
+            cursor.execute(f"DELETE FROM {schema}.{table_name} WHERE chave = ANY(%(chaves)s)", {'chaves': chaves})
+            loaded = self.target_connection.insert_rows(cursor, table_name, rows, schema=schema,
+                                                        batch_size=config.get('load_batch_size', 5000),
+                                                        columns=ITEM_COLUMNS)
+            if statuses:
+                execute_values(
+                    cursor,
+                    f"""
+                        INSERT INTO {schema}.{table_name}_status (chave, arquivo_xml_hash, status, itens, error)
+                        VALUES %s
+                        ON CONFLICT (chave, arquivo_xml_hash)
+                        DO UPDATE SET status = EXCLUDED.status, itens = EXCLUDED.itens,
+                                      error = EXCLUDED.error, parsed_at = now()
+                    """,
+                    statuses,
+                    page_size=len(statuses)
+                )
+            return loaded
+
+    def run_etl(self) -> Dict:
+        try:
+            self.logger.info("Starting NFe items ETL")
+            config = get_etl_config('nfe_items')
+            self._ensure_table(config)
+            workers = config.get('workers') or os.cpu_count() or 1
+            batch_size = config.get('batch_size', 500)
+
+            pending = self.get_pending(config)
+            if pending.empty:
+                self.logger.info("No NFe XMLs pending parsing")
+                return {"processed": 0, "parsed": 0, "empty": 0, "items": 0, "failed": []}
+
+            self.logger.info(f"{len(pending)} NFe XMLs to parse with {workers} workers")
+            parsed, empty, items, failed = 0, 0, 0, []
+            # Um pool por execução (spawn: o ETL roda em threads do scheduler/daemon)
+            executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+            ) if workers > 1 else None
+            try:
+                for start in range(0, len(pending), batch_size):
+                    batch = pending.iloc[start:start + batch_size]
+                    with stage('fetch') as counters:
+                        blobs = self.fetch_blobs(config, batch['arquivo_xml_hash'].unique().tolist())
+                        counters['rows'] = len(blobs)
+                        counters['bytes'] = sum(len(blob) for blob in blobs.values())
+                    tasks = [
+                        (chave, xml_hash, blobs[xml_hash])
+                        for chave, xml_hash in zip(batch['chave'], batch['arquivo_xml_hash'])
+                        if xml_hash in blobs
+                    ]
+                    with stage('parse') as counters:
+                        rows, statuses = self.parse(tasks, executor, workers)
+                        counters['rows'] = len(rows)
+                    with stage('load') as counters:
+                        counters['rows'] = self.load(config, rows, statuses)
+                        items += counters['rows']
+                    for chave, _, status, _, error in statuses:
+                        if status == STATUS_ERROR:
+                            failed.append({'chave': chave, 'error': error})
+                        else:
+                            parsed += 1
+                            empty += status == STATUS_EMPTY
+                    self.logger.info(f"Parsed {parsed}/{len(pending)} XMLs, {items} items loaded")
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+            self.logger.info(
+                f"NFe items ETL completed - XMLs: {parsed} ({empty} sem itens), items: {items}, failed: {len(failed)}"
+            )
+            return {"processed": parsed, "parsed": parsed, "empty": empty, "items": items, "failed": failed}
+
+        except Exception as e:
+            self.logger.error(f"NFe items ETL failed: {str(e)}")
+            raise
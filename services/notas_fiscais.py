@@ -1,14 +1,24 @@
 import pandas as pd
 from handlers.db_connection import DatabaseConnection
-from handlers.query_loader import get_etl_query, get_etl_config
+from handlers.query_loader import get_etl_query, get_etl_config, load_query_from_file
 from handlers.log_handler import setup_logger
-from typing import Dict, Optional
+from handlers import transforms
+from handlers.xml_blob_store import XmlBlobStore
+from handlers.run_history import stage, frame_bytes
+from psycopg2.extras import execute_values
+from typing import Dict, List, Optional
+
+# Colunas comparadas para decidir se uma NFe já carregada precisa ser reenviada
+STATE_COLUMNS = ['situacao', 'manifestacao', 'status', 'data_inclusao', 'xml_tamanho']
 
 class NotasFiscaisETL:
     def __init__(self, source_config: Dict, target_config: Dict):
-        self.source_connection = DatabaseConnection(source_config)
+        self.source_connection = DatabaseConnection(
+            source_config, query_class=get_etl_config('notas_fiscais').get('query_class', 'heavy')
+        )
         self.target_connection = DatabaseConnection(target_config)
         self.logger = setup_logger("notas_fiscais_etl", log_file="logs/notas_fiscais_etl.log")
+        self.blob_store = XmlBlobStore(self.target_connection)
         
     def transform_data(self, df: pd.DataFrame) -> pd.DataFrame:
         try:
@@ -35,43 +45,27 @@ class NotasFiscaisETL:
             
             # Text columns - convert to string and clean None values
             text_columns = ['id_uniplus', 'fornecedor', 'cpnj_cpf', 'situacao', 'manifestacao', 'status', 'chave', 'processed', 'arquivo_xml_text']
-            for col in text_columns:
-                if col in df.columns:
-                    df[col] = df[col].astype(str)
-                    df.loc[df[col] == 'None', col] = None
+            transforms.normalize_text(df, text_columns)
             
             if 'processed' in df.columns:
                 df['processed'] = df['processed'].str.lower()
             
             # TIMESTAMP columns (data_emissao, data_inclusao)  
-            timestamp_columns = ['data_emissao', 'data_inclusao']
-            for col in timestamp_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
-                    df[col] = df[col].replace({pd.NaT: None})
+            transforms.parse_datetimes(df, ['data_emissao', 'data_inclusao'])
             
             # DATE column (vencimento)
-            if 'vencimento' in df.columns:
-                df['vencimento'] = pd.to_datetime(df['vencimento'], errors='coerce')
-                mask = pd.notna(df['vencimento'])
-                df.loc[mask, 'vencimento'] = df.loc[mask, 'vencimento'].dt.date
+            transforms.parse_datetimes(df, ['vencimento'], as_date=True)
             
             # NUMERIC column (valor)
-            if 'valor' in df.columns:
-                df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
+            transforms.to_numeric(df, ['valor'])
             
             columns = [
                 'id_uniplus', 'data_emissao', 'fornecedor', 'cpnj_cpf', 'valor',
                 'vencimento', 'situacao', 'manifestacao', 'status', 'chave',
-                'data_inclusao', 'processed', 'arquivo_xml', 'arquivo_xml_text'
+                'data_inclusao', 'processed', 'arquivo_xml', 'arquivo_xml_text', 'arquivo_xml_hash'
             ]
             
-            result = df[columns]
-            
-            # Final cleanup: replace any remaining NaT values with None
-            for col in result.columns:
-                if result[col].dtype == 'datetime64[ns]':
-                    result[col] = result[col].replace({pd.NaT: None})
+            result = transforms.project_columns(df, columns)
             
             self.logger.debug(f"Transformation completed, returning {len(result)} records")
             
@@ -115,11 +109,16 @@ class NotasFiscaisETL:
             self.target_connection.disconnect()
             self.logger.info("Table cleared successfully")
             
+            # XML vai para o nfe_xml_blobs; a linha guarda apenas o hash
+            self.blob_store.ensure_table()
+            df = self.blob_store.store_frame(df)
+            
             self.logger.info(f"Inserting {len(df)} records...")
             self.target_connection.insert_batch(
                 table_name=table_name,
                 data=df,
-                schema=schema
+                schema=schema,
+                batch_size=config.get('load_batch_size', 100)
             )
             
             self.logger.info("Data load completed successfully")
@@ -128,27 +127,265 @@ class NotasFiscaisETL:
             self.logger.error(f"Error during data load: {str(e)}")
             raise
 
-    def run_etl(self, date_filter: Optional[str] = None) -> None:
+    def _ensure_unique_index(self) -> None:
+        """
+        Create the unique index on chave required by the incremental UPSERT
+        (one-time migration that also drops duplicates left by full loads).
+        """
+        config = get_etl_config('notas_fiscais')
+        schema = config.get('schema', 'public')
+        index = config.get('unique_index', 'ux_report_uniplus_notas_fiscais_chave')
+        exists = self.target_connection.get_data("SELECT to_regclass(%(index)s) AS idx", {'index': f"{schema}.{index}"})
+        if exists['idx'].iloc[0] is None:
+            self.logger.info(f"Creating unique index {schema}.{index} on chave")
+            self.target_connection.execute(load_query_from_file(config['unique_index_file']))
+
+    @staticmethod
+    def _state_signature(df: pd.DataFrame) -> pd.Series:
+        """
+        Comparable text of the STATE_COLUMNS per chave (same rendering for source and target)
+        """
+        parts = []
+        for col in STATE_COLUMNS:
+            if col == 'data_inclusao':
+                values = pd.to_datetime(df[col], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+            else:
+                # Inteiros com nulos chegam como float ('1.0')
+                values = df[col].astype('str').str.replace(r'\.0$', '', regex=True)
+            parts.append(values.fillna(''))
+        signature = parts[0].str.cat(parts[1:], sep='|')
+        state = pd.Series(signature.to_numpy(), index=df['chave'].astype('str'))
+        return state[~state.index.duplicated()]
+
+    def get_changed_keys(self) -> Dict[str, List[str]]:
+        """
+        Compare the light NFe state of source and target by chave.
+
+        Returns:
+            Dictionary with 'changed' (new or with situacao, manifestacao, status
+            data_inclusao or XML size different from the target) and 'removed' (only in the target)
+        """
+        config = get_etl_config('notas_fiscais')
+        table_name = config.get('table', 'report_uniplus_notas_fiscais')
+        schema = config.get('schema', 'public')
+
+        source = self.source_connection.get_data(load_query_from_file(config['state_query']))
+        source = source.dropna(subset=['chave']).drop_duplicates(subset=['chave'], keep='first')
+        target = self.target_connection.get_data(f"""
+            SELECT r.chave, r.situacao, r.manifestacao, r.status, r.data_inclusao, b.tamanho AS xml_tamanho
+            FROM {schema}.{table_name} r
+            LEFT JOIN nfe_xml_blobs b ON b.hash = r.arquivo_xml_hash
+        """)
+        # Linhas antigas sem chave (cargas completas) não entram na comparação nem no DELETE
+        target = target.dropna(subset=['chave'])
+
+        source_state = self._state_signature(source)
+        target_state = self._state_signature(target) if not target.empty else pd.Series(dtype='str')
+
+        current = target_state.reindex(source_state.index)
+        changed = source_state.index[current.isna() | (current != source_state)].tolist()
+        removed = target_state.index.difference(source_state.index).tolist() if not source.empty else []
+
+        self.logger.info(
+            f"{len(source_state)} NFes na origem: {len(changed)} novas/alteradas, "
+            f"{len(removed)} removidas"
+        )
+        return {'changed': changed, 'removed': removed}
+
+    def extract_changed(self, chaves: List[str]):
+        """
+        Extract the full rows (with arquivoxml) of the given chaves, in batches
+        of 'fetch_batch_size' so one query never carries too many XMLs.
+
+        Yields:
+            DataFrame per batch
+        """
+        config = get_etl_config('notas_fiscais')
+        query = load_query_from_file(config['incremental_query'])
+        batch_size = config.get('fetch_batch_size', 500)
+        for i in range(0, len(chaves), batch_size):
+            batch = chaves[i:i + batch_size]
+            self.logger.info(f"Extraindo {len(batch)} NFes ({i + len(batch)}/{len(chaves)})")
+            with stage('extract') as counters:
+                result = self.source_connection.get_data(query, {'chaves': batch})
+                counters['rows'] = len(result)
+                counters['bytes'] = frame_bytes(result)
+            yield result
+
+    def store_new_xmls(self, df: pd.DataFrame) -> int:
+        """
+        Fetch from the source only the XMLs whose hash is not in nfe_xml_blobs
+        yet and store them. Must run before the rows that reference them are loaded.
+        """
+        if df.empty or 'arquivo_xml_hash' not in df.columns:
+            return 0
+        missing = self.blob_store.missing(df['arquivo_xml_hash'].dropna().tolist())
+        if not missing:
+            return 0
+
+        chaves = df.loc[df['arquivo_xml_hash'].isin(missing), 'chave'].tolist()
+        query = load_query_from_file(get_etl_config('notas_fiscais')['xml_blob_query'])
+        blobs = self.source_connection.get_data(query, {'chaves': chaves, 'hashes': missing})
+        return self.blob_store.put_many(dict(zip(blobs['hash'], blobs['arquivoxml'])))
+
+    def migrate_inline_xml(self, batch_size: int = 200) -> int:
+        """
+        Move XMLs still stored inline in arquivo_xml into nfe_xml_blobs, leaving
+        only arquivo_xml_hash on the report rows. Runs inside the target; does
+        nothing once every row has been migrated.
+
+        Returns:
+            Number of rows migrated
+        """
+        config = get_etl_config('notas_fiscais')
+        table = f"{config.get('schema', 'public')}.{config.get('table', 'report_uniplus_notas_fiscais')}"
+        migrated = 0
+        while True:
+            # Pela ctid: linhas antigas sem chave também precisam ser migradas
+            batch = self.target_connection.get_data(
+                f"SELECT ctid::text AS row_id, arquivo_xml FROM {table} WHERE arquivo_xml IS NOT NULL LIMIT %(limit)s",
+                {'limit': batch_size}
+            )
+            if batch.empty:
+                break
+            batch = self.blob_store.store_frame(batch)
+            with self.target_connection.transaction() as cursor:
+                execute_values(
+                    cursor,
+                    f"""
+                        UPDATE {table} r
+                        SET arquivo_xml_hash = v.hash, arquivo_xml = NULL
+                        FROM (VALUES %s) AS v(row_id, hash)
+                        WHERE r.ctid = v.row_id::tid
+                    """,
+                    list(zip(batch['row_id'], batch['arquivo_xml_hash'])),
+                    page_size=len(batch)
+                )
+                # Um único UPDATE por lote (page_size), então rowcount cobre o lote todo
+                updated = cursor.rowcount
+            if not updated:
+                # Linhas movidas por outra escrita (ctid mudou): evita repetir o mesmo lote para sempre
+                self.logger.warning(f"Nenhuma linha atualizada em um lote de {len(batch)} XMLs, migração interrompida")
+                break
+            migrated += updated
+        if migrated:
+            self.logger.info(f"{migrated} XMLs movidos de arquivo_xml para nfe_xml_blobs")
+        return migrated
+
+    def load_incremental(self, df: pd.DataFrame, removed: Optional[List[str]] = None) -> int:
+        """
+        UPSERT by chave; 'processed' is only written on insert, so NFes already
+        handled downstream are not reset. Chaves gone from the source are deleted
+        in the same transaction.
+        """
+        config = get_etl_config('notas_fiscais')
+        table_name = config.get('table', 'report_uniplus_notas_fiscais')
+        schema = config.get('schema', 'public')
+
+        with self.target_connection.transaction() as cursor:
+            upserted = 0
+            if not df.empty:
+                upserted = self.target_connection.upsert_rows(
+                    cursor,
+                    table_name=table_name,
+                    data=df,
+                    unique_columns=config.get('unique_columns', ['chave']),
+                    schema=schema,
+                    batch_size=config.get('load_batch_size', 100),
+                    preserve_columns=['processed']
+                )
+            if removed:
+                cursor.execute(
+                    f"DELETE FROM {schema}.{table_name} WHERE chave = ANY(%(chaves)s)",
+                    {'chaves': removed}
+                )
+                self.logger.info(f"Removidas {cursor.rowcount} NFes que não existem mais na origem")
+        return upserted
+
+    def run_incremental(self) -> Dict[str, int]:
+        """
+        Incremental sync keyed on chave: only new/changed NFes cross the network
+        """
+        self._ensure_unique_index()
+        self.blob_store.ensure_table()
+        self.migrate_inline_xml()
+        with stage('compare') as counters:
+            keys = self.get_changed_keys()
+            counters['rows'] = len(keys['changed'])
+
+        processed = 0
+        for raw_data in self.extract_changed(keys['changed']):
+            if raw_data.empty:
+                continue
+            with stage('transform') as counters:
+                # Uma linha por chave (o join com notafiscal pode repetir a NFe)
+                transformed_data = self.transform_data(raw_data).drop_duplicates(subset=['chave'], keep='first')
+                counters['rows'] = len(transformed_data)
+            with stage('store_xml') as counters:
+                counters['rows'] = self.store_new_xmls(transformed_data)
+            with stage('load') as counters:
+                counters['rows'] = self.load_incremental(transformed_data)
+                processed += counters['rows']
+
+        if keys['removed']:
+            self.load_incremental(pd.DataFrame(), keys['removed'])
+
+        self.logger.info(f"Incremental load completed: {processed} NFes upserted, {len(keys['removed'])} removed")
+        return {'processed': processed, 'removed': len(keys['removed'])}
+
+    def plan(self, date_filter: Optional[str] = None) -> Dict:
+        """
+        What a run would load, without extracting: the new/changed NFes in
+        incremental mode (light state comparison), otherwise the planner's row
+        estimate of the full extraction
+        """
+        if get_etl_config('notas_fiscais').get('load_mode', 'full') == 'incremental':
+            keys = self.get_changed_keys()
+            return {
+                "mode": "incremental",
+                "estimated_rows": len(keys['changed']),
+                "removed": len(keys['removed']),
+            }
+        params = {'data_emissao': date_filter} if date_filter else {}
+        return {
+            "mode": "full",
+            "date_filter": date_filter,
+            "estimated_rows": self.source_connection.estimate_rows(get_etl_query('notas_fiscais'), params),
+        }
+
+    def run_etl(self, date_filter: Optional[str] = None) -> Optional[Dict[str, int]]:
         try:
             self.logger.info(f"Starting ETL process for notas fiscais")
             
+            if get_etl_config('notas_fiscais').get('load_mode', 'full') == 'incremental':
+                return self.run_incremental()
+            
             self.logger.info("Starting data extraction...")
-            raw_data = self.extract_data(date_filter)
+            with stage('extract') as counters:
+                raw_data = self.extract_data(date_filter)
+                counters['rows'] = len(raw_data)
+                counters['bytes'] = frame_bytes(raw_data)
             
             if raw_data.empty:
                 self.logger.warning(f"No data found for date filter: {date_filter}")
-                return
+                return {'processed': 0}
             
             self.logger.info(f"Extracted {len(raw_data)} records from source database")
             
             self.logger.info("Starting data transformation...")
-            transformed_data = self.transform_data(raw_data)
+            with stage('transform') as counters:
+                transformed_data = self.transform_data(raw_data)
+                counters['rows'] = len(transformed_data)
             self.logger.info(f"Transformed {len(transformed_data)} records")
             
             self.logger.info("Starting data load...")
-            self.load_data(transformed_data)
+            with stage('load') as counters:
+                counters['rows'] = len(transformed_data)
+                counters['bytes'] = frame_bytes(transformed_data)
+                self.load_data(transformed_data)
             
             self.logger.info(f"ETL completed successfully. Processed {len(transformed_data)} records.")
+            return {'processed': len(transformed_data)}
             
         except Exception as e:
             self.logger.error(f"ETL process failed with error: {str(e)}")
@@ -1,14 +1,38 @@
+import threading
 import pandas as pd
 from handlers.db_connection import DatabaseConnection
 from handlers.query_loader import get_etl_query, get_etl_config, load_query_from_file
 from handlers.log_handler import setup_logger
-from typing import Dict, Optional
+from handlers.sync_ledger import SyncLedger, frame_checksum
+from handlers.reconciliation import KeySetReconciler
+from handlers.extraction_cache import ExtractionCache
+from handlers.partitions import PartitionManager
+from handlers.run_history import stage, frame_bytes
+from handlers import transforms
+from services.daily_aggregates import DailyAggregatesETL
+from services.lake_export import LakeExportETL
+from typing import Dict, List, Optional
+from datetime import datetime
+
+# Migração da chave por filial: uma loja por vez
+_store_key_lock = threading.Lock()
 
 class VendasDailyETL:
     def __init__(self, source_config: Dict, target_config: Dict):
-        self.source_connection = DatabaseConnection(source_config)
+        self.source_connection = DatabaseConnection(
+            source_config, query_class=get_etl_config('vendas_daily').get('query_class', 'heavy')
+        )
         self.target_connection = DatabaseConnection(target_config)
         self.logger = setup_logger("vendas_daily_etl", log_file="logs/vendas_daily_etl.log")
+        self.aggregates = DailyAggregatesETL(target_config)
+        self.lake = LakeExportETL(target_config)
+        # Definida apenas com várias lojas (UNICO_STORES)
+        self.filial = source_config.get('filial')
+        self._store_key_ready = False
+        self.ledger = SyncLedger(self.target_connection, 'vendas_daily', self.filial)
+        self.cache = ExtractionCache('vendas_daily', source_config)
+        self.partitions = PartitionManager(self.target_connection, 'vendas_daily')
+        self.reconciler = KeySetReconciler(self.source_connection, self.target_connection, 'vendas_daily', self.filial)
         
     def transform_data(self, df: pd.DataFrame) -> pd.DataFrame:
         column_mapping = {
@@ -32,10 +56,15 @@ class VendasDailyETL:
         df = df.rename(columns=column_mapping)
         
         # Transform cancelado from 0/1 to Não/Sim
-        df['canc'] = df['canc'].map({0: 'Não', 1: 'Sim'})
+        transforms.map_values(df, 'canc', {0: 'Não', 1: 'Sim'})
         
         # Create documento by concatenating serienfce and numeronfce
-        df['documento'] = df['serienfce'].astype(str) + '/' + df['numeronfce'].astype(str)
+        # na_rep mantém a chave igual à das linhas já carregadas ('None/123')
+        transforms.concat_columns(df, 'documento', ['serienfce', 'numeronfce'], sep='/', na_rep='None')
+        
+        # Várias lojas: a filial da linha é a da loja configurada
+        if self.filial is not None:
+            df['filial'] = self.filial
         
         # Add missing columns with default values
         df['vendedor'] = None
@@ -48,19 +77,13 @@ class VendasDailyETL:
         # Convert data types to match target table
         # Numeric columns (18,2)
         numeric_columns = ['v_bruto', 'desconto', 'acrescimo', 'v_venda', 'v_liquido', 'valor_finalizador', 'troco']
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        transforms.to_numeric(df, numeric_columns)
         
         # Date column
-        if 'emissao' in df.columns:
-            df['emissao'] = pd.to_datetime(df['emissao'], errors='coerce').dt.date
+        transforms.parse_datetimes(df, ['emissao'], as_date=True)
         
         # Timestamp columns  
-        timestamp_columns = ['hora', 'hora_final']
-        for col in timestamp_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
+        transforms.parse_datetimes(df, ['hora', 'hora_final'])
         
         # Ensure all columns are present and in correct order
         columns = [
@@ -68,7 +91,32 @@ class VendasDailyETL:
             'v_bruto', 'desconto', 'acrescimo', 'v_venda', 'devolucao_troca', 'v_liquido', 'canc', 'cliente',
             'cnpj_cpf', 'finalizador', 'valor_finalizador', 'hora_final', 'troco'
         ]
-        return df[columns]
+        return transforms.project_columns(df, columns)
+
+    def _unique_columns(self, config: Dict) -> List[str]:
+        columns = config.get('unique_columns', ['emissao', 'hora', 'documento', 'v_liquido'])
+        # Várias lojas: a mesma chave pode existir em lojas diferentes
+        if self.filial is not None and 'filial' not in columns:
+            columns = ['filial'] + columns
+        return columns
+
+    def _ensure_store_key(self, config: Dict) -> None:
+        """
+        With several stores, make sure the target's unique key includes filial
+        (runs store_key_migration_file once, when store_key_index is missing)
+        """
+        if self.filial is None or self._store_key_ready or not config.get('store_key_migration_file'):
+            return
+        schema = config.get('schema', 'public')
+        index = config.get('store_key_index')
+        with _store_key_lock:
+            exists = self.target_connection.get_data(
+                "SELECT to_regclass(%(name)s) IS NOT NULL AS existe", {'name': f"{schema}.{index}"}
+            )
+            if not bool(exists.iloc[0, 0]):
+                self.logger.info(f"Criando chave única por filial em {config.get('table')}")
+                self.target_connection.execute(load_query_from_file(config['store_key_migration_file']))
+        self._store_key_ready = True
 
     def get_missing_dates(self) -> list:
         """
@@ -76,16 +124,24 @@ class VendasDailyETL:
         """
         try:
             config = get_etl_config('vendas_daily')
-            missing_dates_query = config.get('missing_dates_query')
-            
-            if not missing_dates_query:
-                self.logger.warning("No missing_dates_query configured")
-                return []
             
-            # Load the missing dates query
-            query = load_query_from_file(missing_dates_query)
+            if config.get('sync_ledger'):
+                # Consulta indexada no etl_sync_ledger (datas sem status 'done')
+                if config.get('ledger_seed_query'):
+                    self.ledger.seed_from_target(config['ledger_seed_query'])
+                result = self.ledger.get_pending_dates()
+            else:
+                missing_dates_query = config.get('missing_dates_query')
+                
+                if not missing_dates_query:
+                    self.logger.warning("No missing_dates_query configured")
+                    return []
+                
+                # Load the missing dates query
+                query = load_query_from_file(missing_dates_query)
+                
+                result = self.target_connection.get_data(query)
             
-            result = self.target_connection.get_data(query)
             if result.empty:
                 return []
             
@@ -112,32 +168,47 @@ class VendasDailyETL:
             self.logger.error(f"Error getting missing dates: {str(e)}")
             return []
 
-    def extract_data(self, date: str) -> pd.DataFrame:
+    def extract_data(self, date: str, use_cache: bool = True) -> pd.DataFrame:
         """
-        Extract data from source database
+        Extract data from source database (or from the extraction cache, when
+        a previous load of the date failed or in replay mode)
         """
         query = get_etl_query('vendas_daily')
-        return self.source_connection.get_data(query, {'data': date})
+        params = {'data': date}
+        if not use_cache:
+            return self.source_connection.get_data(query, params)
+        return self.cache.fetch(query, params, lambda: self.source_connection.get_data(query, params))
 
-    def load_data(self, df: pd.DataFrame, date: str) -> None:
+    def load_data(self, df: pd.DataFrame, date: str, source_checksum: Optional[str] = None,
+                  started_at: Optional[datetime] = None, record_ledger: bool = True) -> None:
         """
-        Load transformed data into target table using UPSERT
+        Load transformed data into target table using UPSERT.
+        With sync_ledger enabled (and record_ledger), the ledger entry for the
+        date is written in the same transaction as the rows.
         """
         config = get_etl_config('vendas_daily')
         table_name = config.get('table', 'uniplus_vendas_pdvs')
         schema = config.get('schema', 'public')
-        unique_columns = config.get('unique_columns', ['emissao', 'hora', 'documento', 'v_liquido'])
+        unique_columns = self._unique_columns(config)
         
         try:
+            self._ensure_store_key(config)
+            # Tabela particionada: grava direto na partição do mês
+            table_name = self.partitions.route(date)
             self.logger.info(f"Starting UPSERT for {len(df)} records on date {date}")
             
             # Use existing upsert method with the constraint that already exists
-            self.target_connection.upsert(
-                table_name=table_name,
-                data=df,
-                unique_columns=unique_columns,
-                schema=schema
-            )
+            with self.target_connection.transaction() as cursor:
+                self.target_connection.upsert_rows(
+                    cursor,
+                    table_name=table_name,
+                    data=df,
+                    unique_columns=unique_columns,
+                    schema=schema,
+                    batch_size=config.get('load_batch_size', 1000)
+                )
+                if config.get('sync_ledger') and record_ledger:
+                    self.ledger.mark_done(date, len(df), source_checksum, started_at, cursor=cursor)
             
             self.logger.info(f"UPSERT completed: {len(df)} records processed for date {date}")
             
@@ -145,39 +216,72 @@ class VendasDailyETL:
             self.logger.error(f"Error during UPSERT for date {date}: {str(e)}")
             raise
 
-    def _process_single_date(self, date: str) -> None:
+    def _process_single_date(self, date: str, record_ledger: bool = True) -> None:
         """
         Process ETL for a single date (internal method)
         """
         self.logger.info(f"Processing date: {date}")
+        started_at = datetime.now()
+        use_ledger = get_etl_config('vendas_daily').get('sync_ledger', False) and record_ledger
         
-        # Extract
-        raw_data = self.extract_data(date)
+        # Extract (a carga intraday, com o dia ainda aberto, não usa o cache)
+        with stage('extract', date) as counters:
+            raw_data = self.extract_data(date, use_cache=record_ledger)
+            counters['rows'] = len(raw_data)
+            counters['bytes'] = frame_bytes(raw_data)
         
         if raw_data.empty:
             self.logger.warning(f"No data found for date: {date}")
+            # Dia sem movimento (ex.: feriado) fica concluído e não é reextraído
+            if use_ledger:
+                self.ledger.mark_done(date, 0, None, started_at)
+            if record_ledger:
+                self.cache.mark_loaded(get_etl_query('vendas_daily'), {'data': date})
             return
         
         self.logger.info(f"Extracted {len(raw_data)} records from source database")
+        # Checksum das linhas da origem, como vieram do banco (não do resultado do transform)
+        source_checksum = frame_checksum(raw_data) if use_ledger else None
         
         # Transform
-        transformed_data = self.transform_data(raw_data)
+        with stage('transform', date) as counters:
+            transformed_data = self.transform_data(raw_data)
+            counters['rows'] = len(transformed_data)
         self.logger.info(f"Transformed {len(transformed_data)} records")
         
         # Load
-        self.load_data(transformed_data, date)
+        with stage('load', date) as counters:
+            counters['rows'] = len(transformed_data)
+            counters['bytes'] = frame_bytes(transformed_data)
+            self.load_data(transformed_data, date, source_checksum, started_at, record_ledger=use_ledger)
+        if record_ledger:
+            self.cache.mark_loaded(get_etl_query('vendas_daily'), {'data': date})
         
         self.logger.info(f"Successfully processed {len(transformed_data)} records for date: {date}")
 
-    def run_etl(self) -> dict:
+    def plan(self, dates: Optional[List[str]] = None) -> dict:
+        """
+        Dates a run would process (the given ones or the missing dates) with the
+        planner's row estimate of the extraction query for each, without extracting
+        """
+        dates = dates if dates is not None else self.get_missing_dates()
+        query = get_etl_query('vendas_daily')
+        estimates = {date: self.source_connection.estimate_rows(query, {'data': date}) for date in dates}
+        return {"dates": dates, "estimated_rows": sum(estimates.values()), "rows_per_date": estimates}
+
+    def run_etl(self, dates: Optional[List[str]] = None, refresh_aggregates: bool = True) -> dict:
         """
         Run ETL for all missing dates (main entry point)
+        Args:
+            dates: Explicit dates (YYYY-MM-DD) to reprocess instead of the missing dates
+            refresh_aggregates: False when the caller refreshes them once for
+                several stores
         Returns summary of processed dates
         """
         try:
             self.logger.info("Starting Vendas Daily ETL process")
             
-            missing_dates = self.get_missing_dates()
+            missing_dates = dates if dates is not None else self.get_missing_dates()
             
             if not missing_dates:
                 self.logger.info("No missing dates found. All data is up to date.")
@@ -196,6 +300,8 @@ class VendasDailyETL:
                 except Exception as e:
                     failed.append({"date": date, "error": str(e)})
                     self.logger.error(f"Failed to process date {date}: {str(e)}")
+                    if get_etl_config('vendas_daily').get('sync_ledger'):
+                        self.ledger.mark_failed(date, str(e))
                     # Continue with next date instead of stopping
                     continue
             
@@ -208,6 +314,13 @@ class VendasDailyETL:
                 }
             }
             
+            # Recalcula as tabelas fato_* apenas para os dias carregados nesta execução
+            if refresh_aggregates:
+                with stage('aggregates'):
+                    summary["aggregates"] = self.aggregates.refresh('vendas_daily', processed)
+                with stage('lake_export'):
+                    summary["lake_export"] = self.lake.export('vendas_daily', processed)
+            
             self.logger.info(f"ETL completed - Processed: {len(processed)}, Failed: {len(failed)}")
             
             return summary
@@ -215,3 +328,62 @@ class VendasDailyETL:
         except Exception as e:
             self.logger.error(f"ETL process failed: {str(e)}")
             raise
+
+    def run_intraday(self, refresh_aggregates: bool = True) -> dict:
+        """
+        Upsert the current day's sales so far (frequent runs during the day).
+        The ledger is not touched: the day is still open and stays pending for
+        the nightly run, which loads it complete.
+        """
+        try:
+            today = datetime.now().strftime('%Y-%m-%d')
+            self._process_single_date(today, record_ledger=False)
+            aggregates = None
+            if refresh_aggregates:
+                with stage('aggregates', today):
+                    aggregates = self.aggregates.refresh('vendas_daily', [today])
+            return {"date": today, "aggregates": aggregates}
+        except Exception as e:
+            self.logger.error(f"Intraday ETL failed: {str(e)}")
+            raise
+
+    def resync_drift(self, dry_run: bool = False, refresh_aggregates: bool = True) -> dict:
+        """
+        Reload only the days whose per-day fingerprints (row count, key/state
+        hash, value sums) differ between source and target in the drift window
+        (see KeySetReconciler.find_drift). The days go back to pending in the
+        ledger first, so a failed reload is retried by the next run.
+        """
+        try:
+            drift = self.reconciler.find_drift()
+            dates = [pd.Timestamp(bucket).strftime('%Y-%m-%d') for bucket in drift["buckets"] if not pd.isna(bucket)]
+            summary = {"buckets_checked": drift["buckets_checked"], "drifted": dates}
+            if dry_run or not dates:
+                summary.update({"processed": 0, "failed": 0, "dates": {"processed": [], "failed": []}})
+                return summary
+
+            self.logger.info(f"Reprocessando {len(dates)} dias divergentes: {dates}")
+            if get_etl_config('vendas_daily').get('sync_ledger'):
+                self.ledger.mark_drift(dates)
+            summary.update(self.run_etl(dates, refresh_aggregates=refresh_aggregates))
+            return summary
+        except Exception as e:
+            self.logger.error(f"Erro na reconciliação de divergências: {str(e)}")
+            raise
+
+    def reconcile_deletions(self, dry_run: bool = False, refresh_aggregates: bool = True) -> dict:
+        """
+        Delete target rows whose keys no longer exist in the source (key-set
+        fingerprints per day, see KeySetReconciler) and refresh the daily
+        aggregates of the days that changed
+        """
+        try:
+            summary = self.reconciler.reconcile(dry_run=dry_run)
+            if summary["buckets"] and not dry_run and refresh_aggregates:
+                dates = [pd.Timestamp(bucket).strftime('%Y-%m-%d') for bucket in summary["buckets"]]
+                summary["aggregates"] = self.aggregates.refresh('vendas_daily', dates)
+                summary["lake_export"] = self.lake.export('vendas_daily', dates)
+            return summary
+        except Exception as e:
+            self.logger.error(f"Erro na reconciliação de exclusões: {str(e)}")
+            raise
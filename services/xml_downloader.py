@@ -1,9 +1,11 @@
 import os
 import pandas as pd
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 from handlers.db_connection import DatabaseConnection
-from handlers.query_loader import load_query_from_file
+from handlers.query_loader import load_query_from_file, get_etl_config
 from handlers.log_handler import setup_logger
+from handlers.xml_blob_store import XmlBlobStore
+from handlers.file_writer import AtomicFileWriter, ZipArchiveWriter
 
 class XMLDownloaderService:
     def __init__(self, target_connection_config: Dict, download_folder: str = r"G:\Meu Drive"):
@@ -41,26 +43,151 @@ class XMLDownloaderService:
             self.logger.debug(f"Downloading XML for key: {chave}")
             query = load_query_from_file('xml_binary_fetch.sql')
             df = self.target_connection.get_data(query, {'chave': chave})
-            if df.empty or df['arquivo_xml'].isna().iloc[0]:
+            if df.empty or (df['xml_zlib'].isna().iloc[0] and df['arquivo_xml'].isna().iloc[0]):
                 self.logger.warning(f"No XML binary data found for key: {chave}")
                 return False
-            xml_binary = df['arquivo_xml'].iloc[0]
+            # nfe_xml_blobs (zlib); arquivo_xml só para linhas ainda não migradas
+            if df['xml_zlib'].notna().iloc[0]:
+                xml_binary = XmlBlobStore.decompress(df['xml_zlib'].iloc[0])
+            else:
+                xml_binary = df['arquivo_xml'].iloc[0]
             if xml_binary is None:
                 self.logger.warning(f"XML binary data is null for key: {chave}")
                 return False
-            filename = f"{chave}.xml"
-            filepath = os.path.join(self.download_folder, filename)
-            with open(filepath, "wb") as f:
-                f.write(xml_binary)
-            self.logger.debug(f"XML saved successfully: {filepath}")
+            self._save_xml(chave, xml_binary)
             return True
         except Exception as e:
             self.logger.error(f"Error downloading XML for key {chave}: {str(e)}")
             return False
     
+    def _save_xml(self, chave: str, xml_binary) -> None:
+        filepath = os.path.join(self.download_folder, f"{chave}.xml")
+        with open(filepath, "wb") as f:
+            f.write(xml_binary)
+        self.logger.debug(f"XML saved successfully: {filepath}")
+
+    def _keyed_queries(self, query_name: str, keys: Optional[List[str]] = None) -> List[Tuple[str, Optional[Dict]]]:
+        """
+        Prefix a bulk query with the "chaves" CTE: the pending filter
+        (xml_download_filter.sql) when keys is None, otherwise the given keys in
+        batches of 'bulk_keys_per_query' (one query per batch).
+        """
+        config = get_etl_config('xml_downloader')
+        query = load_query_from_file(config['query_files'][query_name])
+
+        if keys is None:
+            pending = load_query_from_file(config['query_files']['filter']).rstrip(';')
+            return [(f"WITH chaves AS ({pending})\n{query}", None)]
+
+        size = config.get('bulk_keys_per_query', 1000)
+        keyed = f"WITH chaves AS (SELECT unnest(%(chaves)s::text[]) AS chave)\n{query}"
+        return [(keyed, {'chaves': keys[i:i + size]}) for i in range(0, len(keys), size)]
+
+    def get_xml_index(self, keys: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Current arquivo_xml_hash, emission day and supplier of each pending (or
+        given) chave, without the XMLs
+        """
+        frames = [
+            self.target_connection.get_data(query, params)
+            for query, params in self._keyed_queries('bulk_hashes', keys)
+        ]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=['chave', 'arquivo_xml_hash', 'data_emissao', 'cpnj_cpf'])
+        return pd.concat(frames, ignore_index=True)
+
+    def _create_writer(self, config: Dict):
+        manifest_path = config.get('manifest_path', os.path.join('data', 'xml_manifest.sqlite'))
+        if config.get('output_mode', 'files') == 'archive':
+            return ZipArchiveWriter(self.download_folder, manifest_path, workers=config.get('writer_workers', 8))
+        return AtomicFileWriter(self.download_folder, manifest_path, workers=config.get('writer_workers', 8))
+
+    @staticmethod
+    def _archive_groups(index: pd.DataFrame, group_by: str) -> Dict[str, str]:
+        """
+        Archive of each chave: emission day (YYYY-MM-DD) or supplier CNPJ/CPF
+        """
+        if group_by == 'supplier':
+            groups = index['cpnj_cpf'].astype('str').str.replace(r'\D', '', regex=True)
+        else:
+            groups = pd.to_datetime(index['data_emissao'], errors='coerce').dt.strftime('%Y-%m-%d')
+        return dict(zip(index['chave'], groups.fillna('sem_grupo').replace('', 'sem_grupo')))
+
+    def iter_xml_blobs(self, keys: Optional[List[str]] = None) -> Iterator[Tuple[str, Optional[bytes]]]:
+        """
+        Stream (chave, xml) pairs through a server-side cursor.
+
+        Without keys, the pending filter is joined into the fetch so the whole
+        download is a single query; with keys, they are fetched with = ANY.
+        """
+        itersize = get_etl_config('xml_downloader').get('stream_itersize', 100)
+        for query, params in self._keyed_queries('bulk_fetch', keys):
+            for chave, arquivo_xml, xml_zlib in self.target_connection.stream(query, params, itersize):
+                # nfe_xml_blobs (zlib); arquivo_xml só para linhas ainda não migradas
+                if xml_zlib is not None:
+                    yield chave, XmlBlobStore.decompress(xml_zlib)
+                else:
+                    yield chave, bytes(arquivo_xml) if arquivo_xml is not None else None
+
+    def download_bulk(self, keys: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        Download XMLs in bulk. Keys whose hash matches the local manifest are
+        skipped before any XML is fetched; the rest are streamed from the
+        database and written by AtomicFileWriter (one file per chave, thread
+        pool, temp file + rename) or, with output_mode "archive", packed by
+        ZipArchiveWriter into one zip per emission day or supplier.
+        """
+        config = get_etl_config('xml_downloader')
+        index = self.get_xml_index(keys)
+        hashes = dict(zip(index['chave'], index['arquivo_xml_hash']))
+        archive = config.get('output_mode', 'files') == 'archive'
+        groups = self._archive_groups(index, config.get('archive_group', 'day')) if archive else {}
+
+        not_found = set(keys) - set(hashes) if keys is not None else set()
+        for chave in not_found:
+            self.logger.warning(f"No XML binary data found for key: {chave}")
+
+        missing_xml = 0
+        with self._create_writer(config) as writer:
+            needed = writer.filter_current(hashes)
+            self.logger.info(f"{len(needed)} XMLs to write, {len(hashes) - len(needed)} unchanged")
+            if needed:
+                for chave, xml_binary in self.iter_xml_blobs(needed):
+                    if xml_binary is None:
+                        self.logger.warning(f"No XML binary data found for key: {chave}")
+                        missing_xml += 1
+                        continue
+                    if archive:
+                        writer.write(chave, xml_binary, hashes.get(chave), group=groups[chave])
+                    else:
+                        writer.write(chave, xml_binary, hashes.get(chave))
+
+        stats = writer.stats
+        return {
+            'total': len(hashes) + len(not_found),
+            'success': stats['written'],
+            'skipped': stats['skipped'],
+            'failed': stats['failed'] + missing_xml + len(not_found)
+        }
+
+    def read_archived_xml(self, chave: str) -> Optional[bytes]:
+        """
+        Read one XML from the archives by chave, without extracting the archive
+        """
+        config = get_etl_config('xml_downloader')
+        manifest_path = config.get('manifest_path', os.path.join('data', 'xml_manifest.sqlite'))
+        return ZipArchiveWriter.read(manifest_path, chave)
+
     def run_xml_download(self) -> Dict[str, int]:
         try:
             self.logger.info("Starting XML download process...")
+            if get_etl_config('xml_downloader').get('fetch_mode', 'per_key') == 'bulk':
+                stats = self.download_bulk()
+                self.logger.info(f"XML download process completed!")
+                self.logger.info(f"Statistics: {stats}")
+                self.logger.info(f"Files saved to: {self.download_folder}")
+                return stats
             pending_keys = self.get_pending_nfe_keys()
             if not pending_keys:
                 self.logger.info("No NFe keys found for download")
@@ -89,6 +216,10 @@ class XMLDownloaderService:
     def download_specific_keys(self, keys: List[str]) -> Dict[str, int]:
         try:
             self.logger.info(f"Starting XML download for {len(keys)} specific keys...")
+            if get_etl_config('xml_downloader').get('fetch_mode', 'per_key') == 'bulk':
+                stats = self.download_bulk(keys)
+                self.logger.info(f"Statistics: {stats}")
+                return stats
             success_count = 0
             failed_count = 0
             for i, chave in enumerate(keys, 1):
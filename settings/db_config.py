@@ -1,5 +1,5 @@
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -22,6 +22,14 @@ BANCO_MERCADO = {
     "port": int(os.getenv("MERCADO_PORT", "5432")),
 }
 
+# Redis (mesmas variáveis do app/worker, incluindo as do Railway)
+REDIS = {
+    "host": os.getenv("REDISHOST", os.getenv("REDIS_HOST", "localhost")),
+    "port": int(os.getenv("REDISPORT", os.getenv("REDIS_PORT", "6379"))),
+    "db": int(os.getenv("REDIS_DB", "0")),
+    "password": os.getenv("REDISPASSWORD", os.getenv("REDIS_PASSWORD")),
+}
+
 def get_connection_config(database: str = "unico") -> Dict[str, Any]:
     """
     Get database connection configuration
@@ -44,7 +52,39 @@ def get_source_config() -> Dict[str, Any]:
     """Get source database configuration (UNICO)"""
     return UNICO_DATABASE
 
+def get_source_configs() -> List[Dict[str, Any]]:
+    """
+    Source databases of every store (one Uniplus server per store)
+
+    UNICO_STORES lists the store ids (filial), e.g. "1,2,3". Each store reads
+    UNICO_<ID>_DB/USER/PASSWORD/HOST/PORT, falling back to the UNICO_* values.
+    Without UNICO_STORES there is a single source (UNICO_DATABASE, untagged).
+
+    Returns:
+        List of connection configs; multi-store configs carry a 'filial' key
+    """
+    stores = [store.strip() for store in os.getenv("UNICO_STORES", "").split(",") if store.strip()]
+    if not stores:
+        return [UNICO_DATABASE]
+
+    configs = []
+    for store in stores:
+        prefix = f"UNICO_{store}_"
+        configs.append({
+            "dbname": os.getenv(f"{prefix}DB", UNICO_DATABASE["dbname"]),
+            "user": os.getenv(f"{prefix}USER", UNICO_DATABASE["user"]),
+            "password": os.getenv(f"{prefix}PASSWORD", UNICO_DATABASE["password"]),
+            "host": os.getenv(f"{prefix}HOST", UNICO_DATABASE["host"]),
+            "port": int(os.getenv(f"{prefix}PORT", str(UNICO_DATABASE["port"]))),
+            "filial": int(store),
+        })
+    return configs
+
 # Target configuration (cloud database)  
 def get_target_config() -> Dict[str, Any]:
     """Get target database configuration (BANCO_MERCADO)"""
-    return BANCO_MERCADO
\ No newline at end of file
+    return BANCO_MERCADO
+
+def get_redis_config() -> Dict[str, Any]:
+    """Get Redis configuration (change feeds)"""
+    return REDIS